@@ -0,0 +1,240 @@
+"""
+Point-in-time allocation index: who had which vehicle on a given date.
+
+Every Vehicle_Allocation__c is a closed date interval [Start_date__c, End_date__c]
+(no end date = still allocated). Allocations are grouped per vehicle and per
+engineer, and each group gets a centered interval tree. "Who had VEH-439 on
+3 March" and "which vans did this engineer have in Q1" are then O(log n + k)
+stabbing/overlap queries, with no scan of the whole allocation history. The index
+is loaded from the replica and kept current from its change events. When a group
+changes, only that group's tree is rebuilt, lazily on its next query.
+"""
+import threading
+from typing import Dict, List, Optional, Set, Tuple
+
+from vehicle_replica import VehicleReplica, get_replica
+
+ALLOCATION_OBJECT = "Vehicle_Allocation__c"
+
+# Open ends - ISO dates compare as strings
+EARLIEST = "0000-01-01"
+LATEST = "9999-12-31"
+
+Interval = Tuple[str, str, str]  # (start, end, allocation Id)
+
+
+class IntervalTree:
+    """
+    Centered interval tree over closed intervals. Each node keeps the intervals that
+    contain its center, sorted by start and by end. Intervals entirely left or right
+    of the center go to the child subtrees. Inverted intervals are stored with their
+    dates swapped.
+    """
+
+    __slots__ = ("center", "by_start", "by_end", "left", "right")
+
+    def __init__(self, intervals: List[Interval]):
+        # An end before its start (bad data) would never leave the left side of any center
+        intervals = [(end, start, i) if end < start else (start, end, i) for start, end, i in intervals]
+        endpoints = sorted(point for start, end, _ in intervals for point in (start, end))
+        self.center = endpoints[len(endpoints) // 2]
+        here, left, right = [], [], []
+        for interval in intervals:
+            if interval[1] < self.center:
+                left.append(interval)
+            elif interval[0] > self.center:
+                right.append(interval)
+            else:
+                here.append(interval)
+        self.by_start = sorted(here)
+        self.by_end = sorted(here, key=lambda interval: interval[1], reverse=True)
+        self.left = IntervalTree(left) if left else None
+        self.right = IntervalTree(right) if right else None
+
+    def overlapping(self, low: str, high: str, found: List[str]):
+        """Append the Ids of intervals overlapping [low, high] (low == high is a point query)"""
+        node = self
+        while node is not None:
+            if high < node.center:
+                # Only intervals here that start by `high` reach into the query
+                for start, _, allocation_id in node.by_start:
+                    if start > high:
+                        break
+                    found.append(allocation_id)
+                node = node.left
+            elif low > node.center:
+                for _, end, allocation_id in node.by_end:
+                    if end < low:
+                        break
+                    found.append(allocation_id)
+                node = node.right
+            else:
+                found.extend(allocation_id for _, _, allocation_id in node.by_start)
+                if node.left is not None:
+                    node.left.overlapping(low, high, found)
+                node = node.right
+
+
+def _day(value, default: str) -> str:
+    return value[:10] if value else default
+
+
+def _related(record: dict, relationship: str, field: str = "Name"):
+    related = record.get(relationship)
+    return related.get(field) if isinstance(related, dict) else None
+
+
+def engineers(allocation: dict) -> List[Tuple[str, Optional[str]]]:
+    """(key, display name) of whoever holds the allocation: the service resource and/or internal staff"""
+    found = []
+    if allocation.get("Service_Resource__c"):
+        found.append((allocation["Service_Resource__c"], _related(allocation, "Service_Resource__r")))
+    staff = _related(allocation, "Internal_Staff__r")
+    if staff:
+        found.append((f"staff:{staff.strip().lower()}", staff))
+    return found
+
+
+class AllocationIndex:
+    """
+    allocation Id -> row, vehicle/engineer -> allocation Ids, and one lazily built
+    interval tree per vehicle/engineer
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._allocations: Dict[str, dict] = {}
+        self._groups: Dict[str, Set[str]] = {}  # "vehicle:<Id>" / "engineer:<key>" -> allocation Ids
+        self._trees: Dict[str, IntervalTree] = {}
+        # Lower-cased vehicle name / reg / van number -> vehicle Id; engineer name -> engineer keys
+        self._vehicle_aliases: Dict[str, str] = {}
+        self._engineer_aliases: Dict[str, Set[str]] = {}
+        self._replica: Optional[VehicleReplica] = None
+
+    def _group_keys(self, allocation: dict) -> List[str]:
+        keys = [f"engineer:{key}" for key, _ in engineers(allocation)]
+        if allocation.get("Vehicle__c"):
+            keys.append(f"vehicle:{allocation['Vehicle__c']}")
+        return keys
+
+    def _remove(self, allocation_id: str):
+        old = self._allocations.pop(allocation_id, None)
+        if old is None:
+            return
+        for key in self._group_keys(old):
+            group = self._groups.get(key)
+            if group is not None:
+                group.discard(allocation_id)
+                if not group:
+                    del self._groups[key]
+            self._trees.pop(key, None)
+
+    def _add(self, allocation: dict):
+        allocation_id = allocation["Id"]
+        self._allocations[allocation_id] = allocation
+        for key in self._group_keys(allocation):
+            self._groups.setdefault(key, set()).add(allocation_id)
+            self._trees.pop(key, None)
+
+        vehicle_id = allocation.get("Vehicle__c")
+        if vehicle_id:
+            for field in ("Name", "Reg_No__c", "Van_Number__c"):
+                alias = _related(allocation, "Vehicle__r", field)
+                if alias:
+                    self._vehicle_aliases[str(alias).strip().lower()] = vehicle_id
+        for key, name in engineers(allocation):
+            if name:
+                self._engineer_aliases.setdefault(name.strip().lower(), set()).add(key)
+
+    def apply(self, upserted: List[dict], deleted_ids: List[str]):
+        """Re-file changed allocations and drop deleted ones"""
+        with self._lock:
+            for allocation_id in deleted_ids:
+                self._remove(allocation_id)
+            for allocation in upserted:
+                self._remove(allocation["Id"])
+                self._add(allocation)
+
+    def _on_replica_change(self, object_name: str, upserted: list, deleted_ids: list):
+        if object_name == ALLOCATION_OBJECT:
+            self.apply(upserted, deleted_ids)
+
+    def attach(self, replica: VehicleReplica):
+        """Load the replicated allocations and follow the replica's change events from now on"""
+        replica.add_listener(self._on_replica_change)
+        with self._lock:
+            self._allocations.clear()
+            self._groups.clear()
+            self._trees.clear()
+            self._vehicle_aliases.clear()
+            self._engineer_aliases.clear()
+        self.apply(replica.records(ALLOCATION_OBJECT), [])
+        self._replica = replica
+        print(f"✅ Allocation index loaded for {len(self._allocations)} allocations")
+
+    @property
+    def ready(self) -> bool:
+        """True once loaded from the replica (callers check replica freshness via resolve_source)"""
+        return self._replica is not None
+
+    def _query(self, keys: List[str], low: str, high: str) -> List[dict]:
+        found: List[str] = []
+        with self._lock:
+            for key in keys:
+                tree = self._trees.get(key)
+                if tree is None:
+                    group = self._groups.get(key)
+                    if not group:
+                        continue
+                    tree = self._trees[key] = IntervalTree([
+                        (
+                            _day(self._allocations[i].get("Start_date__c"), EARLIEST),
+                            _day(self._allocations[i].get("End_date__c"), LATEST),
+                            i,
+                        )
+                        for i in group
+                    ])
+                tree.overlapping(low, high, found)
+            allocations = [self._allocations[i] for i in dict.fromkeys(found)]
+        allocations.sort(key=lambda a: a.get("Start_date__c") or "", reverse=True)
+        return allocations
+
+    def for_vehicle(self, identifier: str, low: str, high: str = None) -> List[dict]:
+        """
+        Allocations of one vehicle (Id, name, registration or van number) overlapping
+        [low, high] - a single date when high is omitted. Latest start first.
+        """
+        with self._lock:
+            vehicle_id = identifier if f"vehicle:{identifier}" in self._groups \
+                else self._vehicle_aliases.get(identifier.strip().lower())
+        if not vehicle_id:
+            return []
+        return self._query([f"vehicle:{vehicle_id}"], low, high or low)
+
+    def for_engineer(self, identifier: str, low: str, high: str = None) -> List[dict]:
+        """Allocations of one engineer (service resource Id or name) overlapping [low, high]"""
+        with self._lock:
+            if f"engineer:{identifier}" in self._groups:
+                keys = [identifier]
+            else:
+                keys = list(self._engineer_aliases.get(identifier.strip().lower(), ()))
+        return self._query([f"engineer:{key}" for key in keys], low, high or low)
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_allocation_index() -> AllocationIndex:
+    """Return the process-wide allocation index"""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = AllocationIndex()
+    return _index
+
+
+def start_allocation_index():
+    """Attach the index to the shared replica (called at app startup)"""
+    get_allocation_index().attach(get_replica())
@@ -0,0 +1,106 @@
+"""
+Salesforce API usage tracking and adaptive refresh intervals.
+
+Every REST response carries `Sforce-Limit-Info: api-usage=used/limit` (the org's
+rolling 24h total). The latest reading is kept here. Once usage passes
+API_USAGE_SOFT_LIMIT, stretch() lengthens cache TTLs and background refresh
+intervals, rising linearly to API_USAGE_MAX_STRETCH at API_USAGE_HARD_LIMIT.
+Near the limit the app then serves slightly staler data instead of spending its
+last calls and failing.
+"""
+import os
+import re
+import threading
+import time
+from typing import Optional
+
+_USAGE_RE = re.compile(r"api-usage=(\d+)/(\d+)")
+
+
+class ApiUsageTracker:
+    """
+    Latest org-wide API usage reading and the stretch factor derived from it
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.used: Optional[int] = None
+        self.limit: Optional[int] = None
+        self.observed_at: Optional[float] = None
+        self.soft_limit = float(os.getenv("API_USAGE_SOFT_LIMIT", "0.5"))
+        self.hard_limit = float(os.getenv("API_USAGE_HARD_LIMIT", "0.9"))
+        self.max_stretch = float(os.getenv("API_USAGE_MAX_STRETCH", "10"))
+        self._reported_factor = 1.0
+
+    def observe(self, used: int, limit: int):
+        """Record a reading (from simple_salesforce's api_usage or a parsed header)"""
+        if not limit:
+            return
+        with self._lock:
+            self.used, self.limit, self.observed_at = int(used), int(limit), time.time()
+        factor = self.factor()
+        if abs(factor - self._reported_factor) >= 0.5 or (factor == 1.0) != (self._reported_factor == 1.0):
+            self._reported_factor = factor
+            if factor > 1.0:
+                print(f"⚠️ Salesforce API usage at {self.ratio:.0%} ({used}/{limit}) - stretching refresh intervals x{factor:.1f}")
+            else:
+                print(f"✅ Salesforce API usage back to {self.ratio:.0%} - normal refresh intervals")
+
+    def observe_header(self, value: Optional[str]):
+        """Record a raw Sforce-Limit-Info header value"""
+        match = _USAGE_RE.search(value or "")
+        if match:
+            self.observe(int(match.group(1)), int(match.group(2)))
+
+    def observe_client(self, client):
+        """Record the reading simple_salesforce parsed from its last response (client.api_usage)"""
+        api_usage = getattr(client, "api_usage", None)
+        usage = api_usage.get("api-usage") if isinstance(api_usage, dict) else None
+        if usage is not None:
+            self.observe(usage.used, usage.total)
+
+    @property
+    def ratio(self) -> float:
+        """Fraction of the daily limit used (0 before any reading)"""
+        used, limit = self.used, self.limit
+        return used / limit if used is not None and limit else 0.0
+
+    def factor(self) -> float:
+        """1 below the soft limit, rising linearly to max_stretch at the hard limit"""
+        ratio = self.ratio
+        if ratio <= self.soft_limit:
+            return 1.0
+        if ratio >= self.hard_limit:
+            return self.max_stretch
+        progress = (ratio - self.soft_limit) / (self.hard_limit - self.soft_limit)
+        return round(1.0 + progress * (self.max_stretch - 1.0), 2)
+
+    def stretch(self, seconds: float) -> float:
+        """A TTL or refresh interval adjusted for current API usage"""
+        return seconds * self.factor()
+
+    def status(self) -> dict:
+        return {
+            "used": self.used,
+            "limit": self.limit,
+            "ratio": round(self.ratio, 4),
+            "observed_at": self.observed_at,
+            "stretch_factor": self.factor(),
+            "soft_limit": self.soft_limit,
+            "hard_limit": self.hard_limit,
+            "max_stretch": self.max_stretch,
+        }
+
+
+_tracker = None
+_tracker_lock = threading.Lock()
+
+
+def get_api_usage() -> ApiUsageTracker:
+    """Return the process-wide API usage tracker"""
+    global _tracker
+    if _tracker is None:
+        with _tracker_lock:
+            if _tracker is None:
+                _tracker = ApiUsageTracker()
+    return _tracker
@@ -1,4 +1,4 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import Depends, FastAPI, HTTPException, Request
 import pandas as pd
 from fastapi.middleware.cors import CORSMiddleware
 import sys
@@ -18,13 +18,23 @@ except ImportError:
 # Add backend directory to path
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
-from routes.dashboard import router as dashboard_router
+from routes.dashboard import router as dashboard_router, dashboard_snapshots
 from routes.webfleet import router as webfleet_router
 from routes.vehicles import router as vehicles_router
 from routes.assets import router as assets_router
 from routes.ai import router as ai_router
 from routes.chat import router as chat_router
 from routes.auth import router as auth_router
+from salesforce_service import get_connection_manager
+from async_salesforce_service import close_async_http
+from vehicle_replica import get_replica
+from cost_rollup import start_cost_rollup
+from due_index import start_due_index
+from allocation_index import start_allocation_index
+from search_index import start_search_index
+from driver_history import format_timeline, parse_previous_drivers, start_driver_timelines
+from conditional_get import ConditionalGetMiddleware, check_validators
+from http_utils import StreamAwareGZipMiddleware
 
 # Initialize FastAPI app
 app = FastAPI(
@@ -33,6 +43,11 @@ app = FastAPI(
     version="1.0.0"
 )
 
+# ETag / Last-Modified / 304 on read endpoints, then gzip for large bodies (not event streams).
+# Added before CORS so CORS stays outermost and decorates 304s too.
+app.add_middleware(ConditionalGetMiddleware)
+app.add_middleware(StreamAwareGZipMiddleware, minimum_size=1000)
+
 # Add CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -52,14 +67,51 @@ app.include_router(chat_router)
 app.include_router(auth_router)
 
 
+@app.on_event("startup")
+def warm_up_salesforce():
+    """Log in to Salesforce once at startup so the first dashboard request doesn't pay for it"""
+    get_connection_manager().warm_up()
+
+
+@app.on_event("startup")
+def start_vehicle_replica():
+    """Keep the local Vehicle__c / allocation / cost replica (and the rollup and indexes fed by it) in sync in the background"""
+    start_cost_rollup()
+    start_due_index()
+    start_allocation_index()
+    start_search_index()
+    start_driver_timelines()
+    get_replica().start()
+
+
+@app.on_event("startup")
+async def start_dashboard_snapshots():
+    """Rebuild the dashboard snapshot in the background every DASHBOARD_SNAPSHOT_INTERVAL seconds"""
+    dashboard_snapshots.start()
+
+
+@app.on_event("shutdown")
+def stop_vehicle_replica():
+    get_replica().stop()
+
+
+@app.on_event("shutdown")
+async def close_salesforce_http():
+    dashboard_snapshots.stop()
+    await close_async_http()
+
+
 # ========================================
 # 🤖 GROK AI MODEL FOR ANALYSIS
 # ========================================
 
-def get_grok_analysis(description: str, context: str = "vehicle") -> str:
+def get_grok_analysis(description, context: str = "vehicle") -> str:
     """
     Use Grok model to provide high-level AI analysis
     Supports vehicle descriptions, driver history, maintenance notes, etc.
+    For "driver_history", pass the vehicle's cached timeline (driver_history.get_driver_timelines);
+    raw Previous_Drivers__c text is still accepted and parsed. Either is sent as the compact
+    "driver: from to to" form.
     """
     if not GROQ_AVAILABLE:
         return "AI analysis unavailable - Groq library not installed. Run: pip install groq"
@@ -81,6 +133,9 @@ def get_grok_analysis(description: str, context: str = "vehicle") -> str:
 Keep it concise (2-3 sentences) and focus on key maintenance needs, issues, or positive aspects."""
         
         elif context == "driver_history":
+            timeline = description if isinstance(description, list) else parse_previous_drivers(description)
+            if timeline:
+                description = format_timeline(timeline)
             prompt = f"""Analyze this driver history and provide key insights about the driver's profile:
             
 "{description}"
@@ -252,7 +307,15 @@ def get_score_class(score):
         return "poor"
 
 
-@app.get("/api/drivers/excel")
+def drivers_file_validators(request: Request):
+    """ETag / Last-Modified from the drivers file itself - an unchanged file is a 304 without re-parsing it"""
+    file_path = find_drivers_file()
+    if file_path:
+        stat = os.stat(file_path)
+        check_validators(request, (file_path, stat.st_mtime_ns, stat.st_size), stat.st_mtime)
+
+
+@app.get("/api/drivers/excel", dependencies=[Depends(drivers_file_validators)])
 def get_drivers_from_excel():
     """
     Get CLEAN driver data with aggressive filtering
@@ -0,0 +1,306 @@
+"""
+Asyncio-native Salesforce data access for the FastAPI routes.
+
+Uses the same login as SalesforceConnectionManager, but sends requests through one
+pooled httpx.AsyncClient. A request waiting on Salesforce therefore holds a
+connection slot rather than a worker thread. SF_POOL_SIZE caps how many calls are
+in flight at once; further callers wait for a free connection.
+"""
+import asyncio
+import os
+import time
+from typing import Dict, List, Optional
+from urllib.parse import quote
+
+import httpx
+from simple_salesforce.util import exception_handler
+
+from record_set import RecordSet, RecordSetBuilder
+from salesforce_service import (
+    COMPOSITE_BATCH_LIMIT,
+    SalesforceUnavailable,
+    _describe_cache,
+    batch_error,
+    batch_key,
+    batch_request_body,
+    clean_record,
+    copy_batch,
+    get_connection_manager,
+)
+from single_flight import AsyncSingleFlight, copy_records, normalize_query
+from api_usage import get_api_usage
+
+_single_flight = AsyncSingleFlight()
+
+_http: Optional[httpx.AsyncClient] = None
+_http_loop = None
+
+
+def get_async_http() -> httpx.AsyncClient:
+    """Shared AsyncClient for the running event loop (re-created if the loop changed)"""
+    global _http, _http_loop
+    loop = asyncio.get_running_loop()
+    if _http is None or _http_loop is not loop:
+        pool_size = int(os.getenv("SF_POOL_SIZE", "20"))
+        _http = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+            # No pool timeout: when every connection is busy, callers queue for the next free one
+            timeout=httpx.Timeout(float(os.getenv("SF_HTTP_TIMEOUT", "120")), pool=None),
+        )
+        _http_loop = loop
+    return _http
+
+
+async def close_async_http():
+    """Close the shared AsyncClient (called at app shutdown)"""
+    global _http, _http_loop
+    if _http is not None:
+        await _http.aclose()
+    _http = None
+    _http_loop = None
+
+
+class AsyncSalesforceService:
+    """
+    Async counterpart of SalesforceService - same query helpers, awaitable
+    """
+
+    def __init__(self):
+        self._connection = get_connection_manager()
+
+    @property
+    def mock_mode(self) -> bool:
+        return self._connection.mock_mode
+
+    async def _client(self):
+        """Authenticated simple_salesforce client; a (blocking) login runs in a worker thread"""
+        if self._connection.needs_login:
+            return await asyncio.to_thread(self._connection.get)
+        return self._connection.client
+
+    async def _request(self, method: str, path: str, **kwargs):
+        """
+        REST call relative to /services/data/vXX.X/ (or an absolute /services/... path such as
+        nextRecordsUrl). Re-logs in once on an expired session. Errors Salesforce returns raise
+        SalesforceError; no session or a network failure raises SalesforceUnavailable.
+        """
+        client = await self._client()
+        if client is None:
+            raise SalesforceUnavailable("Salesforce is not connected (mock data mode)")
+
+        async def send(client):
+            if path.startswith("/"):
+                url = f"https://{client.sf_instance}{path}"
+            else:
+                url = client.base_url + path
+            response = await get_async_http().request(method, url, headers=client.headers, **kwargs)
+            get_api_usage().observe_header(response.headers.get("Sforce-Limit-Info"))
+            return response
+
+        try:
+            response = await send(client)
+            if response.status_code == 401:
+                client = await asyncio.to_thread(self._connection.refresh, client)
+                if client is None:
+                    raise SalesforceUnavailable("Salesforce session could not be refreshed")
+                response = await send(client)
+        except httpx.TransportError as e:
+            raise SalesforceUnavailable(f"Salesforce request failed: {e}") from e
+        if response.status_code >= 300:
+            exception_handler(response, path.split("?")[0])
+        return response.json() if response.content else None
+
+    # ========================================
+    # QUERIES
+    # ========================================
+
+    async def _iter_raw_pages(self, query: str):
+        """Yield Salesforce's raw record pages, following nextRecordsUrl"""
+        print(f"🔍 Executing: {query[:150]}...")
+        result = await self._request("GET", f"query/?q={quote(' '.join(query.split()))}")
+        while True:
+            yield result.get("records", [])
+            next_url = result.get("nextRecordsUrl")
+            if result.get("done", True) or not next_url:
+                break
+            result = await self._request("GET", next_url)
+
+    async def iter_soql_pages(self, query: str):
+        """Yield cleaned records one Salesforce page at a time - errors are raised to the caller"""
+        async for page in self._iter_raw_pages(query):
+            yield [clean_record(r) for r in page]
+
+    async def iter_soql(self, query: str):
+        """Yield cleaned records one by one across all pages"""
+        async for page in self.iter_soql_pages(query):
+            for record in page:
+                yield record
+
+    async def query_all(self, query: str) -> dict:
+        """Raw query_all shape ({"totalSize", "done", "records"}) with every page fetched"""
+        records = []
+        async for page in self._iter_raw_pages(query):
+            records.extend(page)
+        return {"totalSize": len(records), "done": True, "records": records}
+
+    async def query_records(self, query: str) -> RecordSet:
+        """
+        Run a query into a compact RecordSet. Each raw page is folded into columns/tuples
+        as it arrives and then dropped. Errors are raised.
+        """
+        builder = RecordSetBuilder()
+        async for page in self._iter_raw_pages(query):
+            builder.add(page)
+        return builder.build()
+
+    async def execute_soql(self, query: str) -> list:
+        """
+        Execute SOQL query and return ALL results with proper pagination.
+        Concurrent callers running the same query share one upstream call.
+        """
+        async def run():
+            try:
+                cleaned = [record async for record in self.iter_soql(query)]
+                print(f"✅ Returned {len(cleaned)} records")
+                return cleaned
+
+            except Exception as e:
+                print(f"❌ SOQL Error: {e}")
+                import traceback
+                traceback.print_exc()
+                return []
+
+        return await _single_flight.do(f"soql:{normalize_query(query)}", run, copy=copy_records)
+
+    # ========================================
+    # DESCRIBE CACHE (shared with SalesforceService)
+    # ========================================
+
+    async def describe_fields(self, sobject: str) -> Optional[Dict[str, dict]]:
+        """Field describes for sobject keyed by API name, cached for DESCRIBE_CACHE_TTL seconds"""
+        ttl = get_api_usage().stretch(float(os.getenv("DESCRIBE_CACHE_TTL", "3600")))
+        cached = _describe_cache.get(sobject)
+        if cached and time.monotonic() - cached[0] < ttl:
+            return cached[1]
+        # Concurrent misses for the same sobject share one describe call, like the sync path
+        return await _single_flight.do(f"describe:{sobject}", lambda: self._describe(sobject, ttl))
+
+    async def _describe(self, sobject: str, ttl: float) -> Optional[Dict[str, dict]]:
+        try:
+            print(f"📖 Describing {sobject}...")
+            described = await self._request("GET", f"sobjects/{sobject}/describe")
+        except Exception as e:
+            print(f"⚠️ Could not describe {sobject}: {e}")
+            _describe_cache[sobject] = (time.monotonic() - ttl + 60, None)
+            return None
+        fields = {f["name"]: f for f in described.get("fields", [])}
+        _describe_cache[sobject] = (time.monotonic(), fields)
+        return fields
+
+    async def has_field(self, sobject: str, path: str) -> bool:
+        """True if path exists on sobject - follows relationship paths like 'Vehicle__r.Van_Number__c'"""
+        fields = await self.describe_fields(sobject)
+        if fields is None:
+            return True
+        name, _, rest = path.partition(".")
+        if not rest:
+            return name in fields
+        relationship = next((f for f in fields.values() if f.get("relationshipName") == name), None)
+        if relationship is None or not relationship.get("referenceTo"):
+            return False
+        return await self.has_field(relationship["referenceTo"][0], rest)
+
+    async def existing_fields(self, sobject: str, candidates: List[str]) -> List[str]:
+        """The subset of candidates that exist on sobject (order kept)"""
+        return [f for f in candidates if await self.has_field(sobject, f)]
+
+    async def first_existing_field(self, sobject: str, candidates: List[str]) -> Optional[str]:
+        """The first of candidates that exists on sobject"""
+        for field in candidates:
+            if await self.has_field(sobject, field):
+                return field
+        return None
+
+    # ========================================
+    # COMPOSITE BATCH
+    # ========================================
+
+    async def execute_batch(self, queries: Dict[str, str]) -> Dict[str, dict]:
+        """
+        Run independent SOQL queries through ONE Composite Batch request (per 25 queries).
+        Same result shape as SalesforceService.execute_batch; concurrent identical batches share one call.
+        """
+        return await _single_flight.do(batch_key(queries), lambda: self._execute_batch(queries), copy=copy_batch)
+
+    async def _execute_batch(self, queries: Dict[str, str]) -> Dict[str, dict]:
+        names = list(queries)
+        results = {}
+        for start in range(0, len(names), COMPOSITE_BATCH_LIMIT):
+            chunk = names[start:start + COMPOSITE_BATCH_LIMIT]
+            print(f"📦 Batching {len(chunk)} queries: {', '.join(chunk)}")
+            client = await self._client()
+            response = await self._request(
+                "POST", "composite/batch",
+                json=batch_request_body(getattr(client, "sf_version", None), queries, chunk),
+            )
+            for name, sub in zip(chunk, response.get("results", [])):
+                error = batch_error(sub)
+                if error:
+                    print(f"❌ Batched query '{name}' failed: {error}")
+                    results[name] = {"totalSize": 0, "records": [], "error": error}
+                    continue
+                payload = sub["result"]
+                records = [clean_record(r) for r in payload.get("records", [])]
+                next_url = payload.get("nextRecordsUrl")
+                while not payload.get("done", True) and next_url:
+                    payload = await self._request("GET", next_url)
+                    records.extend(clean_record(r) for r in payload.get("records", []))
+                    next_url = payload.get("nextRecordsUrl")
+                results[name] = {"totalSize": sub["result"].get("totalSize", len(records)), "records": records}
+        return results
+
+    # ========================================
+    # AGGREGATE QUERIES
+    # ========================================
+
+    async def aggregate(self, query: str) -> List[dict]:
+        """Run an aggregate SOQL query (GROUP BY / COUNT() / SUM()) and return its cleaned rows"""
+        print(f"🔍 Aggregating: {query[:150]}...")
+        return [record async for record in self.iter_soql(query)]
+
+    async def count(self, sobject: str, where: str = None) -> int:
+        """SELECT COUNT() - only the total comes back, no rows"""
+        query = f"SELECT COUNT() FROM {sobject}"
+        if where:
+            query += f" WHERE {where}"
+        print(f"🔍 Counting: {query[:150]}...")
+        result = await self._request("GET", f"query/?q={quote(query)}")
+        return int(result.get("totalSize", 0))
+
+    async def count_by(self, sobject: str, field: str, where: str = None) -> Dict[Optional[str], int]:
+        """Row count per distinct value of field (null values are grouped under None)"""
+        query = f"SELECT {field}, COUNT(Id) cnt FROM {sobject}"
+        if where:
+            query += f" WHERE {where}"
+        query += f" GROUP BY {field}"
+        return {row.get(field): int(row.get("cnt") or 0) for row in await self.aggregate(query)}
+
+    async def sum_by(self, sobject: str, field: str, value_field: str, where: str = None) -> Dict[Optional[str], float]:
+        """SUM(value_field) per distinct value of field"""
+        query = f"SELECT {field}, SUM({value_field}) total FROM {sobject}"
+        if where:
+            query += f" WHERE {where}"
+        query += f" GROUP BY {field}"
+        return {row.get(field): float(row.get("total") or 0) for row in await self.aggregate(query)}
+
+    # ========================================
+    # WRITES
+    # ========================================
+
+    async def create(self, sobject: str, data: dict) -> dict:
+        """Insert one record; returns Salesforce's {"id", "success", "errors"}"""
+        return await self._request("POST", f"sobjects/{sobject}/", json=data)
+
+    async def update(self, sobject: str, record_id: str, data: dict):
+        """Update fields of one record"""
+        await self._request("PATCH", f"sobjects/{sobject}/{record_id}", json=data)
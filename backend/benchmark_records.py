@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Benchmark: per-record dicts vs compact RecordSet for fleet-wide SOQL results.
+Builds synthetic raw Salesforce records (no connection needed) and measures the
+peak memory and time of cleaning, reshaping and serializing each way.
+
+    python benchmark_records.py
+"""
+import gc
+import json
+import sys
+import os
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from record_set import RecordSet
+from salesforce_service import clean_record
+from routes.vehicles import VEHICLE_ROW_COLUMNS, _to_vehicle_row
+
+
+def make_raw_records(n: int) -> list:
+    """Raw query_all-style records for the /api/vehicles/list query (attributes included)"""
+    return [
+        {
+            "attributes": {"type": "Vehicle__c", "url": f"/services/data/v59.0/sobjects/Vehicle__c/a0X{i:015d}"},
+            "Id": f"a0X{i:015d}",
+            "Name": f"VEH-{i:05d}",
+            "Van_Number__c": str(i),
+            "Reg_No__c": f"AB{i % 100:02d} CDE",
+            "Tracking_Number__c": f"TRK{i:07d}",
+            "Vehicle_Type__c": "Van" if i % 3 else "Tanker",
+            "Description__c": "Long wheelbase, roof rack",
+            "Status__c": ("Allocated", "Spare", "Garage", "Reserved")[i % 4],
+            "CreatedDate": "2024-01-15T10:20:30.000+0000",
+        }
+        for i in range(n)
+    ]
+
+
+def old_path(raw: list) -> str:
+    cleaned = [clean_record(r) for r in raw]            # execute_soql
+    vehicles = [_to_vehicle_row(r) for r in cleaned]    # route reshaping
+    return json.dumps({"total": len(vehicles), "vehicles": vehicles})
+
+
+def record_set_path(raw: list) -> str:
+    rows = RecordSet.from_records(raw).project(VEHICLE_ROW_COLUMNS)
+    return json.dumps({"total": len(rows)})[:-1] + ', "vehicles": ' + rows.to_json() + "}"
+
+
+def measure(fn, raw):
+    """(seconds, peak traced bytes, output) - timed without tracemalloc, which slows Python code"""
+    gc.collect()
+    started = time.perf_counter()
+    body = fn(raw)
+    elapsed = time.perf_counter() - started
+    del body
+    gc.collect()
+    tracemalloc.start()
+    body = fn(raw)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak, body
+
+
+def main():
+    print("📊 SOQL result representation benchmark")
+    print(f"{'rows':>8} | {'path':<10} | {'time (s)':>9} | {'peak MB':>8}")
+    print("-" * 46)
+    for n in (10_000, 100_000):
+        raw = make_raw_records(n)
+        results = {}
+        for name, fn in (("dicts", old_path), ("RecordSet", record_set_path)):
+            elapsed, peak, body = measure(fn, raw)
+            results[name] = (elapsed, peak, body)
+            print(f"{n:>8} | {name:<10} | {elapsed:>9.3f} | {peak / 1e6:>8.1f}")
+        assert json.loads(results["dicts"][2]) == json.loads(results["RecordSet"][2])
+        saved = 1 - results["RecordSet"][1] / results["dicts"][1]
+        print(f"{'':>8}   ✅ identical output, {saved:.0%} less peak memory")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+"""
+Content-addressed local store for uploaded asset photos.
+
+A photo is copied chunk by chunk from the multipart upload into a temp file,
+hashing as it goes. It is then renamed to blobs/<aa>/<bb>/<sha256>, so the
+same photo uploaded twice is stored once. Routes pass around its reference
+("sha256:<hex>") instead of base64 text in JSON bodies. Memory stays at one chunk
+per upload whatever the photo size, and the bytes travel once as raw binary.
+"""
+import hashlib
+import os
+import re
+import tempfile
+import threading
+from typing import BinaryIO, Optional
+
+from starlette.concurrency import run_in_threadpool
+
+CHUNK_SIZE = 64 * 1024
+_REF_RE = re.compile(r"^sha256:([0-9a-f]{64})$")
+
+# Leading bytes -> content type, for serving blobs and for vision API media types
+_SIGNATURES = [
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+]
+
+
+# What the vision API accepts - anything else is refused at upload
+IMAGE_TYPES = {"image/jpeg", "image/png", "image/gif", "image/webp"}
+
+
+def sniff_content_type(head: bytes) -> str:
+    for signature, content_type in _SIGNATURES:
+        if head.startswith(signature):
+            return content_type
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    return "application/octet-stream"
+
+
+class BlobTooLarge(Exception):
+    pass
+
+
+class NotAnImage(Exception):
+    pass
+
+
+def _check_image(head: bytes):
+    if sniff_content_type(head) not in IMAGE_TYPES:
+        raise NotAnImage("Only JPEG, PNG, GIF or WebP images are accepted")
+
+
+class BlobStore:
+    """
+    sha256 -> file under root, written once and never modified
+    """
+
+    def __init__(self, root: str = None, max_bytes: int = None):
+        self.root = root or os.getenv("BLOB_STORE_PATH") or os.path.join(
+            os.path.dirname(os.path.abspath(__file__)), "data", "blobs"
+        )
+        self.max_bytes = max_bytes or int(os.getenv("BLOB_MAX_BYTES", str(20 * 1024 * 1024)))
+        os.makedirs(self.root, exist_ok=True)
+
+    def path(self, ref: str) -> Optional[str]:
+        """File path of a reference, or None if it is malformed or not stored"""
+        match = _REF_RE.match(ref or "")
+        if not match:
+            return None
+        digest = match.group(1)
+        path = os.path.join(self.root, digest[:2], digest[2:4], digest)
+        return path if os.path.exists(path) else None
+
+    def content_type(self, ref: str) -> Optional[str]:
+        path = self.path(ref)
+        if path is None:
+            return None
+        with open(path, "rb") as f:
+            return sniff_content_type(f.read(16))
+
+    async def save_upload(self, upload) -> dict:
+        """save_file for an UploadFile, run in the threadpool so hashing and disk writes don't block the event loop"""
+        return await run_in_threadpool(self.save_file, upload.file)
+
+    def save_file(self, source: BinaryIO) -> dict:
+        """
+        Copy a file object into the store in CHUNK_SIZE pieces.
+        Returns {image_ref, size, content_type, deduplicated}; raises BlobTooLarge past max_bytes
+        and NotAnImage when the first bytes aren't a supported image (declared type is not trusted).
+        """
+        digest = hashlib.sha256()
+        size = 0
+        head = b""
+        fd, temp_path = tempfile.mkstemp(dir=self.root, prefix=".upload-")
+        try:
+            with os.fdopen(fd, "wb") as out:
+                while True:
+                    chunk = source.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    size += len(chunk)
+                    if size > self.max_bytes:
+                        raise BlobTooLarge(f"Upload exceeds {self.max_bytes} bytes")
+                    if len(head) < 16:
+                        head += chunk[:16 - len(head)]
+                        if len(head) >= 16:
+                            _check_image(head)
+                    digest.update(chunk)
+                    out.write(chunk)
+            if len(head) < 16:
+                _check_image(head)
+            return self._commit(temp_path, digest.hexdigest(), size, head)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def save_bytes(self, data: bytes) -> dict:
+        """Store an in-memory payload (legacy base64 image_data bodies)"""
+        if len(data) > self.max_bytes:
+            raise BlobTooLarge(f"Upload exceeds {self.max_bytes} bytes")
+        _check_image(data[:16])
+        fd, temp_path = tempfile.mkstemp(dir=self.root, prefix=".upload-")
+        try:
+            with os.fdopen(fd, "wb") as out:
+                out.write(data)
+            return self._commit(temp_path, hashlib.sha256(data).hexdigest(), len(data), data[:16])
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def _commit(self, temp_path: str, digest: str, size: int, head: bytes) -> dict:
+        ref = f"sha256:{digest}"
+        deduplicated = self.path(ref) is not None
+        if not deduplicated:
+            directory = os.path.join(self.root, digest[:2], digest[2:4])
+            os.makedirs(directory, exist_ok=True)
+            # Atomic: concurrent uploads of the same photo both end with one complete file
+            os.replace(temp_path, os.path.join(directory, digest))
+        print(f"{'♻️ Reused' if deduplicated else '💾 Stored'} blob {ref[:19]}... ({size} bytes)")
+        return {"image_ref": ref, "size": size, "content_type": sniff_content_type(head), "deduplicated": deduplicated}
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_blob_store() -> BlobStore:
+    """Return the process-wide blob store"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = BlobStore()
+    return _store
@@ -0,0 +1,151 @@
+"""
+Conditional GET (ETag / Last-Modified / 304) for the read endpoints.
+
+Two kinds of validators:
+- Data-version ETags: reads answered from local state (the replica and what it feeds,
+  the dashboard snapshot, the drivers file) stamp the request with the version of that
+  state BEFORE anything is computed. A matching If-None-Match / If-Modified-Since is
+  answered 304 by the dependency, so the handler never runs.
+- Content-hash ETags: every other JSON GET under /api is hashed once it is built, so an
+  unchanged payload goes back as a bodiless 304 (saves the transfer, not the work).
+"""
+import hashlib
+import os
+from datetime import date
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Optional
+
+from fastapi import HTTPException, Request
+from starlette.datastructures import Headers, MutableHeaders
+
+from vehicle_replica import resolve_source
+
+# Versions restart at 0 with the process - the nonce keeps old ETags from matching new data
+_BOOT = os.urandom(8).hex()
+
+
+def make_etag(payload: bytes) -> str:
+    # Weak: the same entity may go out gzipped or not
+    return 'W/"' + hashlib.blake2b(payload, digest_size=12).hexdigest() + '"'
+
+
+def validator_headers(etag: str, last_modified: Optional[float] = None) -> dict:
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if last_modified:
+        headers["Last-Modified"] = formatdate(last_modified, usegmt=True)
+    return headers
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag[2:] if etag.startswith("W/") else etag
+    candidates = (tag.strip() for tag in if_none_match.split(","))
+    return any((tag[2:] if tag.startswith("W/") else tag) == opaque for tag in candidates)
+
+
+def is_not_modified(request_headers, etag: str, last_modified: Optional[float] = None) -> bool:
+    """If-None-Match wins when present; If-Modified-Since is only consulted without it"""
+    if_none_match = request_headers.get("if-none-match")
+    if if_none_match:
+        return _etag_matches(if_none_match, etag)
+    if_modified_since = request_headers.get("if-modified-since")
+    if if_modified_since and last_modified:
+        try:
+            return int(last_modified) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def check_validators(request: Request, version, last_modified: Optional[float] = None):
+    """
+    Stamp the request with a data-version ETag (added to the 200 by ConditionalGetMiddleware)
+    and raise a 304 right away if the client already has this version.
+    """
+    url = request.url
+    etag = make_etag(repr((_BOOT, url.path, url.query, version)).encode())
+    request.state.validators = (etag, last_modified)
+    if is_not_modified(request.headers, etag, last_modified):
+        raise HTTPException(status_code=304, headers=validator_headers(etag, last_modified))
+
+
+def check_replica_validators(request: Request, source: str = "auto", extra=None, last_modified: float = None):
+    """
+    Data-version validators for a read served from the replica (or the cost rollup / due index it feeds).
+    Skipped when `source` would go to Salesforce - those responses fall back to the content hash.
+    Due lists depend on today's date, so the date is part of the version.
+    """
+    replica = resolve_source(source)
+    if replica is None:
+        return
+    check_validators(
+        request,
+        (replica.version, date.today().isoformat(), extra),
+        max(replica.changed_at, last_modified or 0),
+    )
+
+
+def replica_validators(request: Request, source: str = "auto"):
+    """Route dependency: see check_replica_validators"""
+    check_replica_validators(request, source)
+
+
+class ConditionalGetMiddleware:
+    """
+    Adds ETag / Last-Modified / Cache-Control to successful GETs under `prefix`:
+    the data-version validators a dependency stamped on the request, or else a hash of
+    the JSON body - answered with a 304 when it matches If-None-Match.
+    Streams and files pass through untouched.
+    """
+
+    def __init__(self, app, prefix: str = "/api/"):
+        self.app = app
+        self.prefix = prefix
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "GET" or not scope["path"].startswith(self.prefix):
+            await self.app(scope, receive, send)
+            return
+
+        held = {}
+        chunks = []
+
+        async def send_with_validators(message):
+            if message["type"] == "http.response.start":
+                headers = MutableHeaders(scope=message)
+                if message["status"] != 200 or "etag" in headers:
+                    await send(message)
+                    return
+                validators = scope.get("state", {}).get("validators")
+                if validators:
+                    headers.update(validator_headers(*validators))
+                    await send(message)
+                elif headers.get("content-type", "").startswith("application/json"):
+                    held["start"] = message
+                else:
+                    await send(message)
+                return
+
+            if message["type"] != "http.response.body" or "start" not in held:
+                await send(message)
+                return
+
+            chunks.append(message.get("body", b""))
+            if message.get("more_body", False):
+                return
+            body = b"".join(chunks)
+            start = held.pop("start")
+            etag = make_etag(body)
+            headers = MutableHeaders(scope=start)
+            headers.update(validator_headers(etag))
+            if is_not_modified(Headers(scope=scope), etag):
+                del headers["content-length"]
+                del headers["content-type"]
+                await send({**start, "status": 304})
+                await send({"type": "http.response.body", "body": b""})
+                return
+            await send(start)
+            await send({"type": "http.response.body", "body": body})
+
+        await self.app(scope, receive, send_with_validators)
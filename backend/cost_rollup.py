@@ -0,0 +1,120 @@
+"""
+Per-vehicle cost rollup (total cost and service/maintenance cost), kept up to date
+from the replica's Vehicle_Cost__c change events.
+
+Each cost row's contribution is remembered, so an edited or deleted cost is
+subtracted exactly. Nothing is re-summed per request: vehicles-by-status attaches
+costs with a dictionary lookup per vehicle.
+"""
+import threading
+from typing import Dict, Iterable, Optional, Tuple
+
+from vehicle_replica import VehicleReplica, get_replica
+
+COST_OBJECT = "Vehicle_Cost__c"
+
+
+def is_maintenance_cost(cost_type: Optional[str]) -> bool:
+    """Same rule as the SOQL filter: Type__c LIKE '%Service%' OR LIKE '%Maint%' (case-insensitive)"""
+    cost_type = (cost_type or "").lower()
+    return "service" in cost_type or "maint" in cost_type
+
+
+class CostRollup:
+    """
+    vehicle Id -> [total cost, maintenance cost], maintained incrementally
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._totals: Dict[str, list] = {}
+        # cost Id -> (vehicle Id, value, is maintenance) - what that row currently adds
+        self._contributions: Dict[str, Tuple[str, float, bool]] = {}
+        self._replica: Optional[VehicleReplica] = None
+
+    def _remove(self, cost_id: str):
+        previous = self._contributions.pop(cost_id, None)
+        if previous is None:
+            return
+        vehicle_id, value, maintenance = previous
+        totals = self._totals[vehicle_id]
+        totals[0] -= value
+        if maintenance:
+            totals[1] -= value
+
+    def _add(self, cost: dict):
+        vehicle_id = cost.get("Vehicle__c")
+        if not vehicle_id:
+            return
+        value = float(cost.get("Payment_value__c") or 0)
+        maintenance = is_maintenance_cost(cost.get("Type__c"))
+        self._contributions[cost["Id"]] = (vehicle_id, value, maintenance)
+        totals = self._totals.setdefault(vehicle_id, [0.0, 0.0])
+        totals[0] += value
+        if maintenance:
+            totals[1] += value
+
+    def apply(self, upserted: Iterable[dict], deleted_ids: Iterable[str]):
+        """Fold changed/removed cost rows into the totals"""
+        with self._lock:
+            for cost_id in deleted_ids:
+                self._remove(cost_id)
+            for cost in upserted:
+                self._remove(cost["Id"])
+                self._add(cost)
+
+    def _on_replica_change(self, object_name: str, upserted: list, deleted_ids: list):
+        if object_name == COST_OBJECT:
+            self.apply(upserted, deleted_ids)
+
+    def attach(self, replica: VehicleReplica):
+        """Load the replicated cost rows and follow the replica's change events from now on"""
+        replica.add_listener(self._on_replica_change)
+        with self._lock:
+            self._totals.clear()
+            self._contributions.clear()
+        # Events arriving during the load re-apply rows idempotently (upsert replaces a contribution)
+        self.apply(replica.records(COST_OBJECT), [])
+        self._replica = replica
+        print(f"✅ Cost rollup loaded for {len(self._totals)} vehicles")
+
+    @property
+    def ready(self) -> bool:
+        """
+        True while attached to a replica that is fresh enough for source=auto reads
+        (REPLICA_MAX_LAG_SECONDS) - a stale replica's costs must not be joined onto live rows
+        """
+        return self._replica is not None and self._replica.is_fresh()
+
+    def costs(self, vehicle_id: str) -> Tuple[float, float]:
+        """(total cost, maintenance cost) for one vehicle"""
+        totals = self._totals.get(vehicle_id)
+        return (totals[0], totals[1]) if totals else (0, 0)
+
+    def attach_costs(self, vehicles: Iterable[dict]):
+        """Hash join: set service_cost / maintenance_cost on each vehicle record (in place)"""
+        totals = self._totals
+        for v in vehicles:
+            found = totals.get(v.get("Id"))
+            v["service_cost"] = found[0] if found else 0
+            v["maintenance_cost"] = found[1] if found else 0
+        return vehicles
+
+
+_rollup = None
+_rollup_lock = threading.Lock()
+
+
+def get_cost_rollup() -> CostRollup:
+    """Return the process-wide cost rollup"""
+    global _rollup
+    if _rollup is None:
+        with _rollup_lock:
+            if _rollup is None:
+                _rollup = CostRollup()
+    return _rollup
+
+
+def start_cost_rollup():
+    """Attach the rollup to the shared replica (called at app startup)"""
+    get_cost_rollup().attach(get_replica())
@@ -0,0 +1,101 @@
+"""
+Server-Sent Events fan-out for live dashboards.
+
+Each published dashboard snapshot is diffed against the previous one: counters
+whose value changed go out as one `counters` event, and vehicle rows that changed
+or disappeared go out as one `vehicles` event. Every event is serialized once
+and queued to each subscriber. Any number of open dashboards therefore costs
+the one background refresh loop, not one polling loop per tab.
+"""
+import asyncio
+import json
+import os
+from typing import AsyncIterator, Dict, Optional, Set
+
+KEEPALIVE_SECONDS = int(os.getenv("SSE_KEEPALIVE_SECONDS", "15"))
+SUBSCRIBER_QUEUE_SIZE = 100
+
+
+def sse_message(event: str, data, event_id: int = None) -> str:
+    lines = [f"event: {event}"]
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"data: {json.dumps(data, default=str)}")
+    return "\n".join(lines) + "\n\n"
+
+
+class DashboardEvents:
+    """
+    Diffs successive snapshots and broadcasts the changes to every connected stream
+    (all on the event loop - no locking)
+    """
+
+    def __init__(self):
+        self._subscribers: Set[asyncio.Queue] = set()
+        self._counters: Optional[dict] = None
+        self._rows: Dict[str, dict] = {}
+        self._sequence = 0
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._subscribers)
+
+    async def on_snapshot(self, snapshot: dict):
+        """Snapshot listener: publish what changed since the previous snapshot"""
+        counters = dict(snapshot["summary"])
+        rows = {row["Id"]: row for row in snapshot["vehicles_by_status"]["total"]}
+        previous_counters, previous_rows = self._counters, self._rows
+        self._counters, self._rows = counters, rows
+        if previous_counters is None:
+            # First snapshot - new streams start from it, there is nothing to diff yet
+            self._publish("counters", counters)
+            return
+
+        changed_counters = {k: v for k, v in counters.items() if previous_counters.get(k) != v}
+        if changed_counters:
+            self._publish("counters", changed_counters)
+
+        changed_rows = [row for vehicle_id, row in rows.items() if previous_rows.get(vehicle_id) != row]
+        removed_ids = [vehicle_id for vehicle_id in previous_rows if vehicle_id not in rows]
+        if changed_rows or removed_ids:
+            self._publish("vehicles", {"changed": changed_rows, "removed": removed_ids})
+            print(f"📡 Pushed {len(changed_rows)} changed / {len(removed_ids)} removed vehicles to {len(self._subscribers)} streams")
+
+    def _publish(self, event: str, data):
+        self._sequence += 1
+        message = sse_message(event, data, self._sequence)
+        for queue in list(self._subscribers):
+            try:
+                queue.put_nowait(message)
+            except asyncio.QueueFull:
+                # Too slow to keep up - end its stream; EventSource reconnects and starts from the current counters
+                self._subscribers.discard(queue)
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(None)
+
+    async def stream(self) -> AsyncIterator[str]:
+        """
+        One subscriber's SSE body: the current counters, then change events as they happen,
+        with a comment line every KEEPALIVE_SECONDS so proxies keep the connection open
+        """
+        queue: asyncio.Queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self._subscribers.add(queue)
+        try:
+            yield "retry: 5000\n\n"
+            if self._counters is not None:
+                yield sse_message("counters", self._counters, self._sequence)
+            while True:
+                try:
+                    message = await asyncio.wait_for(queue.get(), timeout=KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                if message is None:
+                    return
+                yield message
+        finally:
+            self._subscribers.discard(queue)
+
+
+dashboard_events = DashboardEvents()
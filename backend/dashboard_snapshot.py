@@ -0,0 +1,112 @@
+"""
+Background-materialized dashboard snapshot.
+
+A task on the app's event loop rebuilds the whole dashboard payload every
+DASHBOARD_SNAPSHOT_INTERVAL seconds and publishes it by swapping one reference.
+Readers get the latest complete snapshot with no locking and no upstream call.
+A published snapshot is never modified.
+"""
+import asyncio
+import os
+import time
+from typing import Awaitable, Callable, List, Optional, Tuple
+
+from api_usage import get_api_usage
+
+
+class SnapshotPublisher:
+    """
+    Periodically await build() and publish the result with an atomic reference swap
+    """
+
+    def __init__(self, name: str, build: Callable[[], Awaitable[dict]], interval: int = None):
+        self.name = name
+        self._build = build
+        self.interval = interval or int(os.getenv("DASHBOARD_SNAPSHOT_INTERVAL", "60"))
+        # (snapshot, built_at) - replaced as one tuple so readers never see a half-published pair
+        self._published: Optional[Tuple[dict, float]] = None
+        self._task: Optional[asyncio.Task] = None
+        self._listeners: List[Callable[[dict], None]] = []
+        self.last_error = None
+
+    def add_listener(self, fn: Callable[[dict], None]):
+        """
+        Register fn(snapshot) - called after every publish: coroutine functions are awaited
+        on the event loop, plain functions run in a worker thread
+        """
+        self._listeners.append(fn)
+
+    @property
+    def effective_interval(self) -> float:
+        """interval, stretched as the org nears its daily API limit"""
+        return get_api_usage().stretch(self.interval)
+
+    @property
+    def max_age(self) -> float:
+        """Older snapshots are ignored (the refresher has been failing) - three missed refreshes"""
+        return self.effective_interval * 3
+
+    async def refresh(self) -> dict:
+        """Build a new snapshot now and publish it"""
+        started = time.monotonic()
+        snapshot = await self._build()
+        self._published = (snapshot, time.time())
+        self.last_error = None
+        print(f"📸 {self.name} snapshot published in {time.monotonic() - started:.2f}s")
+        for fn in self._listeners:
+            try:
+                if asyncio.iscoroutinefunction(fn):
+                    await fn(snapshot)
+                else:
+                    await asyncio.to_thread(fn, snapshot)
+            except Exception as e:
+                print(f"⚠️ {self.name} snapshot listener {getattr(fn, '__name__', fn)} failed: {e}")
+        return snapshot
+
+    def current(self) -> Tuple[Optional[dict], Optional[float]]:
+        """(snapshot, age in seconds) - (None, None) if there is none or it is too old"""
+        published = self._published
+        if published is None:
+            return None, None
+        snapshot, built_at = published
+        age = time.time() - built_at
+        if age > self.max_age:
+            return None, None
+        return snapshot, round(age, 1)
+
+    @property
+    def published_at(self) -> Optional[float]:
+        """When the current snapshot was built (None before the first one) - its data version"""
+        published = self._published
+        return published[1] if published else None
+
+    def start(self):
+        """Start the refresh loop on the running event loop (idempotent)"""
+        if self._task and not self._task.done():
+            return
+
+        async def loop():
+            while True:
+                try:
+                    await self.refresh()
+                except Exception as e:
+                    print(f"❌ {self.name} snapshot refresh failed: {e}")
+                    self.last_error = str(e)
+                await asyncio.sleep(self.effective_interval)
+
+        self._task = asyncio.get_running_loop().create_task(loop())
+        print(f"✅ {self.name} snapshot refresh started (every {self.interval}s)")
+
+    def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    def status(self) -> dict:
+        _, age = self.current()
+        return {
+            "interval_seconds": self.interval,
+            "effective_interval_seconds": self.effective_interval,
+            "age_seconds": age,
+            "last_error": self.last_error,
+        }
@@ -0,0 +1,232 @@
+"""
+Structured driver timeline per vehicle: Previous_Drivers__c parsed into
+(driver, from, to) entries and merged with the vehicle's Vehicle_Allocation__c rows.
+
+Previous_Drivers__c is free text, typically one line per handover, newest first:
+"George Widdowson 10.02.25 1pm\nJohn Smith 09.02.25 9am". Dates are UK day-first
+(10.02.25, 10/02/2025, 10-02-2025) or ISO, times are dropped, and "A 01.01.24 - 01.03.24"
+is read as a range. A handover with no end runs until the next handover. An
+allocation for the same driver covering the same date replaces the text entry,
+since it has exact dates.
+
+Timelines built from the replica are cached per vehicle and dropped when the
+vehicle or one of its allocations changes, so history views and AI prompts read
+a precomputed list instead of re-parsing the text.
+"""
+import re
+import threading
+from datetime import date
+from typing import Dict, List, Optional, Set
+
+from allocation_index import EARLIEST, LATEST, engineers, get_allocation_index
+from vehicle_replica import VehicleReplica, get_replica
+
+VEHICLE_OBJECT = "Vehicle__c"
+ALLOCATION_OBJECT = "Vehicle_Allocation__c"
+
+_DATE_RE = re.compile(
+    r"\b(?P<iso_y>\d{4})-(?P<iso_m>\d{1,2})-(?P<iso_d>\d{1,2})\b"
+    r"|\b(?P<d>\d{1,2})[./-](?P<m>\d{1,2})[./-](?P<y>\d{4}|\d{2})\b"
+)
+_TIME_RE = re.compile(r"\b\d{1,2}(?::\d{2})?\s*(?:am|pm)\b|\b\d{1,2}:\d{2}\b", re.IGNORECASE)
+_RANGE_SEPARATORS = {"", "-", "–", "to", "until", "till"}
+_NAME_PADDING = " \t-–:,;()[]|"
+
+
+def _parse_date(match) -> Optional[str]:
+    if match.group("iso_y"):
+        year, month, day = match.group("iso_y"), match.group("iso_m"), match.group("iso_d")
+    else:
+        year, month, day = match.group("y"), match.group("m"), match.group("d")
+        if len(year) == 2:
+            year = "20" + year
+    try:
+        return date(int(year), int(month), int(day)).isoformat()
+    except ValueError:
+        return None
+
+
+def _clean_name(text: str) -> str:
+    return " ".join(_TIME_RE.sub(" ", text).split()).strip(_NAME_PADDING)
+
+
+def driver_key(name: str) -> str:
+    return " ".join(name.lower().split())
+
+
+def parse_previous_drivers(text: Optional[str]) -> List[dict]:
+    """Previous_Drivers__c -> [{driver, from, to, source}] in the order written (dates may be None)"""
+    entries = []
+    for line in re.split(r"[\r\n;]+", text or ""):
+        matches = [m for m in _DATE_RE.finditer(line) if _parse_date(m)]
+        if not matches:
+            name = _clean_name(line)
+            if name:
+                entries.append({"driver": name, "from": None, "to": None, "source": "previous_drivers"})
+            continue
+        position, i = 0, 0
+        while i < len(matches):
+            start = matches[i]
+            name = _clean_name(line[position:start.start()])
+            end = None
+            position = start.end()
+            if i + 1 < len(matches):
+                between = _clean_name(line[start.end():matches[i + 1].start()]).lower()
+                if between in _RANGE_SEPARATORS:
+                    end = _parse_date(matches[i + 1])
+                    position = matches[i + 1].end()
+                    i += 1
+            if not name:
+                # "10.02.25 George Widdowson" - the name follows the date
+                following = matches[i + 1].start() if i + 1 < len(matches) else len(line)
+                name = _clean_name(line[position:following])
+                position = following
+            if name:
+                entries.append({"driver": name, "from": _parse_date(start), "to": end, "source": "previous_drivers"})
+            i += 1
+    return entries
+
+
+def allocation_entries(allocations: List[dict]) -> List[dict]:
+    """Vehicle_Allocation__c rows -> timeline entries (one per engineer named on the allocation)"""
+    entries = []
+    for allocation in allocations:
+        for _, name in engineers(allocation):
+            if name:
+                entries.append({
+                    "driver": name,
+                    "from": (allocation.get("Start_date__c") or "")[:10] or None,
+                    "to": (allocation.get("End_date__c") or "")[:10] or None,
+                    "source": "allocation",
+                    "allocation_id": allocation.get("Id"),
+                })
+    return entries
+
+
+def build_timeline(previous_drivers: Optional[str], allocations: List[dict]) -> List[dict]:
+    """Merged timeline, newest first. Undated text entries go last, in the order written."""
+    from_allocations = allocation_entries(allocations)
+    covered = {}
+    for entry in from_allocations:
+        covered.setdefault(driver_key(entry["driver"]), []).append(
+            (entry["from"] or EARLIEST, entry["to"] or LATEST)
+        )
+    from_text = [
+        entry for entry in parse_previous_drivers(previous_drivers)
+        if not (entry["from"] and any(
+            low <= entry["from"] <= high for low, high in covered.get(driver_key(entry["driver"]), ())
+        ))
+    ]
+
+    dated = sorted(
+        (entry for entry in from_text + from_allocations if entry["from"]),
+        key=lambda entry: entry["from"],
+    )
+    # A handover without an end lasts until the next handover
+    for current, following in zip(dated, dated[1:]):
+        if current["source"] == "previous_drivers" and current["to"] is None and following["from"] > current["from"]:
+            current["to"] = following["from"]
+    dated.reverse()
+    return dated + [entry for entry in from_text if not entry["from"]]
+
+
+def format_timeline(timeline: List[dict]) -> str:
+    """Compact one-line-per-entry text for prompts and plain-text views"""
+    lines = []
+    for entry in timeline:
+        period = f"{entry['from'] or '?'} to {entry['to'] or 'present'}" if entry["from"] else "dates unknown"
+        lines.append(f"{entry['driver']}: {period}")
+    return "\n".join(lines)
+
+
+class DriverTimelines:
+    """
+    vehicle Id -> merged timeline, built from the replica on first use and dropped
+    when the vehicle or one of its allocations changes
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._timelines: Dict[str, List[dict]] = {}
+        self._allocation_vehicles: Dict[str, Set[str]] = {}  # allocation Id -> vehicles whose cached timeline used it
+        self._generation = 0  # bumped on every change, so a timeline built across one isn't cached
+        self._replica: Optional[VehicleReplica] = None
+
+    def _invalidate(self, vehicle_id: Optional[str]):
+        if vehicle_id:
+            self._timelines.pop(vehicle_id, None)
+
+    def _on_replica_change(self, object_name: str, upserted: list, deleted_ids: list):
+        if object_name not in (VEHICLE_OBJECT, ALLOCATION_OBJECT):
+            return  # e.g. Vehicle_Cost__c syncs - timelines don't read them
+        with self._lock:
+            self._generation += 1
+            if object_name == VEHICLE_OBJECT:
+                for vehicle_id in [*deleted_ids, *(v["Id"] for v in upserted)]:
+                    self._invalidate(vehicle_id)
+            elif object_name == ALLOCATION_OBJECT:
+                for allocation in upserted:
+                    self._invalidate(allocation.get("Vehicle__c"))
+                # An allocation can move between vehicles or vanish - also drop wherever it was used
+                for allocation_id in [*deleted_ids, *(a["Id"] for a in upserted)]:
+                    for vehicle_id in self._allocation_vehicles.pop(allocation_id, ()):
+                        self._invalidate(vehicle_id)
+
+    def attach(self, replica: VehicleReplica):
+        """Follow the replica's change events (timelines are built lazily)"""
+        replica.add_listener(self._on_replica_change)
+        with self._lock:
+            self._timelines.clear()
+            self._allocation_vehicles.clear()
+        self._replica = replica
+
+    @property
+    def ready(self) -> bool:
+        return self._replica is not None and get_allocation_index().ready
+
+    def for_vehicle(self, vehicle_id: str) -> Optional[List[dict]]:
+        """
+        Cached timeline of a replicated vehicle, or None if the vehicle isn't in the replica.
+        If the allocation index fails, the timeline is built from Previous_Drivers__c only.
+        """
+        with self._lock:
+            cached = self._timelines.get(vehicle_id)
+            generation = self._generation
+        if cached is not None:
+            return cached
+        vehicle = self._replica.get(VEHICLE_OBJECT, vehicle_id) if self._replica else None
+        if vehicle is None:
+            return None
+        try:
+            allocations = get_allocation_index().for_vehicle(vehicle_id, EARLIEST, LATEST)
+        except Exception as e:
+            # Previous_Drivers__c alone - not cached, so the next request retries the allocations
+            print(f"⚠️ Allocations for vehicle {vehicle_id} unavailable, timeline from Previous_Drivers__c only: {e}")
+            return build_timeline(vehicle.get("Previous_Drivers__c"), [])
+        timeline = build_timeline(vehicle.get("Previous_Drivers__c"), allocations)
+        with self._lock:
+            if generation != self._generation:
+                return timeline
+            self._timelines[vehicle_id] = timeline
+            for allocation in allocations:
+                self._allocation_vehicles.setdefault(allocation["Id"], set()).add(vehicle_id)
+        return timeline
+
+
+_timelines = None
+_timelines_lock = threading.Lock()
+
+
+def get_driver_timelines() -> DriverTimelines:
+    """Return the process-wide driver timeline cache"""
+    global _timelines
+    if _timelines is None:
+        with _timelines_lock:
+            if _timelines is None:
+                _timelines = DriverTimelines()
+    return _timelines
+
+
+def start_driver_timelines():
+    """Attach the cache to the shared replica (called at app startup)"""
+    get_driver_timelines().attach(get_replica())
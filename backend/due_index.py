@@ -0,0 +1,146 @@
+"""
+In-memory due-date index over Vehicle__c (MOT, tax, service, jetter).
+
+Each due-date field keeps a sorted list of (date, vehicle Id). "Due within N days"
+is a bisect up to today + N, and "overdue" is a bisect up to today, so no query
+goes to Salesforce. The index is loaded from the replica and then kept current
+from its Vehicle__c change events.
+"""
+import bisect
+import threading
+from datetime import date, timedelta
+from typing import Dict, List, Optional
+
+from vehicle_replica import VehicleReplica, get_replica
+
+VEHICLE_OBJECT = "Vehicle__c"
+
+# Due-date fields in order of preference - orgs have one or the other
+MOT_DATE_FIELDS = ["Next_MOT_Date__c", "MOT_Due_Date__c"]
+TAX_DATE_FIELDS = ["Next_Tax_Date__c", "Tax_Due_Date__c"]
+
+# Due kind -> (due date field candidates, last date fields shown alongside)
+DUE_KINDS = {
+    "mot": (MOT_DATE_FIELDS, ["Last_MOT_Date__c"]),
+    "tax": (TAX_DATE_FIELDS, ["Last_Tax_Date__c"]),
+    "service": (["Next_Service_Date__c"], ["Last_Service_Date__c"]),
+    "jetter": (["Next_Jetter_Service__c"], ["Jetter__c", "Last_Jetter_Service__c"]),
+}
+
+DUE_LIST_FIELDS = [
+    "Id", "Name", "Reg_No__c", "Van_Number__c", "Status__c",
+    "Trade_Group__c", "Vehicle_Type__c", "Make_Model__c",
+]
+
+INDEXED_FIELDS = [field for candidates, _ in DUE_KINDS.values() for field in candidates]
+
+
+class DueDateIndex:
+    """
+    field -> sorted [(YYYY-MM-DD, vehicle Id)], plus the vehicle rows they point at
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sorted: Dict[str, list] = {field: [] for field in INDEXED_FIELDS}
+        self._vehicles: Dict[str, dict] = {}
+        self._replica: Optional[VehicleReplica] = None
+
+    @staticmethod
+    def _day(value) -> Optional[str]:
+        return value[:10] if value else None
+
+    def _remove(self, vehicle_id: str):
+        old = self._vehicles.pop(vehicle_id, None)
+        if old is None:
+            return
+        for field, entries in self._sorted.items():
+            day = self._day(old.get(field))
+            if day:
+                i = bisect.bisect_left(entries, (day, vehicle_id))
+                if i < len(entries) and entries[i] == (day, vehicle_id):
+                    del entries[i]
+
+    def _add(self, vehicle: dict):
+        vehicle_id = vehicle["Id"]
+        self._vehicles[vehicle_id] = vehicle
+        for field, entries in self._sorted.items():
+            day = self._day(vehicle.get(field))
+            if day:
+                bisect.insort(entries, (day, vehicle_id))
+
+    def apply(self, upserted: List[dict], deleted_ids: List[str]):
+        """Re-index changed vehicles and drop deleted ones"""
+        with self._lock:
+            for vehicle_id in deleted_ids:
+                self._remove(vehicle_id)
+            for vehicle in upserted:
+                self._remove(vehicle["Id"])
+                self._add(vehicle)
+
+    def load(self, vehicles: List[dict]):
+        """Rebuild from scratch - one sort per field instead of n inserts"""
+        with self._lock:
+            self._vehicles = {v["Id"]: v for v in vehicles}
+            self._sorted = {
+                field: sorted(
+                    (self._day(v.get(field)), v["Id"]) for v in vehicles if v.get(field)
+                )
+                for field in INDEXED_FIELDS
+            }
+
+    def _on_replica_change(self, object_name: str, upserted: list, deleted_ids: list):
+        if object_name == VEHICLE_OBJECT:
+            self.apply(upserted, deleted_ids)
+
+    def attach(self, replica: VehicleReplica):
+        """Load the replicated vehicles and follow the replica's change events from now on"""
+        replica.add_listener(self._on_replica_change)
+        self.load(replica.records(VEHICLE_OBJECT))
+        self._replica = replica
+        print(f"✅ Due-date index loaded for {len(self._vehicles)} vehicles")
+
+    @property
+    def ready(self) -> bool:
+        """True once loaded from the replica (callers check replica freshness via resolve_source)"""
+        return self._replica is not None
+
+    def due(self, field: str, days: int = 30, overdue_only: bool = False, fields: List[str] = None) -> List[dict]:
+        """
+        Vehicles whose `field` date is on/before today + days (overdue included), soonest first.
+        overdue_only=True returns only dates before today. Rows are projected to `fields`.
+        """
+        today = date.today()
+        with self._lock:
+            entries = self._sorted.get(field, [])
+            if overdue_only:
+                # '' sorts before every Id, so this stops before today's entries
+                upper = bisect.bisect_left(entries, (today.isoformat(), ""))
+            else:
+                cutoff = (today + timedelta(days=days)).isoformat()
+                # chr(0x10FFFF) sorts after every Id, so entries dated `cutoff` are included
+                upper = bisect.bisect_right(entries, (cutoff, chr(0x10FFFF)))
+            entries = entries[:upper]
+            vehicles = [self._vehicles[vehicle_id] for _, vehicle_id in entries]
+        if fields is None:
+            return vehicles
+        return [{f: v.get(f) for f in fields} for v in vehicles]
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_due_index() -> DueDateIndex:
+    """Return the process-wide due-date index"""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = DueDateIndex()
+    return _index
+
+
+def start_due_index():
+    """Attach the index to the shared replica (called at app startup)"""
+    get_due_index().attach(get_replica())
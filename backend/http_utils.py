@@ -0,0 +1,94 @@
+"""
+Shared HTTP response helpers for the API routes
+"""
+import json
+from typing import AsyncIterable, Iterable
+
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import Response, StreamingResponse
+from simple_salesforce.exceptions import SalesforceError
+from starlette.datastructures import Headers
+
+from salesforce_service import SalesforceQueryError, SalesforceUnavailable
+
+_END = object()
+
+
+def error_status(error: Exception) -> int:
+    """
+    Status for an error escaping a route: 503 when Salesforce can't be reached (mock mode,
+    network), 502 when it rejected the call, else 500. A failed Salesforce read is never
+    answered as an empty 200, so clients don't cache an empty fleet during an outage.
+    """
+    if isinstance(error, SalesforceUnavailable):
+        return 503
+    if isinstance(error, (SalesforceError, SalesforceQueryError)):
+        return 502
+    return 500
+
+
+def ndjson_response(rows: Iterable[dict]) -> StreamingResponse:
+    """
+    Stream rows as newline-delimited JSON (one object per line).
+    The first row is pulled before the response starts so query/auth errors
+    still surface as a normal HTTP error instead of a truncated stream.
+    """
+    rows = iter(rows)
+    first = next(rows, _END)
+
+    def body():
+        if first is _END:
+            return
+        yield json.dumps(first, default=str) + "\n"
+        for row in rows:
+            yield json.dumps(row, default=str) + "\n"
+
+    return StreamingResponse(body(), media_type="application/x-ndjson")
+
+
+async def async_ndjson_response(rows: AsyncIterable[dict]) -> StreamingResponse:
+    """ndjson_response for an async iterator (rows pulled on the event loop, no worker thread)"""
+    rows = rows.__aiter__()
+    try:
+        first = await rows.__anext__()
+    except StopAsyncIteration:
+        first = _END
+
+    async def body():
+        if first is _END:
+            return
+        yield json.dumps(first, default=str) + "\n"
+        async for row in rows:
+            yield json.dumps(row, default=str) + "\n"
+
+    return StreamingResponse(body(), media_type="application/x-ndjson")
+
+
+def record_set_response(envelope: dict, key: str, records) -> Response:
+    """
+    JSON response of envelope plus records (a RecordSet) under `key`, serialized
+    straight from the row tuples instead of via per-row dicts and jsonable_encoder.
+    """
+    head = json.dumps(envelope, default=str)[:-1]
+    separator = ", " if envelope else ""
+    body = f'{head}{separator}"{key}": {records.to_json()}}}'
+    return Response(content=body, media_type="application/json")
+
+
+def event_stream_response(messages: AsyncIterable[str]) -> StreamingResponse:
+    """Server-Sent Events response (messages already SSE-formatted)"""
+    return StreamingResponse(
+        messages,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+class StreamAwareGZipMiddleware(GZipMiddleware):
+    """GZip that leaves Server-Sent Events alone - compressing a live stream would hold events back"""
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and "text/event-stream" in Headers(scope=scope).get("accept", ""):
+            await self.app(scope, receive, send)
+            return
+        await super().__call__(scope, receive, send)
@@ -0,0 +1,188 @@
+"""
+Server-side filtering, stable sorting and keyset pagination for the vehicle list endpoints.
+
+Every list is ordered by (sort field, Id), so the order is total and stable. A page
+ends with an opaque cursor that encodes the last row's (sort value, Id). The next
+page starts strictly after that key: in SOQL it is a WHERE condition, and for
+in-memory rows (replica/snapshot) it is a bisect. No page ever re-reads the rows
+before it.
+
+Null sort values follow SOQL's defaults: first when ascending, last when descending.
+In-memory comparisons case-fold strings, as SOQL's ORDER BY and = do, so a page and
+its cursor come out the same whichever source serves the list.
+"""
+import base64
+import bisect
+import json
+from typing import Callable, Dict, List, Optional, Tuple
+
+from fastapi import HTTPException
+
+# Filter query parameter -> Vehicle__c field. Values may be comma-separated (any of).
+FILTER_FIELDS = {
+    "status": "Status__c",
+    "trade_group": "Trade_Group__c",
+    "vehicle_type": "Vehicle_Type__c",
+    "territory": "Service_Territory__c",
+}
+
+MAX_LIMIT = 2000
+
+# Date/datetime sort fields: SOQL wants them as unquoted literals
+DATE_FIELDS = {"Next_Service_Date__c", "Last_Service_Date__c", "Next_MOT_Date__c", "Last_MOT_Date__c"}
+DATETIME_FIELDS = {"CreatedDate", "LastModifiedDate", "SystemModstamp"}
+
+
+def soql_quote(value: str) -> str:
+    """SOQL string literal"""
+    return "'" + str(value).replace("\\", "\\\\").replace("'", "\\'") + "'"
+
+
+def soql_literal(field: str, value) -> str:
+    """Literal for comparing `field` with a value read from an API record"""
+    if field in DATE_FIELDS:
+        return str(value)[:10]
+    if field in DATETIME_FIELDS:
+        # API timestamps are UTC ('2024-01-15T10:20:30.000+0000'); system datetimes have no milliseconds
+        return str(value)[:19] + "Z"
+    return soql_quote(value)
+
+
+def fold_value(value):
+    """Case-insensitive comparison form of a field value (SOQL compares text without case)"""
+    return value.casefold() if isinstance(value, str) else value
+
+
+def encode_cursor(value, record_id: str) -> str:
+    return base64.urlsafe_b64encode(json.dumps([value, record_id]).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[Optional[str], str]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        value, record_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return value, str(record_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+class ListQuery:
+    """
+    One list request: filters, sort field/direction, page size and the cursor to resume after
+    """
+
+    def __init__(self, sort_field: str, descending: bool = False, limit: int = None,
+                 cursor: str = None, filters: Dict[str, List[str]] = None):
+        self.sort_field = sort_field
+        self.descending = descending
+        self.limit = limit
+        self.after = decode_cursor(cursor) if cursor else None
+        self.filters = filters or {}
+        self._folded_filters = {field: {fold_value(v) for v in values} for field, values in self.filters.items()}
+
+    @classmethod
+    def from_params(cls, sort: str, order: str, limit: Optional[int], cursor: Optional[str],
+                    sort_fields: Dict[str, str], **filters) -> "ListQuery":
+        """
+        Validate request parameters. sort_fields maps public sort names to Vehicle__c fields;
+        filters are FILTER_FIELDS keys with raw (possibly comma-separated) values.
+        """
+        if sort not in sort_fields:
+            raise HTTPException(status_code=400, detail=f"sort must be one of: {', '.join(sort_fields)}")
+        if order not in ("asc", "desc"):
+            raise HTTPException(status_code=400, detail="order must be 'asc' or 'desc'")
+        if limit is not None and not 1 <= limit <= MAX_LIMIT:
+            raise HTTPException(status_code=400, detail=f"limit must be between 1 and {MAX_LIMIT}")
+        parsed = {
+            FILTER_FIELDS[name]: [v.strip() for v in value.split(",") if v.strip()]
+            for name, value in filters.items()
+            if value
+        }
+        return cls(sort_fields[sort], order == "desc", limit, cursor, parsed)
+
+    # ========================================
+    # SOQL
+    # ========================================
+
+    def _keyset_condition(self) -> Optional[str]:
+        if self.after is None:
+            return None
+        value, record_id = self.after
+        field, rid = self.sort_field, soql_quote(record_id)
+        if self.descending:
+            if value is None:
+                return f"({field} = null AND Id < {rid})"
+            v = soql_literal(field, value)
+            return f"({field} < {v} OR ({field} = {v} AND Id < {rid}) OR {field} = null)"
+        if value is None:
+            return f"(({field} = null AND Id > {rid}) OR {field} != null)"
+        v = soql_literal(field, value)
+        return f"({field} > {v} OR ({field} = {v} AND Id > {rid}))"
+
+    def soql_conditions(self) -> List[str]:
+        """WHERE conditions for the filters and the cursor (AND them with any others)"""
+        conditions = []
+        for field, values in self.filters.items():
+            if len(values) == 1:
+                conditions.append(f"{field} = {soql_quote(values[0])}")
+            else:
+                conditions.append(f"{field} IN ({', '.join(soql_quote(v) for v in values)})")
+        keyset = self._keyset_condition()
+        if keyset:
+            conditions.append(keyset)
+        return conditions
+
+    def soql_order_limit(self, probe: bool = True) -> str:
+        """
+        ORDER BY (sort field, Id) and LIMIT page size + 1 - the extra row tells finish_page
+        whether there is a next page (probe=False for streams, which return no cursor)
+        """
+        direction = "DESC" if self.descending else "ASC"
+        clause = f"ORDER BY {self.sort_field} {direction}, Id {direction}"
+        if self.limit:
+            clause += f" LIMIT {self.limit + 1 if probe else self.limit}"
+        return clause
+
+    def finish_page(self, rows: list, value_of: Callable = None) -> Tuple[list, Optional[str]]:
+        """Trim rows fetched with LIMIT page size + 1 and build the next cursor"""
+        value_of = value_of or (lambda row, field: row.get(field))
+        if not self.limit or len(rows) <= self.limit:
+            return rows, None
+        rows = rows[:self.limit]
+        last = rows[-1]
+        return rows, encode_cursor(value_of(last, self.sort_field), value_of(last, "Id"))
+
+    # ========================================
+    # IN-MEMORY (replica / snapshot rows)
+    # ========================================
+
+    def matches(self, record: dict) -> bool:
+        return all(fold_value(record.get(field)) in values for field, values in self._folded_filters.items())
+
+    def _key(self, value, record_id) -> tuple:
+        # None sorts first ascending, which reversed makes it last descending - same as SOQL
+        return (value is not None, fold_value(value) if value is not None else "", record_id or "")
+
+    def apply(self, records: List[dict]) -> Tuple[List[dict], Optional[str]]:
+        """Filter, sort and cut one page out of in-memory records; returns (page, next cursor)"""
+        rows = [r for r in records if self.matches(r)] if self.filters else list(records)
+        keys = [self._key(r.get(self.sort_field), r.get("Id")) for r in rows]
+        order = sorted(range(len(rows)), key=keys.__getitem__)
+        keys = [keys[i] for i in order]
+        rows = [rows[i] for i in order]
+
+        if self.descending:
+            end = bisect.bisect_left(keys, self._key(*self.after)) if self.after else len(rows)
+            start = max(0, end - self.limit) if self.limit else 0
+            page = rows[start:end][::-1]
+            has_more = start > 0
+        else:
+            start = bisect.bisect_right(keys, self._key(*self.after)) if self.after else 0
+            end = start + self.limit if self.limit else len(rows)
+            page = rows[start:end]
+            has_more = end < len(rows)
+
+        if not has_more or not page:
+            return page, None
+        last = page[-1]
+        return page, encode_cursor(last.get(self.sort_field), last.get("Id"))
@@ -0,0 +1,93 @@
+"""
+Vehicle count cube for the dashboard charts.
+
+The cube holds one count per distinct combination of all pivot dimensions (the
+finest grain - a few hundred cells for the whole fleet). Any breakdown the charts
+ask for is a roll-up of those cells, memoized on the cube, so a chart payload is
+a handful of counts instead of the full vehicle list. A cube is built once per
+data refresh (with the dashboard snapshot) and never modified.
+
+Filters compare case-insensitively, like the list endpoints' (see list_query), and
+only the ROLLUP_MEMO_SIZE most recently used roll-ups are kept.
+"""
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from list_query import fold_value
+
+# Pivot query parameter -> Vehicle__c field
+PIVOT_DIMENSIONS = {
+    "status": "Status__c",
+    "trade_group": "Trade_Group__c",
+    "vehicle_type": "Vehicle_Type__c",
+    "ownership": "Vehicle_Ownership__c",
+    "territory": "Service_Territory__c",
+}
+
+PIVOT_FIELDS = list(PIVOT_DIMENSIONS.values())
+
+# Memoized roll-ups per cube - filter values come from clients, so the memo is bounded
+ROLLUP_MEMO_SIZE = 64
+
+
+class PivotCube:
+    """
+    (status, trade group, vehicle type, ownership, territory) -> vehicle count
+    """
+
+    def __init__(self, cells: Dict[Tuple, int]):
+        self.cells = cells
+        self.total = sum(cells.values())
+        self._rollups: "OrderedDict[tuple, List[dict]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_records(cls, vehicles: Iterable[dict]) -> "PivotCube":
+        """Count vehicle records (replica rows or a live query)"""
+        cells: Dict[Tuple, int] = {}
+        for v in vehicles:
+            key = tuple(v.get(field) for field in PIVOT_FIELDS)
+            cells[key] = cells.get(key, 0) + 1
+        return cls(cells)
+
+    @classmethod
+    def from_aggregate(cls, rows: Iterable[dict]) -> "PivotCube":
+        """Build from a GROUP BY over the pivot fields (rows carry COUNT(Id) as cnt)"""
+        cells: Dict[Tuple, int] = {}
+        for row in rows:
+            key = tuple(row.get(field) for field in PIVOT_FIELDS)
+            cells[key] = cells.get(key, 0) + int(row.get("cnt") or 0)
+        return cls(cells)
+
+    def rollup(self, dimensions: List[str], filters: Optional[Dict[str, List[str]]] = None) -> List[dict]:
+        """
+        Counts grouped by `dimensions` (PIVOT_DIMENSIONS keys, in that order), largest first,
+        over the cells that match `filters` (dimension -> allowed values, any case)
+        """
+        folded = {d: {fold_value(v) for v in values} for d, values in (filters or {}).items()}
+        memo_key = (tuple(dimensions), tuple(sorted((d, tuple(sorted(v))) for d, v in folded.items())))
+        with self._lock:
+            rows = self._rollups.get(memo_key)
+            if rows is not None:
+                self._rollups.move_to_end(memo_key)
+                return rows
+
+        names = list(PIVOT_DIMENSIONS)
+        group_at = [names.index(d) for d in dimensions]
+        filter_at = [(names.index(d), allowed) for d, allowed in folded.items()]
+        counts: Dict[Tuple, int] = {}
+        for key, count in self.cells.items():
+            if all(fold_value(key[i]) in allowed for i, allowed in filter_at):
+                group = tuple(key[i] for i in group_at)
+                counts[group] = counts.get(group, 0) + count
+
+        rows = [
+            {**dict(zip(dimensions, group)), "count": count}
+            for group, count in sorted(counts.items(), key=lambda item: (-item[1], [str(g) for g in item[0]]))
+        ]
+        with self._lock:
+            self._rollups[memo_key] = rows
+            if len(self._rollups) > ROLLUP_MEMO_SIZE:
+                self._rollups.popitem(last=False)
+        return rows
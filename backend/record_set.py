@@ -0,0 +1,166 @@
+"""
+Compact SOQL result container - column names stored once, one tuple per row.
+
+A list of per-record dicts repeats every key for every row and is rebuilt at each
+reshaping step. RecordSet keeps one tuple per row and only creates dicts at the
+JSON boundary, a chunk at a time.
+"""
+import json
+from operator import itemgetter
+from typing import Dict, Iterable, Iterator, List, Sequence
+
+
+def _flatten(record: dict, prefix: str = ""):
+    """
+    Yield (column, value) for a Salesforce record, nested relationships as 'Vehicle__r.Name'.
+    Relationships are recognised by their 'attributes' (raw records) or a '__r' key (cleaned records).
+    """
+    for key, value in record.items():
+        if key == "attributes":
+            continue
+        if isinstance(value, dict) and ("attributes" in value or key.endswith("__r")):
+            yield from _flatten(value, f"{prefix}{key}.")
+        else:
+            yield f"{prefix}{key}", value
+
+
+class RecordSet:
+    """
+    Immutable-ish table of SOQL rows: `columns` (tuple of names) + `rows` (list of tuples)
+    """
+
+    __slots__ = ("columns", "rows", "_index")
+
+    def __init__(self, columns: Sequence[str], rows: List[tuple]):
+        self.columns = tuple(columns)
+        self.rows = rows
+        self._index = {name: i for i, name in enumerate(self.columns)}
+
+    @classmethod
+    def from_records(cls, records: Iterable[dict]) -> "RecordSet":
+        """Build from raw (or already cleaned) Salesforce records"""
+        builder = RecordSetBuilder()
+        builder.add(records)
+        return builder.build()
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def __iter__(self) -> Iterator[dict]:
+        return self.iter_dicts()
+
+    def get(self, row: tuple, column: str, default=None):
+        i = self._index.get(column)
+        if i is None or i >= len(row):
+            return default
+        return row[i]
+
+    def project(self, mapping: Dict[str, str]) -> "RecordSet":
+        """
+        New RecordSet with renamed/selected columns: {output name: source column}.
+        Missing source columns come out as None.
+        """
+        positions = [self._index.get(source) for source in mapping.values()]
+        width = len(self.columns)
+        if all(p is not None for p in positions) and all(len(row) == width for row in self.rows):
+            rows = [tuple(row[p] for p in positions) for row in self.rows]
+        else:
+            rows = [
+                tuple(row[p] if p is not None and p < len(row) else None for p in positions)
+                for row in self.rows
+            ]
+        return RecordSet(list(mapping.keys()), rows)
+
+    def iter_dicts(self) -> Iterator[dict]:
+        columns = self.columns
+        width = len(columns)
+        for row in self.rows:
+            if len(row) < width:
+                row = row + (None,) * (width - len(row))
+            yield dict(zip(columns, row))
+
+    def to_dicts(self) -> List[dict]:
+        return list(self.iter_dicts())
+
+    def iter_json(self, chunk_size: int = 1000) -> Iterator[str]:
+        """JSON array of objects in fragments - only chunk_size dicts exist at any moment"""
+        yield "["
+        rows = self.iter_dicts()
+        first = True
+        while True:
+            chunk = [row for _, row in zip(range(chunk_size), rows)]
+            if not chunk:
+                break
+            body = json.dumps(chunk, default=str)[1:-1]
+            yield body if first else "," + body
+            first = False
+        yield "]"
+
+    def to_json(self) -> str:
+        return "".join(self.iter_json())
+
+
+class RecordSetBuilder:
+    """
+    Accumulates records into RecordSet columns/tuples a page at a time, so a caller
+    can drop each raw page as soon as it is added.
+    Records sharing a key layout reuse one compiled itemgetter, so flat rows cost a
+    single C-level call; relationship values are expanded into dotted columns.
+    A relationship first seen populated after earlier rows adds its columns then;
+    shorter earlier rows read those columns as None.
+    """
+
+    def __init__(self):
+        self.columns: List[str] = []
+        self.rows: List[tuple] = []
+        self._index: Dict[str, int] = {}
+        self._plans = {}  # key layout -> (getter, column positions, relationship slots, fields)
+
+    def _position(self, name: str) -> int:
+        if name not in self._index:
+            self._index[name] = len(self.columns)
+            self.columns.append(name)
+        return self._index[name]
+
+    def add(self, records: Iterable[dict]):
+        rows, plans, position = self.rows, self._plans, self._position
+        for record in records:
+            keys = tuple(record)
+            plan = plans.get(keys)
+            if plan is None:
+                fields = [k for k in keys if k != "attributes"]
+                if len(fields) > 1:
+                    getter = itemgetter(*fields)
+                elif fields:
+                    getter = lambda r, k=fields[0]: (r[k],)
+                else:
+                    getter = lambda r: ()  # nothing but 'attributes' - an all-None row
+                slots = [i for i, k in enumerate(fields) if k.endswith("__r") or isinstance(record[k], dict)]
+                positions = [None if i in slots else position(k) for i, k in enumerate(fields)]
+                plan = plans[keys] = (getter, positions, slots, fields)
+            getter, positions, slots, fields = plan
+            values = getter(record)
+            if not slots and positions == list(range(len(positions))):
+                rows.append(values)
+                continue
+            row = [None] * len(self.columns)
+            for value, pos in zip(values, positions):
+                if pos is not None:
+                    row[pos] = value
+            for i in slots:
+                value = values[i]
+                if isinstance(value, dict):
+                    for name, nested in _flatten(value, f"{fields[i]}."):
+                        pos = position(name)
+                        if pos >= len(row):
+                            row.extend([None] * (pos + 1 - len(row)))
+                        row[pos] = nested
+                elif not fields[i].endswith("__r"):
+                    pos = position(fields[i])
+                    if pos >= len(row):
+                        row.extend([None] * (pos + 1 - len(row)))
+                    row[pos] = value
+            rows.append(tuple(row))
+
+    def build(self) -> RecordSet:
+        return RecordSet(self.columns, self.rows)
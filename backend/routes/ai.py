@@ -1,8 +1,11 @@
 from fastapi import APIRouter, HTTPException, UploadFile, File, Form
+from fastapi.concurrency import run_in_threadpool
+from typing import Optional
 import base64
 import sys
 import os
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from blob_store import BlobTooLarge, NotAnImage, get_blob_store
 
 router = APIRouter(prefix="/api/ai", tags=["ai"])
 
@@ -37,34 +40,46 @@ except Exception as e:
 
 @router.post("/extract-vehicle-details")
 async def extract_vehicle_details(
-    image: UploadFile = File(...),
+    image: Optional[UploadFile] = File(None),
+    image_ref: Optional[str] = Form(None),
     van_number: str = Form(...)
 ):
     """
     Extract vehicle details from image using vision AI
     Returns: vehicle condition, damage assessment, driver safety notes, etc.
+    Send the photo as a multipart `image` (stored in the blob store on the way through)
+    or an `image_ref` from a previous upload. The response includes image_ref for /api/assets/create.
     """
     try:
         print(f"🤖 Processing image for van {van_number}")
         
-        # Read image file
-        image_data = await image.read()
-        
-        # Convert to base64
-        image_base64 = base64.b64encode(image_data).decode('utf-8')
+        store = get_blob_store()
+        if image is not None:
+            if image.content_type and not image.content_type.startswith("image/"):
+                raise NotAnImage(f"Expected an image upload, got {image.content_type}")
+            image_ref = (await store.save_upload(image))["image_ref"]
+        elif not image_ref or store.path(image_ref) is None:
+            raise HTTPException(status_code=400, detail="Send an image upload or a known image_ref")
         
         # For now, return a structured response
         # In production, integrate with Claude 3 Vision or GPT-4 Vision
         
         # Try to use Claude AI if available
-        details = await analyze_vehicle_image(image_base64, van_number)
+        details = await analyze_vehicle_image(image_ref, van_number)
         
         return {
             "status": "success",
             "details": details,
-            "van_number": van_number
+            "van_number": van_number,
+            "image_ref": image_ref
         }
         
+    except HTTPException:
+        raise
+    except BlobTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except NotAnImage as e:
+        raise HTTPException(status_code=415, detail=str(e))
     except Exception as e:
         print(f"❌ Error extracting details: {e}")
         return {
@@ -74,16 +89,25 @@ async def extract_vehicle_details(
         }
 
 
-async def analyze_vehicle_image(image_base64: str, van_number: str) -> str:
+def _read_base64(path: str) -> str:
+    with open(path, "rb") as f:
+        return base64.b64encode(f.read()).decode('utf-8')
+
+
+async def analyze_vehicle_image(image_ref: str, van_number: str) -> str:
     """
     Analyze vehicle image and extract details
     Could integrate with Claude 3 Vision, GPT-4 Vision, etc.
+    The photo is read from the blob store and base64-encoded only here, for the vision API call.
     """
     try:
         # Try to import and use Claude API if available
         try:
             import anthropic
             
+            store = get_blob_store()
+            image_base64 = await run_in_threadpool(_read_base64, store.path(image_ref))
+            
             client = anthropic.Anthropic()
             
             message = client.messages.create(
@@ -97,7 +121,7 @@ async def analyze_vehicle_image(image_base64: str, van_number: str) -> str:
                                 "type": "image",
                                 "source": {
                                     "type": "base64",
-                                    "media_type": "image/jpeg",
+                                    "media_type": store.content_type(image_ref),
                                     "data": image_base64,
                                 },
                             },
@@ -1,14 +1,34 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse
+from typing import Optional
 from pydantic import BaseModel
 import sys
 import os
 import json
+import base64
+import binascii
 from datetime import datetime
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from salesforce_service import SalesforceService
+from async_salesforce_service import AsyncSalesforceService
+from record_set import RecordSet
+from http_utils import async_ndjson_response, error_status, ndjson_response, record_set_response
+from vehicle_replica import get_replica, resolve_source
+from list_query import ListQuery
+from conditional_get import replica_validators
+from blob_store import BlobTooLarge, NotAnImage, get_blob_store
 
 router = APIRouter(prefix="/api/assets", tags=["assets"])
 
+# Vehicle__c text field the photo's blob reference is written to (skipped if the org doesn't have it)
+IMAGE_REF_FIELD = os.getenv("SF_IMAGE_REF_FIELD", "Image_Ref__c")
+
+
+async def _image_ref_field(sf: AsyncSalesforceService) -> Optional[str]:
+    """IMAGE_REF_FIELD if Vehicle__c has it (from the describe cache), else None"""
+    fields = await sf.describe_fields("Vehicle__c")
+    return IMAGE_REF_FIELD if fields and IMAGE_REF_FIELD in fields else None
+
 class VehicleAsset(BaseModel):
     van_number: str
     registration_number: str
@@ -18,20 +38,81 @@ class VehicleAsset(BaseModel):
     vehicle_type: str
     description: str
     ai_details: str = ""
-    image_data: str = ""  # Base64 encoded image
+    image_ref: str = ""  # From POST /api/assets/photos or /api/ai/extract-vehicle-details
+    image_data: str = ""  # Deprecated: base64 encoded image - moved into the blob store on arrival
+
+
+@router.post("/photos")
+async def upload_photo(image: UploadFile = File(...)):
+    """
+    Store a vehicle photo (multipart, raw bytes) in the content-addressed blob store.
+    Returns {image_ref, size, content_type, deduplicated}; pass image_ref to /create or the AI routes.
+    """
+    try:
+        if image.content_type and not image.content_type.startswith("image/"):
+            raise NotAnImage(f"Expected an image upload, got {image.content_type}")
+        return await get_blob_store().save_upload(image)
+    except BlobTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except NotAnImage as e:
+        raise HTTPException(status_code=415, detail=str(e))
+    except Exception as e:
+        print(f"❌ Error storing photo: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/photos/{image_ref}")
+async def get_photo(image_ref: str):
+    """A stored photo - cacheable forever, since the reference is the hash of its content"""
+    store = get_blob_store()
+    path = store.path(image_ref)
+    if path is None:
+        raise HTTPException(status_code=404, detail=f"Photo {image_ref} not found")
+    return FileResponse(
+        path,
+        media_type=store.content_type(image_ref),
+        headers={"Cache-Control": "public, max-age=31536000, immutable"},
+    )
+
+
+def _decode_and_store(image_data: str) -> str:
+    """Legacy base64 image_data -> blob reference (CPU and disk bound - runs in the threadpool)"""
+    # Older clients send a data URL ("data:image/jpeg;base64,...") or bare base64
+    try:
+        data = base64.b64decode(image_data.split(",", 1)[-1], validate=True)
+    except (binascii.Error, ValueError):
+        raise HTTPException(status_code=400, detail="image_data is not valid base64")
+    try:
+        return get_blob_store().save_bytes(data)["image_ref"]
+    except BlobTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except NotAnImage as e:
+        raise HTTPException(status_code=415, detail=str(e))
+
+
+async def _resolve_image_ref(asset: VehicleAsset) -> Optional[str]:
+    """The asset's blob reference - validating image_ref, or storing a legacy base64 image_data"""
+    if asset.image_ref:
+        if get_blob_store().path(asset.image_ref) is None:
+            raise HTTPException(status_code=400, detail=f"Unknown image_ref {asset.image_ref}")
+        return asset.image_ref
+    if asset.image_data:
+        return await run_in_threadpool(_decode_and_store, asset.image_data)
+    return None
 
 
 @router.post("/create")
-def create_asset(asset: VehicleAsset):
+async def create_asset(asset: VehicleAsset):
     """
     Create a new vehicle asset with all details
     Stores image, driver history, AI analysis, etc.
     """
     try:
-        sf = SalesforceService()
+        sf = AsyncSalesforceService()
         
         print(f"📝 Creating asset for vehicle: {asset.van_number}")
-        print(f"📋 Asset data received: van={asset.van_number}, reg={asset.registration_number}, tracking={asset.tracking_number}")
+        image_ref = await _resolve_image_ref(asset)
+        print(f"📋 Asset data received: van={asset.van_number}, reg={asset.registration_number}, tracking={asset.tracking_number}, image={image_ref}")
         
         # First, check if vehicle already exists by van number
         existing_vehicle_query = f"""
@@ -40,7 +121,7 @@ def create_asset(asset: VehicleAsset):
             LIMIT 1
         """
         
-        result = sf.sf.query_all(existing_vehicle_query)
+        result = await sf.query_all(existing_vehicle_query)
         existing_records = result.get('records', [])
         
         # Prepare vehicle data - MINIMAL fields only
@@ -50,6 +131,13 @@ def create_asset(asset: VehicleAsset):
             "Tracking_Number__c": asset.tracking_number
         }
         
+        # Link the photo to the record so GET /photos/{image_ref} can be traced back to the vehicle
+        image_ref_field = await _image_ref_field(sf) if image_ref else None
+        if image_ref_field:
+            vehicle_data[image_ref_field] = image_ref
+        elif image_ref:
+            print(f"⚠️ Vehicle__c has no {IMAGE_REF_FIELD} field - image_ref is only returned to the client")
+        
         print(f"📋 Minimal vehicle data to save: {vehicle_data}")
         
         if existing_records:
@@ -57,7 +145,7 @@ def create_asset(asset: VehicleAsset):
             vehicle_id = existing_records[0].get('Id')
             current_status = existing_records[0].get('Status__c', 'Unknown')
             print(f"✏️ Updating existing vehicle: {vehicle_id} (current status: {current_status})")
-            sf.sf.Vehicle__c.update(vehicle_id, vehicle_data)
+            await sf.update("Vehicle__c", vehicle_id, vehicle_data)
             vehicle_id_result = vehicle_id
         else:
             # Create new vehicle
@@ -65,32 +153,38 @@ def create_asset(asset: VehicleAsset):
             # Add required fields for creation
             vehicle_data["Name"] = asset.vehicle_name or f"Vehicle {asset.van_number}"
             vehicle_data["Status__c"] = "Spare"
-            result = sf.sf.Vehicle__c.create(vehicle_data)
+            result = await sf.create("Vehicle__c", vehicle_data)
             vehicle_id_result = result['id']
         
         print(f"✅ Vehicle saved with ID: {vehicle_id_result}")
+        get_replica().sync_soon()
         
         return {
             "status": "success",
             "message": "Asset created successfully",
             "vehicle_id": vehicle_id_result,
-            "van_number": asset.van_number
+            "van_number": asset.van_number,
+            "image_ref": image_ref,
+            "image_ref_saved": image_ref_field is not None,
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"❌ Error creating asset: {e}")
         import traceback
         traceback.print_exc()
-        raise HTTPException(status_code=500, detail=str(e))
+        raise HTTPException(status_code=error_status(e), detail=str(e))
 
 
 @router.get("/by-van/{van_number}")
-def get_asset_by_van(van_number: str):
+async def get_asset_by_van(van_number: str):
     """Get asset details by van number"""
     try:
-        sf = SalesforceService()
+        sf = AsyncSalesforceService()
         
         print(f"🔍 Retrieving asset: {van_number}")
+        image_ref_field = await _image_ref_field(sf)
         
         # Query vehicle with all details
         query = f"""
@@ -103,13 +197,13 @@ def get_asset_by_van(van_number: str):
                 Vehicle_Type__c,
                 Description__c,
                 Status__c,
-                CreatedDate
+                CreatedDate{", " + image_ref_field if image_ref_field else ""}
             FROM Vehicle__c
             WHERE Van_Number__c = '{van_number}'
             LIMIT 1
         """
         
-        result = sf.sf.query_all(query)
+        result = await sf.query_all(query)
         records = result.get('records', [])
         
         if not records:
@@ -126,26 +220,91 @@ def get_asset_by_van(van_number: str):
             "vehicle_type": vehicle.get('Vehicle_Type__c'),
             "description": vehicle.get('Description__c'),
             "status": vehicle.get('Status__c'),
-            "created_date": vehicle.get('CreatedDate')
+            "created_date": vehicle.get('CreatedDate'),
+            "image_ref": vehicle.get(image_ref_field) if image_ref_field else None,
         }
         
     except HTTPException:
         raise
     except Exception as e:
         print(f"❌ Error retrieving asset: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+        raise HTTPException(status_code=error_status(e), detail=str(e))
+
+
+# Response field -> Vehicle__c column
+ASSET_ROW_COLUMNS = {
+    "id": "Id",
+    "name": "Name",
+    "van_number": "Van_Number__c",
+    "registration_number": "Reg_No__c",
+    "tracking_number": "Tracking_Number__c",
+    "vehicle_type": "Vehicle_Type__c",
+    "description": "Description__c",
+    "status": "Status__c",
+    "created_date": "CreatedDate",
+}
+
 
+def _to_asset_row(record: dict) -> dict:
+    """Shape a Vehicle__c record for the /all response"""
+    return {field: record.get(column) for field, column in ASSET_ROW_COLUMNS.items()}
 
-@router.get("/all")
-def get_all_assets():
-    """Get all uploaded vehicle assets"""
+
+# ?sort= name -> Vehicle__c field (Id breaks ties)
+ASSET_SORT_FIELDS = {
+    "created_date": "CreatedDate",
+    "name": "Name",
+    "van_number": "Van_Number__c",
+    "registration_number": "Reg_No__c",
+}
+
+
+@router.get("/all", dependencies=[Depends(replica_validators)])
+async def get_all_assets(
+    stream: bool = False,
+    source: str = "auto",
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    sort: str = "created_date",
+    order: str = "desc",
+    status: Optional[str] = None,
+    trade_group: Optional[str] = None,
+    vehicle_type: Optional[str] = None,
+    territory: Optional[str] = None,
+):
+    """
+    Get all uploaded vehicle assets.
+    ?stream=true returns NDJSON (one asset per line) as pages arrive from Salesforce.
+    source: 'auto' (replica when fresh, else live), 'replica' or 'live'.
+    limit/cursor page through the list (pass back next_cursor); sort/order pick a stable
+    order; status, trade_group, vehicle_type and territory filter (comma-separated = any of).
+    """
     try:
-        sf = SalesforceService()
+        list_query = ListQuery.from_params(
+            sort, order, limit, cursor, ASSET_SORT_FIELDS,
+            status=status, trade_group=trade_group, vehicle_type=vehicle_type, territory=territory,
+        )
+        
+        replica = resolve_source(source)
+        if replica:
+            page, next_cursor = list_query.apply(replica.records("Vehicle__c"))
+            rows = RecordSet.from_records(page).project(ASSET_ROW_COLUMNS)
+            if stream:
+                return ndjson_response(rows.iter_dicts())
+            return record_set_response(
+                {"total": len(rows), "next_cursor": next_cursor, "source": "replica",
+                 "replica_lag_seconds": replica.sync_lag_seconds()},
+                "assets",
+                rows,
+            )
+        
+        sf = AsyncSalesforceService()
         
         print(f"📋 Retrieving all assets...")
         
-        # Query all vehicles (no status filter - show all vehicles)
-        query = """
+        # Query vehicles - filters, cursor and page size applied by Salesforce
+        conditions = list_query.soql_conditions()
+        query = f"""
             SELECT 
                 Id, 
                 Name, 
@@ -157,35 +316,25 @@ def get_all_assets():
                 Status__c,
                 CreatedDate
             FROM Vehicle__c
-            ORDER BY CreatedDate DESC
+            {"WHERE " + " AND ".join(conditions) if conditions else ""}
+            {list_query.soql_order_limit(probe=not stream)}
         """
         
-        result = sf.sf.query_all(query)
-        records = result.get('records', [])
+        if stream:
+            return await async_ndjson_response(_to_asset_row(r) async for r in sf.iter_soql(query))
         
-        print(f"✅ Retrieved {len(records)} assets")
-        
-        assets = []
-        for record in records:
-            assets.append({
-                "id": record.get('Id'),
-                "name": record.get('Name'),
-                "van_number": record.get('Van_Number__c'),
-                "registration_number": record.get('Reg_No__c'),
-                "tracking_number": record.get('Tracking_Number__c'),
-                "vehicle_type": record.get('Vehicle_Type__c'),
-                "description": record.get('Description__c'),
-                "status": record.get('Status__c'),
-                "created_date": record.get('CreatedDate')
-            })
+        records = await sf.query_records(query)
+        rows, next_cursor = list_query.finish_page(records.rows, records.get)
+        assets = RecordSet(records.columns, rows).project(ASSET_ROW_COLUMNS)
         
-        return {
-            "total": len(assets),
-            "assets": assets
-        }
+        print(f"✅ Retrieved {len(assets)} assets")
+        
+        return record_set_response({"total": len(assets), "next_cursor": next_cursor}, "assets", assets)
         
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"❌ Error retrieving assets: {e}")
         import traceback
         traceback.print_exc()
-        raise HTTPException(status_code=500, detail=str(e))
+        raise HTTPException(status_code=error_status(e), detail=str(e))
@@ -1,96 +1,101 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import FileResponse
+from starlette.background import BackgroundTask
+from datetime import date, datetime, timedelta, timezone
+from typing import Optional
 import sys
 import os
+import tempfile
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from salesforce_service import SalesforceService
+from salesforce_service import SalesforceService, batch_records
+from async_salesforce_service import AsyncSalesforceService
+from http_utils import async_ndjson_response, error_status, event_stream_response, ndjson_response
+from vehicle_replica import get_replica, resolve_source
+from cost_rollup import get_cost_rollup
+from due_index import DUE_KINDS, DUE_LIST_FIELDS, MOT_DATE_FIELDS, TAX_DATE_FIELDS, get_due_index
+from dashboard_snapshot import SnapshotPublisher
+from list_query import ListQuery, soql_quote
+from conditional_get import check_replica_validators
+from pivot_cube import PIVOT_DIMENSIONS, PIVOT_FIELDS, PivotCube
+from trend_store import get_trend_store
+from dashboard_events import dashboard_events
+from api_usage import get_api_usage
 
 router = APIRouter(prefix="/api/dashboard", tags=["dashboard"])
 
 
-def get_mot_due_count(sf):
-    """Helper function to get MOT due count"""
-    print("🔄 [get_mot_due_count] Starting MOT query...")
-    try:
-        query = """
-            SELECT Id, Name
-            FROM Vehicle__c
-            WHERE Next_MOT_Date__c != NULL AND Next_MOT_Date__c <= NEXT_N_DAYS:30
-        """
-        print(f"🔍 [get_mot_due_count] Executing: {query.strip()}")
-        vehicles = sf.execute_soql(query)
-        count = len(vehicles) if vehicles else 0
-        print(f"✅ [get_mot_due_count] Found {count} vehicles with Next_MOT_Date__c <= NEXT_N_DAYS:30")
-        if count > 0 and vehicles:
-            print(f"   Sample: {vehicles[0]}")
-        return count
-    except Exception as e:
-        print(f"⚠️  [get_mot_due_count] Query failed: {e}")
-        import traceback
-        traceback.print_exc()
-        return 0
+def due_where(field: str, days: int = 30) -> str:
+    return f"{field} != NULL AND {field} <= NEXT_N_DAYS:{days}"
 
 
-def get_tax_due_count(sf):
-    """Helper function to get Tax due count"""
-    print("🔄 [get_tax_due_count] Starting Tax query...")
-    try:
-        query = """
-            SELECT Id, Name
-            FROM Vehicle__c
-            WHERE Next_Tax_Date__c != NULL AND Next_Tax_Date__c <= NEXT_N_DAYS:30
-        """
-        print(f"🔍 [get_tax_due_count] Executing: {query.strip()}")
-        vehicles = sf.execute_soql(query)
-        count = len(vehicles) if vehicles else 0
-        print(f"✅ [get_tax_due_count] Found {count} vehicles with Next_Tax_Date__c <= NEXT_N_DAYS:30")
-        if count > 0 and vehicles:
-            print(f"   Sample: {vehicles[0]}")
-        return count
-    except Exception as e:
-        print(f"⚠️  [get_tax_due_count] Next_Tax_Date__c field failed: {e}")
-        # Next_Tax_Date__c doesn't exist - return 0
-        return 0
+def dashboard_validators(request: Request, source: str = "auto"):
+    """Data-version ETag for dashboard reads: the replica's version plus the published snapshot"""
+    published_at = dashboard_snapshots.published_at
+    check_replica_validators(request, source, published_at, published_at)
+
+
+@router.get("/replica-status")
+def replica_status():
+    """Sync lag and row counts of the local Salesforce replica"""
+    return get_replica().status()
+
+
+@router.get("/snapshot-status")
+def snapshot_status():
+    """Age and refresh interval of the background dashboard snapshot, and how many live streams it feeds"""
+    return {**dashboard_snapshots.status(), "stream_subscribers": dashboard_events.subscriber_count}
+
+
+@router.get("/api-usage")
+def api_usage_metrics():
+    """
+    Salesforce org API usage (from the Sforce-Limit-Info header of the latest response)
+    and the refresh intervals / TTLs it currently stretches
+    """
+    usage = get_api_usage()
+    replica = get_replica()
+    describe_ttl = float(os.getenv("DESCRIBE_CACHE_TTL", "3600"))
+    max_lag = float(os.getenv("REPLICA_MAX_LAG_SECONDS", "300"))
+    return {
+        **usage.status(),
+        "effective": {
+            "replica_sync_interval_seconds": usage.stretch(replica.interval),
+            "replica_max_lag_seconds": usage.stretch(max_lag),
+            "dashboard_snapshot_interval_seconds": dashboard_snapshots.effective_interval,
+            "describe_cache_ttl_seconds": usage.stretch(describe_ttl),
+        },
+    }
 
 
 @router.get("/debug-statuses")
-def debug_statuses():
+async def debug_statuses():
     """
     DEBUG: Show all actual status values in Salesforce database
     """
     try:
-        sf = SalesforceService()
+        sf = AsyncSalesforceService()
         
-        # Get all vehicles with their status values
-        query = "SELECT Status__c FROM Vehicle__c"
-        vehicles = sf.execute_soql(query)
-        
-        # Find unique status values
-        unique_statuses = set()
-        status_counts = {}
-        
-        for vehicle in vehicles:
-            status = vehicle.get("Status__c")
-            if status:
-                unique_statuses.add(status)
-                status_counts[status] = status_counts.get(status, 0) + 1
+        # Let Salesforce count per status - one row per status comes back
+        status_counts = await sf.count_by("Vehicle__c", "Status__c")
+        unique_statuses = sorted(status for status in status_counts if status)
         
         return {
-            "total_vehicles": len(vehicles),
-            "unique_statuses": sorted(list(unique_statuses)),
-            "status_counts": status_counts,
+            "total_vehicles": sum(status_counts.values()),
+            "unique_statuses": unique_statuses,
+            "status_counts": {status: status_counts[status] for status in unique_statuses},
         }
     except Exception as e:
         print(f"❌ Debug error: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+        raise HTTPException(status_code=error_status(e), detail=str(e))
 
 
 @router.get("/debug-mot-data")
-def debug_mot_data():
+async def debug_mot_data():
     """
     DEBUG: Show sample vehicles with MOT data to understand the query issue
     """
     try:
-        sf = SalesforceService()
+        sf = AsyncSalesforceService()
         
         # Get a sample of vehicles with various fields to understand the data
         query = """
@@ -101,7 +106,7 @@ def debug_mot_data():
             LIMIT 10
         """
         try:
-            vehicles = sf.execute_soql(query)
+            vehicles = await sf.execute_soql(query)
             return {
                 "message": "Sample MOT vehicles (next 10 due)",
                 "count": len(vehicles),
@@ -117,7 +122,7 @@ def debug_mot_data():
                 ORDER BY Next_MOT_Date__c ASC
                 LIMIT 10
             """
-            vehicles = sf.execute_soql(query_simple)
+            vehicles = await sf.execute_soql(query_simple)
             return {
                 "message": "Sample MOT vehicles (next 10 due)",
                 "count": len(vehicles),
@@ -135,12 +140,12 @@ def debug_mot_data():
 
 
 @router.get("/debug-fields")
-def debug_fields():
+async def debug_fields():
     """
     DEBUG: Show all available fields on Vehicle__c object by fetching a sample record
     """
     try:
-        sf = SalesforceService()
+        sf = AsyncSalesforceService()
         
         # Try to fetch a sample vehicle with all common date fields we know about
         query = """
@@ -154,7 +159,7 @@ def debug_fields():
             LIMIT 1
         """
         try:
-            vehicles = sf.execute_soql(query)
+            vehicles = await sf.execute_soql(query)
             if vehicles:
                 sample = vehicles[0]
                 # Show which date fields have values
@@ -173,7 +178,7 @@ def debug_fields():
             print(f"Query with specific fields failed: {e}")
             # Try fetching just basic info
             query_basic = "SELECT Id, Name FROM Vehicle__c LIMIT 1"
-            vehicles_basic = sf.execute_soql(query_basic)
+            vehicles_basic = await sf.execute_soql(query_basic)
             if vehicles_basic:
                 return {
                     "message": "Could not query specific date fields. Trying alternative approach...",
@@ -194,102 +199,142 @@ def debug_fields():
         }
 
 
-@router.get("/vehicle-summary")
-def get_vehicle_summary():
+# ACTUAL Salesforce status values
+# Based on user's Salesforce data:
+# Allocated: 233, Reserved: 4, Sold: 15, Spare: 12, Spare Not Available: 4, Written Off: 21
+STATUS_MAPPING = {
+    # Allocated
+    "Allocated": "allocated",
+    "allocated": "allocated",
+    
+    # Garage/Service/Under Repair
+    "Garage": "garage",
+    "garage": "garage",
+    "In Garage": "garage",
+    "Under Repair": "garage",
+    
+    # Due Service
+    "Due for Service": "due_service",
+    "Due_Service": "due_service",
+    "Service Due": "due_service",
+    
+    # Spare Ready (includes all spare variants)
+    "Spare Ready": "spare_ready",
+    "Spare_Ready": "spare_ready",
+    "Spare": "spare_ready",
+    "Spare Tankers": "spare_ready",
+    "Spare in Garage": "spare_ready",
+    "Spare Not Available": "spare_ready",  # Include in spare count
+    
+    # Reserved
+    "Reserved": "reserved",
+    "reserved": "reserved",
+    
+    # Written Off
+    "Written Off": "written_off",
+    "Written_Off": "written_off",
+    
+    # Note: "Sold" not mapped - vehicles that are sold are not counted in active fleet
+    # Note: Unmapped statuses are silently ignored
+}
+
+
+def bucket_status_counts(status_values_found: dict) -> dict:
+    """Fold raw Status__c counts into the dashboard buckets"""
+    status_counts = {
+        "allocated": 0,
+        "garage": 0,
+        "due_service": 0,
+        "spare_ready": 0,
+        "reserved": 0,
+        "written_off": 0,
+    }
+    unmapped_statuses = {}
+    for sf_status, count in status_values_found.items():
+        response_key = STATUS_MAPPING.get(sf_status)
+        if response_key:
+            status_counts[response_key] += count
+        else:
+            # Track unmapped statuses
+            unmapped_statuses[sf_status] = count
+    
+    print(f"✅ Status values found in Salesforce:")
+    for status, count in sorted(status_values_found.items()):
+        print(f"   '{status}': {count}")
+    print(f"✅ Mapped status counts: {status_counts}")
+    if unmapped_statuses:
+        print(f"⚠️  Unmapped statuses (not included in counts): {unmapped_statuses}")
+    return status_counts
+
+
+def count_due(vehicles, field: str, days: int = 30) -> int:
+    """Count vehicles whose date `field` is set and on/before today + days (same as NEXT_N_DAYS:days)"""
+    cutoff = (date.today() + timedelta(days=days)).isoformat()
+    return sum(1 for v in vehicles if v.get(field) and v[field][:10] <= cutoff)
+
+
+def summarize_vehicles(vehicles, mot_field, tax_field):
+    """Vehicle summary computed from full Vehicle__c records (replica or snapshot - no count queries)"""
+    status_values_found = {}
+    for vehicle in vehicles:
+        sf_status = vehicle.get("Status__c")
+        if sf_status:
+            status_values_found[sf_status] = status_values_found.get(sf_status, 0) + 1
+    return {
+        "total": len(vehicles),
+        **bucket_status_counts(status_values_found),
+        "mot_due": count_due(vehicles, mot_field) if mot_field else 0,
+        "tax_due": count_due(vehicles, tax_field) if tax_field else 0,
+    }
+
+
+@router.get("/vehicle-summary", dependencies=[Depends(dashboard_validators)])
+async def get_vehicle_summary(source: str = "auto"):
     """
     Get vehicle summary counts by status from Salesforce.
+    source: 'auto' (snapshot, else replica when fresh, else live), 'replica' or 'live'.
     """
     try:
-        sf = SalesforceService()
+        if source == "auto":
+            snapshot, age = dashboard_snapshots.current()
+            if snapshot:
+                return {**snapshot["summary"], "source": snapshot["source"], "snapshot_age_seconds": age}
         
-        # Fetch ALL vehicles
-        all_vehicles_query = "SELECT Id, Status__c FROM Vehicle__c"
-        vehicles = sf.execute_soql(all_vehicles_query)
-        total = len(vehicles)
+        sf = AsyncSalesforceService()
+        mot_field = await sf.first_existing_field("Vehicle__c", MOT_DATE_FIELDS)
+        tax_field = await sf.first_existing_field("Vehicle__c", TAX_DATE_FIELDS)
         
-        print(f"📊 Total vehicles fetched: {total}")
+        replica = resolve_source(source)
+        if replica:
+            return {
+                **summarize_vehicles(replica.records("Vehicle__c"), mot_field, tax_field),
+                "source": "replica",
+                "replica_lag_seconds": replica.sync_lag_seconds(),
+            }
         
-        # Initialize status counts
-        status_counts = {
-            "allocated": 0,
-            "garage": 0,
-            "due_service": 0,
-            "spare_ready": 0,
-            "reserved": 0,
-            "written_off": 0,
-        }
+        # Status counts (GROUP BY) and MOT/Tax counts (COUNT()) in ONE Composite Batch round trip.
+        # MOT/Tax are only counted when the org actually has a due-date field for them.
+        queries = {"statuses": "SELECT Status__c, COUNT(Id) cnt FROM Vehicle__c GROUP BY Status__c"}
+        if mot_field:
+            queries["mot_due"] = f"SELECT COUNT() FROM Vehicle__c WHERE {due_where(mot_field)}"
+        if tax_field:
+            queries["tax_due"] = f"SELECT COUNT() FROM Vehicle__c WHERE {due_where(tax_field)}"
+        batch = await sf.execute_batch(queries)
+        # A failed count is an error, not a zero
+        for name in queries:
+            batch_records(batch, name)
         
-        # ACTUAL Salesforce status values
-        # Based on user's Salesforce data:
-        # Allocated: 233, Reserved: 4, Sold: 15, Spare: 12, Spare Not Available: 4, Written Off: 21
-        status_mapping = {
-            # Allocated
-            "Allocated": "allocated",
-            "allocated": "allocated",
-            
-            # Garage/Service/Under Repair
-            "Garage": "garage",
-            "garage": "garage",
-            "In Garage": "garage",
-            "Under Repair": "garage",
-            
-            # Due Service
-            "Due for Service": "due_service",
-            "Due_Service": "due_service",
-            "Service Due": "due_service",
-            
-            # Spare Ready (includes all spare variants)
-            "Spare Ready": "spare_ready",
-            "Spare_Ready": "spare_ready",
-            "Spare": "spare_ready",
-            "Spare Tankers": "spare_ready",
-            "Spare in Garage": "spare_ready",
-            "Spare Not Available": "spare_ready",  # Include in spare count
-            
-            # Reserved
-            "Reserved": "reserved",
-            "reserved": "reserved",
-            
-            # Written Off
-            "Written Off": "written_off",
-            "Written_Off": "written_off",
-            
-            # Note: "Sold" not mapped - vehicles that are sold are not counted in active fleet
-            # Note: Unmapped statuses are silently ignored
-        }
+        counts_by_status = {r.get("Status__c"): int(r.get("cnt") or 0) for r in batch["statuses"]["records"]}
+        total = sum(counts_by_status.values())
         
-        # Aggregate locally
-        status_values_found = {}
-        unmapped_statuses = {}
-        for vehicle in vehicles:
-            sf_status = vehicle.get("Status__c")
-            if sf_status:
-                if sf_status not in status_values_found:
-                    status_values_found[sf_status] = 0
-                status_values_found[sf_status] += 1
-                
-                response_key = status_mapping.get(sf_status)
-                if response_key:
-                    status_counts[response_key] += 1
-                else:
-                    # Track unmapped statuses
-                    if sf_status not in unmapped_statuses:
-                        unmapped_statuses[sf_status] = 0
-                    unmapped_statuses[sf_status] += 1
-        
-        print(f"✅ Status values found in Salesforce:")
-        for status, count in sorted(status_values_found.items()):
-            print(f"   '{status}': {count}")
-        print(f"✅ Mapped status counts: {status_counts}")
-        if unmapped_statuses:
-            print(f"⚠️  Unmapped statuses (not included in counts): {unmapped_statuses}")
+        print(f"📊 Total vehicles counted: {total}")
         
-        # Get MOT and Tax due counts using helper functions
-        print("📊 Getting MOT due count...")
-        mot_due = get_mot_due_count(sf)
+        status_counts = bucket_status_counts(
+            {status: count for status, count in counts_by_status.items() if status}
+        )
         
-        print("📊 Getting Tax due count...")
-        tax_due = get_tax_due_count(sf)
+        mot_due = batch["mot_due"]["totalSize"] if mot_field else 0
+        tax_due = batch["tax_due"]["totalSize"] if tax_field else 0
         
         print(f"📊 SUMMARY RESULT: MOT={mot_due}, Tax={tax_due}")
         
@@ -298,194 +343,657 @@ def get_vehicle_summary():
             **status_counts,
             "mot_due": mot_due,
             "tax_due": tax_due,
+            "source": "live",
         }
         
     except Exception as e:
         print(f"❌ Dashboard error: {e}")
         import traceback
         traceback.print_exc()
-        raise HTTPException(status_code=500, detail=str(e))
+        raise HTTPException(status_code=error_status(e), detail=str(e))
+
+
+MAINTENANCE_COST_WHERE = "(Type__c LIKE '%Service%' OR Type__c LIKE '%Maint%')"
+
+
+def cost_queries(vehicle_filter: str) -> dict:
+    """
+    Total and maintenance-related (Type__c contains Service or Maint) cost per vehicle,
+    restricted by vehicle_filter (a Vehicle__c condition such as an IN-list or semi-join; '' = all)
+    """
+    total_where = f"WHERE {vehicle_filter}" if vehicle_filter else ""
+    maint_where = f"WHERE {vehicle_filter} AND {MAINTENANCE_COST_WHERE}" if vehicle_filter else f"WHERE {MAINTENANCE_COST_WHERE}"
+    return {
+        "costs": f"""
+            SELECT Vehicle__c, SUM(Payment_value__c) total
+            FROM Vehicle_Cost__c
+            {total_where}
+            GROUP BY Vehicle__c
+        """,
+        "maintenance_costs": f"""
+            SELECT Vehicle__c, SUM(Payment_value__c) maintenance_total
+            FROM Vehicle_Cost__c
+            {maint_where}
+            GROUP BY Vehicle__c
+        """,
+    }
 
 
-@router.get("/vehicles-by-status/{status}")
-def get_vehicles_by_status(status: str):
+def apply_cost_results(vehicles, batch):
+    """Attach batched cost aggregates to vehicle records (in place)"""
+    cost_map = {r.get('Vehicle__c'): r.get('total', 0) for r in batch_records(batch, "costs")}
+    maint_map = {r.get('Vehicle__c'): r.get('maintenance_total', 0) for r in batch_records(batch, "maintenance_costs")}
+    for v in vehicles:
+        vid = v.get('Id')
+        v['service_cost'] = cost_map.get(vid, 0)
+        v['maintenance_cost'] = maint_map.get(vid, 0)
+    return vehicles
+
+
+async def attach_vehicle_costs(sf, vehicles):
+    """Aggregate cost data from Vehicle_Cost__c onto each vehicle record (in place)"""
+    vehicle_ids = [v.get('Id') for v in vehicles if v.get('Id')]
+    if not vehicle_ids:
+        return vehicles
+    ids_escaped = ", ".join([f"'{vid}'" for vid in vehicle_ids])
+    batch = await sf.execute_batch(cost_queries(f"Vehicle__c IN ({ids_escaped})"))
+    return apply_cost_results(vehicles, batch)
+
+
+async def _iter_vehicles_with_costs(sf, query, rollup=None):
+    """
+    Stream vehicles page by page. Costs come from the rollup when given,
+    otherwise from a per-page aggregate so the IN-list stays one page long.
+    """
+    async for page in sf.iter_soql_pages(query):
+        if rollup:
+            rollup.attach_costs(page)
+        else:
+            await attach_vehicle_costs(sf, page)
+        for vehicle in page:
+            yield vehicle
+
+
+# Map friendly status names to Salesforce values (allow multiple SF statuses)
+STATUS_FILTERS = {
+    "allocated": ["Allocated"],
+    "garage": ["Garage"],
+    "due_service": ["Due for Service", "Service Due", "Due_Service"],
+    "spare_ready": ["Spare", "Spare Not Available"],  # ACTUAL Salesforce values only
+    "reserved": ["Reserved"],
+    "written_off": ["Written Off"],
+    "sold": ["Sold"],
+    "total": [],  # Empty = return ALL vehicles
+    "current": [],  # Empty = return ALL vehicles
+}
+
+STATUS_LIST_FIELDS = [
+    "Id", "Name", "Reg_No__c", "Van_Number__c", "Status__c",
+    "Trade_Group__c", "Vehicle_Type__c", "Make_Model__c",
+    "Last_Service_Date__c", "Next_Service_Date__c",
+    "Last_MOT_Date__c", "Next_MOT_Date__c", "Service_Territory__c",
+]
+
+
+# ?sort= name -> Vehicle__c field (Id breaks ties)
+STATUS_SORT_FIELDS = {
+    "name": "Name",
+    "van_number": "Van_Number__c",
+    "registration_number": "Reg_No__c",
+    "next_service": "Next_Service_Date__c",
+    "next_mot": "Next_MOT_Date__c",
+}
+
+
+@router.get("/vehicles-by-status/{status}", dependencies=[Depends(dashboard_validators)])
+async def get_vehicles_by_status(
+    status: str,
+    stream: bool = False,
+    source: str = "auto",
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    sort: str = "name",
+    order: str = "asc",
+    trade_group: Optional[str] = None,
+    vehicle_type: Optional[str] = None,
+    territory: Optional[str] = None,
+):
     """
-    Get all vehicles with a specific status
+    Get all vehicles with a specific status.
+    ?stream=true returns NDJSON (one vehicle per line) as pages arrive from Salesforce.
+    source: 'auto' (snapshot, else replica when fresh, else live), 'replica' or 'live'.
+    Costs are joined from the maintained cost rollup; source=live (or a rollup whose replica
+    isn't fresh) falls back to aggregating Vehicle_Cost__c in Salesforce.
+    limit/cursor page through the list (pass back next_cursor); sort/order pick a stable
+    order; trade_group, vehicle_type and territory filter (comma-separated = any of).
     """
     try:
-        sf = SalesforceService()
+        list_query = ListQuery.from_params(
+            sort, order, limit, cursor, STATUS_SORT_FIELDS,
+            trade_group=trade_group, vehicle_type=vehicle_type, territory=territory,
+        )
         
-        # Map friendly status names to Salesforce values (allow multiple SF statuses)
-        status_map = {
-            "allocated": ["Allocated"],
-            "garage": ["Garage"],
-            "due_service": ["Due for Service", "Service Due", "Due_Service"],
-            "spare_ready": ["Spare", "Spare Not Available"],  # ACTUAL Salesforce values only
-            "reserved": ["Reserved"],
-            "written_off": ["Written Off"],
-            "sold": ["Sold"],
-            "total": [],  # Empty = return ALL vehicles
-            "current": [],  # Empty = return ALL vehicles
-        }
-
         # 'current' or 'total' -> return all vehicles (no status filter)
-        key = status.lower()
-        sf_values = status_map.get(key)
+        sf_values = STATUS_FILTERS.get(status.lower())
+        if sf_values is None:
+            # Unmapped status: treat as literal
+            sf_values = [status]
+        sf_status = " | ".join(sf_values) if sf_values else 'ALL'
+
+        if source == "auto" and not stream and status.lower() in STATUS_FILTERS:
+            snapshot, age = dashboard_snapshots.current()
+            if snapshot:
+                vehicles, next_cursor = list_query.apply(snapshot["vehicles_by_status"][status.lower()])
+                return {
+                    "status": sf_status,
+                    "count": len(vehicles),
+                    "vehicles": vehicles,
+                    "next_cursor": next_cursor,
+                    "source": snapshot["source"],
+                    "snapshot_age_seconds": age,
+                }
+
+        replica = resolve_source(source)
+        if replica:
+            vehicles, next_cursor = list_query.apply(
+                v for v in replica.records("Vehicle__c")
+                if not sf_values or v.get("Status__c") in sf_values
+            )
+            vehicles = [{field: v.get(field) for field in STATUS_LIST_FIELDS} for v in vehicles]
+            get_cost_rollup().attach_costs(vehicles)
+            if stream:
+                return ndjson_response(vehicles)
+            return {
+                "status": sf_status,
+                "count": len(vehicles),
+                "vehicles": vehicles,
+                "next_cursor": next_cursor,
+                "source": "replica",
+                "replica_lag_seconds": replica.sync_lag_seconds(),
+            }
+
+        sf = AsyncSalesforceService()
         
-        # Build query based on status
-        if key == 'current' or key == 'total' or (sf_values is not None and len(sf_values) == 0):
-            where_clause = ""
-            sf_status = 'ALL'
-        elif sf_values and len(sf_values) > 1:
+        # Build query based on status, plus the request's filters and cursor
+        conditions = []
+        if len(sf_values) > 1:
             # Multiple values: use IN clause
-            values_str = ",".join([f"'{v}'" for v in sf_values])
-            where_clause = f"WHERE Status__c IN ({values_str})"
-            sf_status = " | ".join(sf_values)
-        elif sf_values and len(sf_values) == 1:
+            conditions.append(f"Status__c IN ({', '.join(soql_quote(v) for v in sf_values)})")
+        elif sf_values:
             # Single value: use = clause
-            where_clause = f"WHERE Status__c = '{sf_values[0]}'"
-            sf_status = sf_values[0]
-        else:
-            # Unmapped status: treat as literal
-            where_clause = f"WHERE Status__c = '{status}'"
-            sf_status = status
+            conditions.append(f"Status__c = {soql_quote(sf_values[0])}")
+        conditions += list_query.soql_conditions()
+        where_clause = f"WHERE {' AND '.join(conditions)}" if conditions else ""
 
         query = f"""
-            SELECT Id, Name, Reg_No__c, Van_Number__c, Status__c, 
-                   Trade_Group__c, Vehicle_Type__c, Make_Model__c,
-                   Last_Service_Date__c, Next_Service_Date__c,
-                   Last_MOT_Date__c, Next_MOT_Date__c
+            SELECT {", ".join(STATUS_LIST_FIELDS)}
             FROM Vehicle__c
             {where_clause}
-            ORDER BY Name
+            {list_query.soql_order_limit(probe=not stream)}
         """
         
         print(f"🔍 Query: {query[:100]}...")
-        vehicles = sf.execute_soql(query)
+        rollup = get_cost_rollup()
+        rollup = rollup if source != "live" and rollup.ready else None
+        if stream:
+            return await async_ndjson_response(_iter_vehicles_with_costs(sf, query, rollup))
+        
+        if rollup or list_query.limit:
+            # One page (or rollup costs): fetch the vehicles, then join costs for just those rows
+            vehicles, next_cursor = list_query.finish_page([v async for v in sf.iter_soql(query)])
+            if rollup:
+                rollup.attach_costs(vehicles)
+            else:
+                await attach_vehicle_costs(sf, vehicles)
+            print(f"🔍 Found {len(vehicles)} vehicles with status '{sf_status}'")
+            return {
+                "status": sf_status,
+                "count": len(vehicles),
+                "vehicles": vehicles,
+                "next_cursor": next_cursor,
+                "source": "live",
+            }
+        
+        # Vehicles and both cost aggregates in ONE Composite Batch round trip -
+        # the cost queries select the same vehicles through a semi-join instead of an Id list
+        vehicle_filter = f"Vehicle__c IN (SELECT Id FROM Vehicle__c {where_clause})" if where_clause else ""
+        batch = await sf.execute_batch({"vehicles": query, **cost_queries(vehicle_filter)})
+        vehicles = batch_records(batch, "vehicles")
 
         print(f"🔍 Found {len(vehicles)} vehicles with status '{sf_status}'")
 
-        # If we have vehicles, aggregate cost data from Vehicle_Cost__c
-        if vehicles:
-            vehicle_ids = [v.get('Id') for v in vehicles if v.get('Id')]
-            if vehicle_ids:
-                ids_escaped = ", ".join([f"'{vid}'" for vid in vehicle_ids])
-
-                # Total cost per vehicle
-                cost_query = f"""
-                    SELECT Vehicle__c, SUM(Payment_value__c) total
-                    FROM Vehicle_Cost__c
-                    WHERE Vehicle__c IN ({ids_escaped})
-                    GROUP BY Vehicle__c
-                """
-                cost_results = sf.execute_soql(cost_query)
-                cost_map = {r.get('Vehicle__c'): r.get('total', 0) for r in cost_results}
-
-                # Maintenance-related cost per vehicle (Type__c contains Service or Maint)
-                maint_query = f"""
-                    SELECT Vehicle__c, SUM(Payment_value__c) maintenance_total
-                    FROM Vehicle_Cost__c
-                    WHERE Vehicle__c IN ({ids_escaped}) AND (Type__c LIKE '%Service%' OR Type__c LIKE '%Maint%')
-                    GROUP BY Vehicle__c
-                """
-                maint_results = sf.execute_soql(maint_query)
-                maint_map = {r.get('Vehicle__c'): r.get('maintenance_total', 0) for r in maint_results}
-
-                # Attach cost values to vehicle records
-                for v in vehicles:
-                    vid = v.get('Id')
-                    v['service_cost'] = cost_map.get(vid, 0)
-                    v['maintenance_cost'] = maint_map.get(vid, 0)
+        apply_cost_results(vehicles, batch)
         
         return {
             "status": sf_status,
             "count": len(vehicles),
             "vehicles": vehicles,
+            "next_cursor": None,
+            "source": "live",
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"❌ Error fetching vehicles by status: {e}")
         import traceback
         traceback.print_exc()
-        raise HTTPException(status_code=500, detail=str(e))
+        raise HTTPException(status_code=error_status(e), detail=str(e))
+
+
+def _usable_due_index(source: str = "auto"):
+    """The due-date index when reads may come from the replica (see resolve_source), else None"""
+    index = get_due_index()
+    return index if index.ready and resolve_source(source) is not None else None
+
 
+async def _vehicles_due(sf, kind: str, days: int, overdue: bool = False, source: str = "auto") -> dict:
+    """Vehicles whose `kind` due date falls within the next `days` days (or is already past, if overdue)"""
+    date_fields, last_date_fields = DUE_KINDS[kind]
+    due_field = await sf.first_existing_field("Vehicle__c", date_fields)
+    if not due_field:
+        print(f"⚠️  None of {date_fields} exist on Vehicle__c, returning empty list")
+        return {"count": 0, "vehicles": []}
+    fields = await sf.existing_fields("Vehicle__c", [*DUE_LIST_FIELDS, *last_date_fields, due_field])
 
-@router.get("/vehicles-mot-due")
-def get_vehicles_mot_due(days: int = 30):
+    index = _usable_due_index(source)
+    if index:
+        vehicles = index.due(due_field, days, overdue_only=overdue, fields=fields)
+        return {"count": len(vehicles), "vehicles": vehicles, "source": "replica"}
+
+    # Use SOQL date literal NEXT_N_DAYS: to filter
+    where = f"{due_field} != NULL AND {due_field} < TODAY" if overdue else due_where(due_field, days)
+    query = f"""
+        SELECT {", ".join(fields)}
+        FROM Vehicle__c
+        WHERE {where}
+        ORDER BY {due_field} ASC
     """
-    Get vehicles with MOT due within the next `days` days (default 30).
+    vehicles = [record async for record in sf.iter_soql(query)]
+    return {"count": len(vehicles), "vehicles": vehicles, "source": "live"}
+
+
+async def _due_response(kind: str, days: int, overdue: bool, source: str) -> dict:
+    """
+    Due list for one kind: due-date index while the replica is fresh, else the snapshot
+    (default window only), else a live NEXT_N_DAYS query. source=live always queries.
     """
     try:
-        sf = SalesforceService()
-        # Use SOQL date literal NEXT_N_DAYS: to filter
-        query = f"""
-            SELECT Id, Name, Reg_No__c, Van_Number__c, Status__c,
-                   Trade_Group__c, Vehicle_Type__c, Make_Model__c,
-                   Last_MOT_Date__c, Next_MOT_Date__c
-            FROM Vehicle__c
-            WHERE Next_MOT_Date__c != NULL AND Next_MOT_Date__c <= NEXT_N_DAYS:{days}
-            ORDER BY Next_MOT_Date__c ASC
-        """
-        vehicles = sf.execute_soql(query)
-        print(f"✅ MOT due vehicles found: {len(vehicles)}")
-        return {"count": len(vehicles), "vehicles": vehicles}
+        if source == "auto" and not overdue and days == SNAPSHOT_DUE_DAYS and not _usable_due_index():
+            snapshot, age = dashboard_snapshots.current()
+            if snapshot:
+                vehicles = snapshot["due"][kind]["vehicles"]
+                return {"count": len(vehicles), "vehicles": vehicles, "snapshot_age_seconds": age}
+        sf = AsyncSalesforceService()
+        result = await _vehicles_due(sf, kind, days, overdue, source)
+        print(f"✅ {kind.upper()} due vehicles found: {result['count']}")
+        return result
     except Exception as e:
-        print(f"❌ Error fetching MOT due vehicles: {e}")
+        print(f"❌ Error fetching {kind} due vehicles: {e}")
         import traceback
         traceback.print_exc()
-        # Try alternative field name
-        try:
-            print("🔄 Trying alternative field name MOT_Due_Date__c...")
-            query_alt = f"""
-                SELECT Id, Name, Reg_No__c, Van_Number__c, Status__c,
-                       Trade_Group__c, Vehicle_Type__c, Make_Model__c
-                FROM Vehicle__c
-                WHERE MOT_Due_Date__c != NULL AND MOT_Due_Date__c <= NEXT_N_DAYS:{days}
-                ORDER BY MOT_Due_Date__c ASC
-            """
-            vehicles_alt = sf.execute_soql(query_alt)
-            print(f"✅ MOT due vehicles (alt) found: {len(vehicles_alt)}")
-            return {"count": len(vehicles_alt), "vehicles": vehicles_alt}
-        except:
-            print("⚠️  Alternative field name also failed, returning empty list")
-            return {"count": 0, "vehicles": []}
+        raise HTTPException(status_code=error_status(e), detail=str(e))
+
+
+@router.get("/vehicles-mot-due", dependencies=[Depends(dashboard_validators)])
+async def get_vehicles_mot_due(days: int = 30, overdue: bool = False, source: str = "auto"):
+    """
+    Get vehicles with MOT due within the next `days` days (default 30).
+    ?overdue=true returns only vehicles whose MOT date has passed.
+    """
+    return await _due_response("mot", days, overdue, source)
 
 
-@router.get("/vehicles-tax-due")
-def get_vehicles_tax_due(days: int = 30):
+@router.get("/vehicles-tax-due", dependencies=[Depends(dashboard_validators)])
+async def get_vehicles_tax_due(days: int = 30, overdue: bool = False, source: str = "auto"):
     """
     Get vehicles with road tax due within the next `days` days (default 30).
     """
+    return await _due_response("tax", days, overdue, source)
+
+
+@router.get("/vehicles-service-due", dependencies=[Depends(dashboard_validators)])
+async def get_vehicles_service_due(days: int = 30, overdue: bool = False, source: str = "auto"):
+    """
+    Get vehicles with a service (Next_Service_Date__c) due within the next `days` days (default 30).
+    """
+    return await _due_response("service", days, overdue, source)
+
+
+@router.get("/vehicles-jetter-due", dependencies=[Depends(dashboard_validators)])
+async def get_vehicles_jetter_due(days: int = 30, overdue: bool = False, source: str = "auto"):
+    """
+    Get vehicles with a jetter service (Next_Jetter_Service__c) due within the next `days` days (default 30).
+    """
+    return await _due_response("jetter", days, overdue, source)
+
+
+# ========================================
+# BACKGROUND DASHBOARD SNAPSHOT
+# ========================================
+
+SNAPSHOT_DUE_DAYS = 30
+
+
+def due_list(vehicles, due_field: str, last_date_fields, days: int = SNAPSHOT_DUE_DAYS) -> list:
+    """In-memory twin of _vehicles_due's query: due date set and on/before today + days, soonest first"""
+    cutoff = (date.today() + timedelta(days=days)).isoformat()
+    fields = [*DUE_LIST_FIELDS, *last_date_fields, due_field]
+    due = [
+        {field: v.get(field) for field in fields}
+        for v in vehicles
+        if v.get(due_field) and v[due_field][:10] <= cutoff
+    ]
+    due.sort(key=lambda v: v[due_field])
+    return due
+
+
+async def build_dashboard_snapshot() -> dict:
+    """
+    Everything the dashboards load - summary counts, due lists and per-status vehicle lists -
+    computed from ONE read of Vehicle__c (replica when fresh, else one live query)
+    """
+    sf = AsyncSalesforceService()
+    due_fields = {
+        name: await sf.first_existing_field("Vehicle__c", candidates)
+        for name, (candidates, _) in DUE_KINDS.items()
+    }
+
+    replica = resolve_source("auto")
+    if replica:
+        vehicles = replica.records("Vehicle__c")
+        source = "replica"
+    else:
+        wanted = [*STATUS_LIST_FIELDS, *DUE_LIST_FIELDS, *PIVOT_FIELDS]
+        for name, (_, last_date_fields) in DUE_KINDS.items():
+            wanted += [*last_date_fields, due_fields[name]] if due_fields[name] else []
+        fields = await sf.existing_fields("Vehicle__c", list(dict.fromkeys(wanted)))
+        vehicles = [v async for v in sf.iter_soql(f"SELECT {', '.join(fields)} FROM Vehicle__c")]
+        source = "live"
+    vehicles.sort(key=lambda v: v.get("Name") or "")
+
+    rows = [{field: v.get(field) for field in STATUS_LIST_FIELDS} for v in vehicles]
+    rollup = get_cost_rollup()
+    if rollup.ready:
+        rollup.attach_costs(rows)
+    else:
+        apply_cost_results(rows, await sf.execute_batch(cost_queries("")))
+
+    vehicles_by_status = {
+        status: [r for r in rows if r["Status__c"] in sf_values] if sf_values else rows
+        for status, sf_values in STATUS_FILTERS.items()
+    }
+    due = {
+        name: {
+            "field": due_fields[name],
+            "vehicles": due_list(vehicles, due_fields[name], last_date_fields) if due_fields[name] else [],
+        }
+        for name, (_, last_date_fields) in DUE_KINDS.items()
+    }
+    return {
+        "source": source,
+        "summary": summarize_vehicles(vehicles, due_fields["mot"], due_fields["tax"]),
+        "due": due,
+        "vehicles_by_status": vehicles_by_status,
+        "cube": PivotCube.from_records(vehicles),
+    }
+
+
+dashboard_snapshots = SnapshotPublisher("Dashboard", build_dashboard_snapshot)
+dashboard_snapshots.add_listener(dashboard_events.on_snapshot)
+
+
+@router.get("/stream")
+async def stream_dashboard():
+    """
+    Server-Sent Events for live dashboards (use instead of polling vehicle-summary).
+    `counters` events carry summary counters - all of them on connect, then only the ones
+    that changed; `vehicles` events carry changed vehicle rows and removed Ids. Changes are
+    detected on each background snapshot refresh (DASHBOARD_SNAPSHOT_INTERVAL).
+    """
+    return event_stream_response(dashboard_events.stream())
+
+
+# ========================================
+# TRENDS (status buckets and due counts over time)
+# ========================================
+
+TREND_METRICS = [
+    "total", "allocated", "garage", "due_service", "spare_ready",
+    "reserved", "written_off", "mot_due", "tax_due",
+]
+
+
+def record_dashboard_trends(snapshot: dict):
+    """Snapshot listener: append the summary counters to the trend store (throttled to TREND_SAMPLE_INTERVAL)"""
+    summary = snapshot["summary"]
+    if get_trend_store().record({metric: summary.get(metric) for metric in TREND_METRICS}):
+        print(f"📈 Trend sample recorded ({summary.get('total')} vehicles)")
+
+
+dashboard_snapshots.add_listener(record_dashboard_trends)
+
+
+def _parse_time(value: str, name: str) -> datetime:
+    """ISO date/datetime query parameter; naive values are UTC"""
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"{name} must be an ISO date or datetime")
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+@router.get("/trends")
+def get_trends(
+    metrics: Optional[str] = None,
+    days: int = 90,
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    points: int = 200,
+):
+    """
+    Downsampled history of the dashboard counters for trend charts.
+    metrics: comma-separated (default all) from total, the status buckets, mot_due and tax_due.
+    Range: start/end (ISO dates), or the last `days` days. points caps the buckets per series.
+    """
+    names = [m.strip() for m in metrics.split(",") if m.strip()] if metrics else TREND_METRICS
+    unknown = [m for m in names if m not in TREND_METRICS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"metrics must be from: {', '.join(TREND_METRICS)}")
+    if not 1 <= points <= 2000:
+        raise HTTPException(status_code=400, detail="points must be between 1 and 2000")
+
+    end_at = _parse_time(end, "end") if end else datetime.now(timezone.utc)
+    start_at = _parse_time(start, "start") if start else end_at - timedelta(days=days)
+    if start_at >= end_at:
+        raise HTTPException(status_code=400, detail="start must be before end")
+
+    try:
+        result = get_trend_store().series(names, start_at.timestamp(), end_at.timestamp(), points)
+        return {"start": start_at.isoformat(), "end": end_at.isoformat(), **result}
+    except Exception as e:
+        print(f"❌ Trends error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+# ========================================
+# PIVOT (chart breakdowns)
+# ========================================
+
+# (replica version, cube) - rebuilt only when a sync changed rows
+_replica_cube = (None, None)
+
+
+def _replica_pivot_cube(replica) -> PivotCube:
+    global _replica_cube
+    version, cube = _replica_cube
+    if cube is None or version != replica.version:
+        version = replica.version
+        cube = PivotCube.from_records(replica.records("Vehicle__c"))
+        _replica_cube = (version, cube)
+    return cube
+
+
+async def _live_pivot_cube() -> PivotCube:
+    """One GROUP BY over every pivot field the org has - a few hundred rows, never the fleet"""
+    sf = AsyncSalesforceService()
+    fields = await sf.existing_fields("Vehicle__c", PIVOT_FIELDS)
+    grouped = ", ".join(fields)
+    return PivotCube.from_aggregate(
+        await sf.aggregate(f"SELECT {grouped}, COUNT(Id) cnt FROM Vehicle__c GROUP BY {grouped}")
+    )
+
+
+@router.get("/pivot", dependencies=[Depends(dashboard_validators)])
+async def get_pivot(
+    by: str = "trade_group,status",
+    source: str = "auto",
+    status: Optional[str] = None,
+    trade_group: Optional[str] = None,
+    vehicle_type: Optional[str] = None,
+    ownership: Optional[str] = None,
+    territory: Optional[str] = None,
+):
+    """
+    Vehicle counts grouped by any combination of status, trade_group, vehicle_type,
+    ownership and territory (?by=, comma-separated), optionally filtered by the same
+    dimensions (comma-separated = any of). Feeds the dashboard charts.
+    source: 'auto' (snapshot cube, else replica when fresh, else live), 'replica' or 'live'.
+    """
+    dimensions = [d.strip() for d in by.split(",") if d.strip()]
+    unknown = [d for d in dimensions if d not in PIVOT_DIMENSIONS]
+    if unknown or len(set(dimensions)) != len(dimensions):
+        raise HTTPException(
+            status_code=400,
+            detail=f"by must be distinct dimensions from: {', '.join(PIVOT_DIMENSIONS)}",
+        )
+    raw_filters = {
+        "status": status, "trade_group": trade_group, "vehicle_type": vehicle_type,
+        "ownership": ownership, "territory": territory,
+    }
+    filters = {
+        name: [v.strip() for v in value.split(",") if v.strip()]
+        for name, value in raw_filters.items()
+        if value
+    }
+
+    try:
+        extra = {}
+        snapshot, age = dashboard_snapshots.current() if source == "auto" else (None, None)
+        if snapshot:
+            cube = snapshot["cube"]
+            extra = {"source": snapshot["source"], "snapshot_age_seconds": age}
+        else:
+            replica = resolve_source(source)
+            if replica:
+                cube = _replica_pivot_cube(replica)
+                extra = {"source": "replica", "replica_lag_seconds": replica.sync_lag_seconds()}
+            else:
+                cube = await _live_pivot_cube()
+                extra = {"source": "live"}
+
+        rows = cube.rollup(dimensions, filters)
+        return {
+            "dimensions": dimensions,
+            "total": sum(r["count"] for r in rows),
+            "rows": rows,
+            **extra,
+        }
+    except Exception as e:
+        print(f"❌ Pivot error: {e}")
+        import traceback
+        traceback.print_exc()
+        raise HTTPException(status_code=error_status(e), detail=str(e))
+
+
+def _yearly_cost_query(year: int) -> str:
+    """Every Vehicle_Cost__c row dated in `year` - no LIMIT, meant for Bulk API 2.0"""
+    return f"""
+        SELECT Id, Vehicle__c, Vehicle__r.Name, Vehicle__r.Reg_No__c,
+               Type__c, Payment_value__c, Date__c, Description__c
+        FROM Vehicle_Cost__c
+        WHERE Date__c >= {year}-01-01 AND Date__c <= {year}-12-31
+    """
+
+
+@router.get("/cost-report/{year}")
+def get_yearly_cost_report(year: int):
+    """
+    Cost totals for a calendar year (overall, per cost type and per vehicle).
+    Pulls the full Vehicle_Cost__c history for the year through Bulk API 2.0
+    and folds it one result page at a time, so memory stays bounded.
+    Stays a sync handler: the job polling and CSV parsing run in the threadpool.
+    """
     try:
         sf = SalesforceService()
-        query = f"""
-            SELECT Id, Name, Reg_No__c, Van_Number__c, Status__c,
-                   Trade_Group__c, Vehicle_Type__c, Make_Model__c,
-                   Last_Tax_Date__c, Next_Tax_Date__c
-            FROM Vehicle__c
-            WHERE Next_Tax_Date__c != NULL AND Next_Tax_Date__c <= NEXT_N_DAYS:{days}
-            ORDER BY Next_Tax_Date__c ASC
-        """
-        vehicles = sf.execute_soql(query)
-        print(f"✅ Tax due vehicles found: {len(vehicles)}")
-        return {"count": len(vehicles), "vehicles": vehicles}
+        
+        record_count = 0
+        by_type = {}
+        by_vehicle = {}
+        for frame in sf.iter_bulk_dataframes(_yearly_cost_query(year)):
+            record_count += len(frame)
+            frame["Payment_value__c"] = frame["Payment_value__c"].fillna(0)
+            frame["Type__c"] = frame["Type__c"].fillna("Unknown")
+            frame["maintenance"] = frame["Payment_value__c"].where(
+                frame["Type__c"].str.contains("Service|Maint"), 0
+            )
+            
+            for cost_type, total in frame.groupby("Type__c")["Payment_value__c"].sum().items():
+                by_type[cost_type] = by_type.get(cost_type, 0) + float(total)
+            
+            grouped = frame.groupby(["Vehicle__c", "Vehicle__r.Name", "Vehicle__r.Reg_No__c"], dropna=False)
+            for (vehicle_id, name, reg), sums in grouped[["Payment_value__c", "maintenance"]].sum().iterrows():
+                entry = by_vehicle.setdefault(vehicle_id, {
+                    "vehicle_id": vehicle_id,
+                    "name": None if name != name else name,
+                    "registration_number": None if reg != reg else reg,
+                    "total_cost": 0.0,
+                    "maintenance_cost": 0.0,
+                })
+                entry["total_cost"] += float(sums["Payment_value__c"])
+                entry["maintenance_cost"] += float(sums["maintenance"])
+        
+        vehicles = sorted(by_vehicle.values(), key=lambda v: -v["total_cost"])
+        print(f"✅ Cost report {year}: {record_count} cost rows across {len(vehicles)} vehicles")
+        
+        return {
+            "year": year,
+            "record_count": record_count,
+            "total_cost": round(sum(by_type.values()), 2),
+            "by_type": {k: round(v, 2) for k, v in sorted(by_type.items())},
+            "vehicles": vehicles,
+        }
+        
     except Exception as e:
-        print(f"❌ Error fetching road tax due vehicles: {e}")
+        print(f"❌ Error building cost report: {e}")
         import traceback
         traceback.print_exc()
-        # Try alternative field name
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/cost-report/{year}/export")
+def export_yearly_costs(year: int):
+    """Download every Vehicle_Cost__c row for `year` as CSV (Bulk API 2.0, streamed to disk)"""
+    try:
+        sf = SalesforceService()
+        
+        fd, path = tempfile.mkstemp(prefix=f"vehicle_costs_{year}_", suffix=".csv")
+        os.close(fd)
         try:
-            print("🔄 Trying alternative field name Tax_Due_Date__c...")
-            query_alt = f"""
-                SELECT Id, Name, Reg_No__c, Van_Number__c, Status__c,
-                       Trade_Group__c, Vehicle_Type__c, Make_Model__c
-                FROM Vehicle__c
-                WHERE Tax_Due_Date__c != NULL AND Tax_Due_Date__c <= NEXT_N_DAYS:{days}
-                ORDER BY Tax_Due_Date__c ASC
-            """
-            vehicles_alt = sf.execute_soql(query_alt)
-            print(f"✅ Tax due vehicles (alt) found: {len(vehicles_alt)}")
-            return {"count": len(vehicles_alt), "vehicles": vehicles_alt}
-        except:
-            print("⚠️  Alternative field name also failed, returning empty list")
-            return {"count": 0, "vehicles": []}
+            sf.bulk_query_to_csv(_yearly_cost_query(year), path)
+        except Exception:
+            os.remove(path)
+            raise
+        
+        return FileResponse(
+            path,
+            media_type="text/csv",
+            filename=f"vehicle_costs_{year}.csv",
+            background=BackgroundTask(os.remove, path),
+        )
+        
+    except Exception as e:
+        print(f"❌ Error exporting costs: {e}")
+        import traceback
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=str(e))
@@ -1,27 +1,61 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Depends, HTTPException
+from typing import List, Optional, Tuple
+from pydantic import BaseModel
+from datetime import date
+import asyncio
+import re
 import sys
 import os
+import time
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from salesforce_service import SalesforceService
+from salesforce_service import SalesforceQueryError, batch_records
+from async_salesforce_service import AsyncSalesforceService
+from record_set import RecordSet
+from http_utils import async_ndjson_response, error_status, ndjson_response, record_set_response
+from vehicle_replica import REPLICATED_OBJECTS, resolve_source
+from list_query import ListQuery, soql_quote
+from conditional_get import replica_validators
+from allocation_index import EARLIEST, LATEST, get_allocation_index
+from search_index import get_search_index, normalize
+from cost_rollup import get_cost_rollup, is_maintenance_cost
+from driver_history import build_timeline, format_timeline, get_driver_timelines
 
 router = APIRouter(prefix="/api/vehicles", tags=["vehicles"])
 
+# How long a lookup waits for its enrichments (driver, allocations, costs) before answering without them
+LOOKUP_DEADLINE_SECONDS = float(os.getenv("LOOKUP_DEADLINE_SECONDS", "3"))
+# Batch lookup: identifiers per request, and values per SOQL IN list (keeps each query well under the URL/SOQL limits)
+LOOKUP_BATCH_LIMIT = 1000
+LOOKUP_IN_CHUNK = 200
+
 @router.get("/lookup/{van_number}")
-def lookup_vehicle_by_van(van_number: str):
+async def lookup_vehicle_by_van(van_number: str, source: str = "auto"):
     """
     Lookup vehicle information by van number
     Returns: registration number, tracking number, vehicle name, driver history, etc.
+    plus the assigned driver, allocation history and cost totals. Those enrichments run
+    concurrently under LOOKUP_DEADLINE_SECONDS; any that miss it (or fail) are listed in
+    "incomplete" and the rest of the response is returned anyway.
     """
+    started = time.monotonic()
+    sf = AsyncSalesforceService()
+    tasks = {}
     try:
-        sf = SalesforceService()
-        
         print(f"🔍 Looking up vehicle with van number: {van_number}")
         
-        # Sanitize van_number - escape single quotes for SOQL
-        sanitized_van = van_number.replace("'", "\\'")
-        
-        # Query vehicle by Van_Number__c
-        vehicle_query = f"""
+        # Enrichments only need the van number, so they start alongside the vehicle query.
+        # Allocations and costs come from the in-memory indexes when the replica is usable.
+        replica = resolve_source(source)
+        allocation_index, cost_rollup = get_allocation_index(), get_cost_rollup()
+        enrichments = {"driver": _lookup_assigned_driver(sf, van_number)}
+        if replica is None or not allocation_index.ready:
+            enrichments["allocations"] = _live_allocations(van_number, None, EARLIEST, LATEST)
+        if replica is None or not cost_rollup.ready:
+            enrichments["costs"] = _lookup_costs(sf, van_number)
+        tasks = {name: asyncio.create_task(coro) for name, coro in enrichments.items()}
+        
+        # Vehicle and its Previous_Drivers__c history in ONE query
+        records = [record async for record in sf.iter_soql(f"""
             SELECT 
                 Id, 
                 Name, 
@@ -30,15 +64,12 @@ def lookup_vehicle_by_van(van_number: str):
                 Tracking_Number__c,
                 Vehicle_Type__c,
                 Description__c,
-                Status__c
+                Status__c,
+                Previous_Drivers__c
             FROM Vehicle__c
-            WHERE Van_Number__c = '{sanitized_van}'
+            WHERE Van_Number__c = {soql_quote(van_number)}
             LIMIT 1
-        """
-        
-        print(f"📝 Query: {vehicle_query}")
-        result = sf.sf.query_all(vehicle_query)
-        records = result.get('records', [])
+        """)]
         
         if not records:
             print(f"❌ No vehicle found with van number: {van_number}")
@@ -49,13 +80,30 @@ def lookup_vehicle_by_van(van_number: str):
         
         print(f"✅ Found vehicle: {vehicle.get('Name')}")
         
-        # Get complete driver history
-        driver_history = get_driver_history(sf, vehicle_id)
-        
-        # Get driver name if associated
-        driver_name = get_assigned_driver(sf, vehicle_id)
-        
-        # Prepare AI analysis context
+        # Index-backed sections go through the same deadline and failure handling as the live ones
+        index_backed = {}
+        if "allocations" not in tasks:
+            index_backed["allocations"] = asyncio.to_thread(allocation_index.for_vehicle, vehicle_id, EARLIEST, LATEST)
+        if "costs" not in tasks:
+            index_backed["costs"] = asyncio.to_thread(cost_rollup.costs, vehicle_id)
+        tasks.update((name, asyncio.create_task(coro)) for name, coro in index_backed.items())
+        
+        results, incomplete = {}, []
+        await _collect_enrichments(tasks, started, results, incomplete)
+        allocations = results.get("allocations")
+        # Local parsing only (no I/O), so it isn't held to the deadline - but a failure is still partial
+        try:
+            driver_timeline = _driver_timeline(vehicle, allocations, cached="allocations" in index_backed)
+        except Exception as e:
+            print(f"⚠️ Lookup enrichment 'driver_timeline' failed: {e}")
+            driver_timeline = None
+            incomplete.append("driver_timeline")
+        
+        driver_name = results.get("driver", "Unable to fetch driver")
+        costs = results.get("costs")
+        
+        # Prepare AI analysis context - driver history from the timeline, not the raw text
+        history = "; ".join(format_timeline(driver_timeline).splitlines()) if driver_timeline else "No driver history available"
         vehicle_info = f"""
         Vehicle: {vehicle.get('Name')}
         Van Number: {van_number}
@@ -63,19 +111,16 @@ def lookup_vehicle_by_van(van_number: str):
         Type: {vehicle.get('Vehicle_Type__c')}
         Status: {vehicle.get('Status__c')}
         Description: {vehicle.get('Description__c', 'N/A')}
+        Driver history: {history}
         """
         
         return {
-            "van_number": vehicle.get('Van_Number__c', van_number),
-            "registration_number": vehicle.get('Reg_No__c', 'N/A'),
-            "tracking_number": vehicle.get('Tracking_Number__c', 'N/A'),
-            "vehicle_name": vehicle.get('Name', 'N/A'),
-            "vehicle_type": vehicle.get('Vehicle_Type__c', 'N/A'),
-            "description": vehicle.get('Description__c', 'N/A'),
-            "status": vehicle.get('Status__c', 'N/A'),
-            "driver_history": driver_history,
+            **_lookup_row(vehicle),
             "driver_name": driver_name,
-            "vehicle_id": vehicle_id,
+            "allocations": [_to_allocation_row(a) for a in allocations] if allocations is not None else None,
+            "driver_timeline": driver_timeline,
+            "costs": {"total": costs[0], "maintenance": costs[1]} if costs is not None else None,
+            "incomplete": incomplete,
             "vehicle_info": vehicle_info
         }
         
@@ -85,86 +130,251 @@ def lookup_vehicle_by_van(van_number: str):
         print(f"❌ Error looking up vehicle: {e}")
         import traceback
         traceback.print_exc()
-        raise HTTPException(status_code=500, detail=str(e))
+        raise HTTPException(status_code=error_status(e), detail=str(e))
+    finally:
+        for task in tasks.values():
+            if task.done() and not task.cancelled():
+                task.exception()  # retrieved, so a failed enrichment isn't logged again as unhandled
+            task.cancel()
 
 
-def get_driver_history(sf: SalesforceService, vehicle_id: str) -> str:
-    """Get complete driver history for a vehicle from Previous_Drivers__c field"""
-    try:
-        # Query the vehicle's Previous_Drivers__c field which contains the driver history
-        history_query = f"""
-            SELECT 
-                Id, 
-                Name,
-                Van_Number__c,
-                Previous_Drivers__c
-            FROM Vehicle__c
-            WHERE Id = '{vehicle_id}'
-            LIMIT 1
-        """
-        
-        print(f"📝 Driver history query: {history_query}")
-        result = sf.sf.query_all(history_query)
-        records = result.get('records', [])
-        
-        if not records:
-            print(f"⚠️ No vehicle found with ID: {vehicle_id}")
-            return "No driver history available"
-        
-        vehicle = records[0]
-        previous_drivers = vehicle.get('Previous_Drivers__c', '')
-        
-        if previous_drivers:
-            print(f"✅ Found driver history: {previous_drivers[:100]}...")
-            return previous_drivers
+async def _collect_enrichments(tasks: dict, started: float, results: dict, incomplete: list):
+    """
+    Wait for lookup enrichment tasks until LOOKUP_DEADLINE_SECONDS after `started`; put
+    each result in `results`, or its name in `incomplete` if it missed the deadline or failed
+    """
+    remaining = LOOKUP_DEADLINE_SECONDS - (time.monotonic() - started)
+    await asyncio.wait(tasks.values(), timeout=max(remaining, 0))
+    for name, task in tasks.items():
+        if not task.done():
+            print(f"⏱️ Lookup enrichment '{name}' missed the {LOOKUP_DEADLINE_SECONDS}s deadline")
+            incomplete.append(name)
+        elif task.exception() is not None:
+            print(f"⚠️ Lookup enrichment '{name}' failed: {task.exception()}")
+            incomplete.append(name)
         else:
-            print(f"⚠️ No previous drivers found for vehicle {vehicle.get('Name')}")
-            return "No driver history available"
-        
-    except Exception as e:
-        print(f"❌ Error fetching driver history: {e}")
-        import traceback
-        traceback.print_exc()
-        return f"Unable to fetch driver history: {str(e)}"
+            results[name] = task.result()
+
 
+def _lookup_row(vehicle: dict) -> dict:
+    """Vehicle fields of a lookup response (single and batch)"""
+    return {
+        "van_number": vehicle.get('Van_Number__c'),
+        "registration_number": vehicle.get('Reg_No__c', 'N/A'),
+        "tracking_number": vehicle.get('Tracking_Number__c', 'N/A'),
+        "vehicle_name": vehicle.get('Name', 'N/A'),
+        "vehicle_type": vehicle.get('Vehicle_Type__c', 'N/A'),
+        "description": vehicle.get('Description__c', 'N/A'),
+        "status": vehicle.get('Status__c', 'N/A'),
+        "driver_history": vehicle.get('Previous_Drivers__c') or "No driver history available",
+        "vehicle_id": vehicle.get('Id'),
+    }
+
+
+def _driver_timeline(vehicle: dict, allocations: Optional[list], cached: bool) -> list:
+    """
+    Merged Previous_Drivers__c / allocation timeline - the cached one when the data came
+    from the replica, otherwise built from what this request fetched
+    """
+    if cached:
+        timeline = get_driver_timelines().for_vehicle(vehicle["Id"])
+        if timeline is not None:
+            return timeline
+    return build_timeline(vehicle.get('Previous_Drivers__c'), allocations or [])
 
-def get_assigned_driver(sf: SalesforceService, vehicle_id: str) -> str:
-    """Get the assigned driver for a vehicle"""
+
+async def _lookup_assigned_driver(sf: AsyncSalesforceService, van_number: str) -> str:
+    """Name of the ServiceResource assigned to the van"""
+    records = [record async for record in sf.iter_soql(f"""
+        SELECT Id, Name
+        FROM ServiceResource
+        WHERE Vehicle__r.Van_Number__c = {soql_quote(van_number)}
+        LIMIT 1
+    """)]
+    return records[0].get('Name', 'N/A') if records else "No driver assigned"
+
+
+async def _lookup_costs(sf: AsyncSalesforceService, van_number: str) -> Tuple[float, float]:
+    """(total cost, maintenance cost) of the van - one aggregate query, same split as the cost rollup"""
+    total = maintenance = 0.0
+    by_type = await sf.sum_by("Vehicle_Cost__c", "Type__c", "Payment_value__c",
+                              f"Vehicle__r.Van_Number__c = {soql_quote(van_number)}")
+    for cost_type, value in by_type.items():
+        total += value
+        if is_maintenance_cost(cost_type):
+            maintenance += value
+    return total, maintenance
+
+
+class VehicleLookupRequest(BaseModel):
+    identifiers: List[str]  # van numbers and/or registrations, mixed
+    source: str = "auto"
+
+
+def _in_list(values) -> str:
+    return "(" + ", ".join(soql_quote(v) for v in values) + ")"
+
+
+def _chunks(values: list, size: int = LOOKUP_IN_CHUNK):
+    return [values[i:i + size] for i in range(0, len(values), size)]
+
+
+def _batch_records(batch: dict, prefix: str) -> list:
+    """Records of every `<prefix>_<n>` query in a batch result - a failed chunk fails the lookup"""
+    records = []
+    for name, result in batch.items():
+        if name.startswith(f"{prefix}_"):
+            if result.get("error"):
+                raise SalesforceQueryError(f"Query '{name}' failed: {result['error']}")
+            records.extend(result["records"])
+    return records
+
+
+@router.post("/lookup")
+async def lookup_vehicles(request: VehicleLookupRequest):
+    """
+    Batch version of /lookup/{van_number} for spreadsheet imports: up to LOOKUP_BATCH_LIMIT van
+    numbers or registrations (spaces, case and O/0, I/1 don't matter against the replica).
+    Vehicles are resolved with chunked IN queries, then drivers and allocations for all of them
+    in one more Composite Batch round trip (allocations from the index when the replica is usable).
+    Returns {"vehicles": {identifier: lookup row}, "not_found": [identifiers]}. A row whose
+    allocations or driver timeline couldn't be built lists them in its own "incomplete".
+    """
+    identifiers = list(dict.fromkeys(i.strip() for i in request.identifiers if i and i.strip()))
+    if not identifiers:
+        raise HTTPException(status_code=400, detail="identifiers must contain at least one van number or registration")
+    if len(identifiers) > LOOKUP_BATCH_LIMIT:
+        raise HTTPException(status_code=400, detail=f"At most {LOOKUP_BATCH_LIMIT} identifiers per request")
     try:
-        # Try to find ServiceResource assigned to this vehicle
-        driver_query = f"""
-            SELECT 
-                Id, 
-                Name,
-                RelatedRecord.Name
-            FROM ServiceResource
-            WHERE Vehicle__c = '{vehicle_id}'
-            LIMIT 1
-        """
-        
-        result = sf.sf.query_all(driver_query)
-        records = result.get('records', [])
-        
-        if records:
-            return records[0].get('Name', 'N/A')
-        
-        return "No driver assigned"
-        
+        sf = AsyncSalesforceService()
+        replica = resolve_source(request.source)
+        allocation_index = get_allocation_index()
+        print(f"🔍 Batch lookup of {len(identifiers)} vehicles")
+        # Identifiers with nothing searchable ("-", " / ") can't match anything
+        keys = {i: normalize(i) for i in identifiers if normalize(i)}
+
+        if replica is not None:
+            candidates = replica.records("Vehicle__c")
+            used = "replica"
+        else:
+            # Exact and upper-cased forms - Salesforce compares case-insensitively but not spacing
+            values = list(dict.fromkeys(v for i in keys for v in (i, i.upper())))
+            batch = await sf.execute_batch({
+                f"vehicles_{n}": f"""
+                    SELECT Id, Name, Van_Number__c, Reg_No__c, Tracking_Number__c,
+                           Vehicle_Type__c, Description__c, Status__c, Previous_Drivers__c
+                    FROM Vehicle__c
+                    WHERE Van_Number__c IN {_in_list(chunk)} OR Reg_No__c IN {_in_list(chunk)}
+                """
+                for n, chunk in enumerate(_chunks(values))
+            }) if values else {}
+            candidates = _batch_records(batch, "vehicles")
+            used = "live"
+
+        # Van numbers win over registrations when an identifier could be either
+        by_key = {}
+        for column in ("Reg_No__c", "Van_Number__c"):
+            for vehicle in candidates:
+                key = normalize(vehicle.get(column) or "")
+                if key:
+                    by_key[key] = vehicle
+        matched = {i: by_key[key] for i, key in keys.items() if key in by_key}
+        vehicle_ids = list(dict.fromkeys(v["Id"] for v in matched.values()))
+
+        queries = {
+            f"drivers_{n}": f"SELECT Id, Name, Vehicle__c FROM ServiceResource WHERE Vehicle__c IN {_in_list(chunk)}"
+            for n, chunk in enumerate(_chunks(vehicle_ids))
+        }
+        use_index = replica is not None and allocation_index.ready
+        if not use_index and vehicle_ids:
+            wanted = [f for f in REPLICATED_OBJECTS["Vehicle_Allocation__c"] if f != "SystemModstamp"]
+            fields = ", ".join(await sf.existing_fields("Vehicle_Allocation__c", wanted))
+            queries.update({
+                f"allocations_{n}": f"""
+                    SELECT {fields} FROM Vehicle_Allocation__c
+                    WHERE Vehicle__c IN {_in_list(chunk)}
+                    ORDER BY Start_date__c DESC
+                """
+                for n, chunk in enumerate(_chunks(vehicle_ids))
+            })
+        batch = await sf.execute_batch(queries) if queries else {}
+
+        drivers = {}
+        for resource in _batch_records(batch, "drivers"):
+            drivers.setdefault(resource.get("Vehicle__c"), resource.get("Name", "N/A"))
+        allocations = {vehicle_id: [] for vehicle_id in vehicle_ids}
+        # Per vehicle: one bad row marks that vehicle's section incomplete, not the whole batch
+        incomplete = {vehicle_id: [] for vehicle_id in vehicle_ids}
+        if use_index:
+            for vehicle_id in vehicle_ids:
+                try:
+                    allocations[vehicle_id] = allocation_index.for_vehicle(vehicle_id, EARLIEST, LATEST)
+                except Exception as e:
+                    print(f"⚠️ Allocations for vehicle {vehicle_id} failed: {e}")
+                    allocations[vehicle_id] = None
+                    incomplete[vehicle_id].append("allocations")
+        else:
+            for allocation in _batch_records(batch, "allocations"):
+                allocations.setdefault(allocation.get("Vehicle__c"), []).append(allocation)
+
+        timelines = {}
+        for vehicle in {v["Id"]: v for v in matched.values()}.values():
+            try:
+                timelines[vehicle["Id"]] = _driver_timeline(vehicle, allocations.get(vehicle["Id"]), cached=use_index)
+            except Exception as e:
+                print(f"⚠️ Driver timeline for vehicle {vehicle['Id']} failed: {e}")
+                timelines[vehicle["Id"]] = None
+                incomplete[vehicle["Id"]].append("driver_timeline")
+
+        vehicles = {}
+        for identifier, vehicle in matched.items():
+            vehicle_allocations = allocations.get(vehicle["Id"])
+            vehicles[identifier] = {
+                **_lookup_row(vehicle),
+                "driver_name": drivers.get(vehicle["Id"], "No driver assigned"),
+                "allocations": [_to_allocation_row(a) for a in vehicle_allocations] if vehicle_allocations is not None else None,
+                "driver_timeline": timelines[vehicle["Id"]],
+                "incomplete": incomplete[vehicle["Id"]],
+            }
+        not_found = [i for i in identifiers if i not in matched]
+        print(f"✅ Batch lookup: {len(vehicles)} found, {len(not_found)} not found ({used})")
+        return {"count": len(vehicles), "vehicles": vehicles, "not_found": not_found, "source": used}
+
+    except HTTPException:
+        raise
     except Exception as e:
-        print(f"⚠️ Error fetching assigned driver: {e}")
-        return "Unable to fetch driver"
+        print(f"❌ Error in batch vehicle lookup: {e}")
+        import traceback
+        traceback.print_exc()
+        raise HTTPException(status_code=error_status(e), detail=str(e))
 
 
 @router.get("/search")
-def search_vehicles(q: str = ""):
-    """Search for vehicles by van number, name, or registration"""
+async def search_vehicles(q: str = "", limit: int = 20, source: str = "auto"):
+    """
+    Typeahead search over the whole fleet by van number, registration, name or current driver.
+    Answered from the in-memory search index (spaces ignored, O/0 and I/1 treated alike);
+    falls back to a LIKE query in Salesforce when the replica isn't usable. Either way
+    total_found counts every match and vehicles holds the first `limit` of them.
+    """
+    if not 1 <= limit <= 100:
+        raise HTTPException(status_code=400, detail="limit must be between 1 and 100")
     try:
-        sf = SalesforceService()
+        index = get_search_index()
+        if index.ready and resolve_source(source) is not None:
+            total, matching = index.search(q, limit)
+            return {"search_term": q, "total_found": total, "vehicles": matching, "source": "index"}
+        
+        sf = AsyncSalesforceService()
         
         print(f"🔍 Searching for vehicles matching: {q}")
         
-        # Query all vehicles first
-        vehicle_query = """
+        term = q.strip()
+        where = ""
+        if term:
+            pattern = soql_quote(f"%{term.replace('%', '').replace('_', '')}%")
+            where = f"WHERE Van_Number__c LIKE {pattern} OR Name LIKE {pattern} OR Reg_No__c LIKE {pattern}"
+        vehicle_query = f"""
             SELECT 
                 Id, 
                 Name, 
@@ -174,56 +384,119 @@ def search_vehicles(q: str = ""):
                 Vehicle_Type__c,
                 Status__c
             FROM Vehicle__c
+            {where}
             ORDER BY Van_Number__c ASC
-            LIMIT 100
+            LIMIT {limit}
         """
         
-        result = sf.sf.query_all(vehicle_query)
-        records = result.get('records', [])
-        
-        # Filter results
-        search_term = q.lower() if q else ""
-        matching = []
-        
-        for record in records:
-            van = record.get('Van_Number__c', '').lower()
-            name = record.get('Name', '').lower()
-            reg = record.get('Reg_No__c', '').lower()
-            
-            # Match if any field contains search term
-            if not search_term or search_term in van or search_term in name or search_term in reg:
-                matching.append({
-                    "van_number": record.get('Van_Number__c'),
-                    "name": record.get('Name'),
-                    "registration_number": record.get('Reg_No__c'),
-                    "vehicle_type": record.get('Vehicle_Type__c'),
-                    "status": record.get('Status__c'),
-                    "tracking_number": record.get('Tracking_Number__c')
-                })
+        # The first `limit` matches and the full match count in ONE Composite Batch round trip
+        batch = await sf.execute_batch({"vehicles": vehicle_query, "total": f"SELECT COUNT() FROM Vehicle__c {where}"})
+        records = batch_records(batch, "vehicles")
+        batch_records(batch, "total")
+        matching = [
+            {
+                "id": record.get('Id'),
+                "van_number": record.get('Van_Number__c'),
+                "name": record.get('Name'),
+                "registration_number": record.get('Reg_No__c'),
+                "vehicle_type": record.get('Vehicle_Type__c'),
+                "status": record.get('Status__c'),
+                "tracking_number": record.get('Tracking_Number__c'),
+            }
+            for record in records
+        ]
         
-        print(f"✅ Found {len(matching)} matching vehicles")
+        total = batch["total"]["totalSize"]
+        print(f"✅ Found {total} matching vehicles")
         
         return {
             "search_term": q,
-            "total_found": len(matching),
-            "vehicles": matching[:20]  # Return first 20 results
+            "total_found": total,
+            "vehicles": matching,
+            "source": "live",
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"❌ Search error: {e}")
         import traceback
         traceback.print_exc()
-        raise HTTPException(status_code=500, detail=str(e))
+        raise HTTPException(status_code=error_status(e), detail=str(e))
+
+
+# Response field -> Vehicle__c column
+VEHICLE_ROW_COLUMNS = {
+    "id": "Id",
+    "name": "Name",
+    "van_number": "Van_Number__c",
+    "registration_number": "Reg_No__c",
+    "tracking_number": "Tracking_Number__c",
+    "vehicle_type": "Vehicle_Type__c",
+    "description": "Description__c",
+    "status": "Status__c",
+    "created_date": "CreatedDate",
+}
+
 
+def _to_vehicle_row(record: dict) -> dict:
+    """Shape a Vehicle__c record for the /list response"""
+    return {field: record.get(column) for field, column in VEHICLE_ROW_COLUMNS.items()}
 
-@router.get("/list")
-def list_all_vehicles():
-    """List all vehicles stored as assets"""
+
+# ?sort= name -> Vehicle__c field (Id breaks ties)
+VEHICLE_SORT_FIELDS = {
+    "name": "Name",
+    "van_number": "Van_Number__c",
+    "registration_number": "Reg_No__c",
+    "created_date": "CreatedDate",
+}
+
+
+@router.get("/list", dependencies=[Depends(replica_validators)])
+async def list_all_vehicles(
+    stream: bool = False,
+    source: str = "auto",
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    sort: str = "name",
+    order: str = "asc",
+    status: Optional[str] = None,
+    trade_group: Optional[str] = None,
+    vehicle_type: Optional[str] = None,
+    territory: Optional[str] = None,
+):
+    """
+    List all vehicles stored as assets.
+    ?stream=true returns NDJSON (one vehicle per line) as pages arrive from Salesforce.
+    source: 'auto' (replica when fresh, else live), 'replica' or 'live'.
+    limit/cursor page through the list (pass back next_cursor); sort/order pick a stable
+    order; status, trade_group, vehicle_type and territory filter (comma-separated = any of).
+    """
     try:
-        sf = SalesforceService()
-        
-        # Query all vehicles with their details
-        vehicle_query = """
+        list_query = ListQuery.from_params(
+            sort, order, limit, cursor, VEHICLE_SORT_FIELDS,
+            status=status, trade_group=trade_group, vehicle_type=vehicle_type, territory=territory,
+        )
+        
+        replica = resolve_source(source)
+        if replica:
+            page, next_cursor = list_query.apply(replica.records("Vehicle__c"))
+            rows = RecordSet.from_records(page).project(VEHICLE_ROW_COLUMNS)
+            if stream:
+                return ndjson_response(rows.iter_dicts())
+            return record_set_response(
+                {"total": len(rows), "next_cursor": next_cursor, "source": "replica",
+                 "replica_lag_seconds": replica.sync_lag_seconds()},
+                "vehicles",
+                rows,
+            )
+        
+        sf = AsyncSalesforceService()
+        
+        # Query vehicles with their details - filters, cursor and page size applied by Salesforce
+        conditions = list_query.soql_conditions()
+        vehicle_query = f"""
             SELECT 
                 Id, 
                 Name, 
@@ -235,35 +508,145 @@ def list_all_vehicles():
                 Status__c,
                 CreatedDate
             FROM Vehicle__c
-            ORDER BY Name ASC
+            {"WHERE " + " AND ".join(conditions) if conditions else ""}
+            {list_query.soql_order_limit(probe=not stream)}
         """
         
-        result = sf.sf.query_all(vehicle_query)
-        records = result.get('records', [])
+        if stream:
+            return await async_ndjson_response(_to_vehicle_row(r) async for r in sf.iter_soql(vehicle_query))
         
-        print(f"✅ Retrieved {len(records)} vehicles")
+        records = await sf.query_records(vehicle_query)
+        rows, next_cursor = list_query.finish_page(records.rows, records.get)
+        vehicles = RecordSet(records.columns, rows).project(VEHICLE_ROW_COLUMNS)
         
-        vehicles = []
-        for record in records:
-            vehicles.append({
-                "id": record.get('Id'),
-                "name": record.get('Name'),
-                "van_number": record.get('Van_Number__c'),
-                "registration_number": record.get('Reg_No__c'),
-                "tracking_number": record.get('Tracking_Number__c'),
-                "vehicle_type": record.get('Vehicle_Type__c'),
-                "description": record.get('Description'),
-                "status": record.get('Status__c'),
-                "created_date": record.get('CreatedDate')
-            })
+        print(f"✅ Retrieved {len(vehicles)} vehicles")
         
-        return {
-            "total": len(vehicles),
-            "vehicles": vehicles
-        }
+        return record_set_response({"total": len(vehicles), "next_cursor": next_cursor}, "vehicles", vehicles)
         
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"❌ Error listing vehicles: {e}")
         import traceback
         traceback.print_exc()
-        raise HTTPException(status_code=500, detail=str(e))
+        raise HTTPException(status_code=error_status(e), detail=str(e))
+
+
+# ========================================
+# POINT-IN-TIME ALLOCATIONS
+# ========================================
+
+def _to_allocation_row(allocation: dict) -> dict:
+    vehicle = allocation.get("Vehicle__r") or {}
+    engineer = (allocation.get("Service_Resource__r") or {}).get("Name") \
+        or (allocation.get("Internal_Staff__r") or {}).get("Name")
+    return {
+        "allocation_id": allocation.get("Id"),
+        "vehicle_id": allocation.get("Vehicle__c"),
+        "vehicle_name": vehicle.get("Name"),
+        "registration_number": vehicle.get("Reg_No__c"),
+        "van_number": vehicle.get("Van_Number__c"),
+        "engineer": engineer,
+        "engineer_id": allocation.get("Service_Resource__c"),
+        "start_date": allocation.get("Start_date__c"),
+        "end_date": allocation.get("End_date__c"),
+        "reserved_for": allocation.get("Reserved_For__c"),
+    }
+
+
+def _iso_day(value: str, name: str) -> str:
+    try:
+        return date.fromisoformat(value[:10]).isoformat()
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"{name} must be a date (YYYY-MM-DD)")
+
+
+_SALESFORCE_ID_RE = re.compile(r"^[a-zA-Z0-9]{15}(?:[a-zA-Z0-9]{3})?$")
+
+
+async def _live_allocations(vehicle: Optional[str], engineer: Optional[str], low: str, high: str) -> list:
+    """Same question as the index, answered by one SOQL query"""
+    sf = AsyncSalesforceService()
+    wanted = [f for f in REPLICATED_OBJECTS["Vehicle_Allocation__c"] if f != "SystemModstamp"]
+    fields = await sf.existing_fields("Vehicle_Allocation__c", wanted)
+    if vehicle:
+        paths = ["Vehicle__r.Name", "Vehicle__r.Reg_No__c", "Vehicle__r.Van_Number__c"]
+        identifier = vehicle
+        id_path = "Vehicle__c"
+    else:
+        paths = await sf.existing_fields("Vehicle_Allocation__c", ["Service_Resource__r.Name", "Internal_Staff__r.Name"])
+        identifier = engineer
+        id_path = "Service_Resource__c"
+    # Id lookups too, like the index - only for Id-shaped values, SOQL rejects any other literal on an Id field
+    if _SALESFORCE_ID_RE.match(identifier):
+        paths = [id_path, *paths]
+    value = soql_quote(identifier)
+    conditions = ["(" + " OR ".join(f"{path} = {value}" for path in paths) + ")"]
+    if high != LATEST:
+        conditions.append(f"(Start_date__c = null OR Start_date__c <= {high})")
+    if low != EARLIEST:
+        conditions.append(f"(End_date__c = null OR End_date__c >= {low})")
+    query = f"""
+        SELECT {", ".join(fields)}
+        FROM Vehicle_Allocation__c
+        WHERE {" AND ".join(conditions)}
+        ORDER BY Start_date__c DESC
+    """
+    return [record async for record in sf.iter_soql(query)]
+
+
+@router.get("/allocations", dependencies=[Depends(replica_validators)])
+async def get_allocations_at(
+    vehicle: Optional[str] = None,
+    engineer: Optional[str] = None,
+    on: Optional[str] = None,
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    source: str = "auto",
+):
+    """
+    Who had which vehicle when (PCNs, damage claims).
+    Give vehicle (name, registration, van number or Id) or engineer (name or service resource Id),
+    and either on=YYYY-MM-DD (default today) or a start/end range - returns every allocation
+    overlapping it, latest first. Answered from the allocation interval index when the replica
+    is usable (source: 'auto', 'replica' or 'live').
+    """
+    if bool(vehicle) == bool(engineer):
+        raise HTTPException(status_code=400, detail="Give exactly one of vehicle or engineer")
+    if on and (start or end):
+        raise HTTPException(status_code=400, detail="Give either on or start/end, not both")
+    if start or end:
+        low = _iso_day(start, "start") if start else EARLIEST
+        high = _iso_day(end, "end") if end else LATEST
+        if low > high:
+            raise HTTPException(status_code=400, detail="start must not be after end")
+    else:
+        low = high = _iso_day(on, "on") if on else date.today().isoformat()
+
+    try:
+        index = get_allocation_index()
+        if index.ready and resolve_source(source) is not None:
+            allocations = index.for_vehicle(vehicle, low, high) if vehicle else index.for_engineer(engineer, low, high)
+            used = "index"
+        else:
+            allocations = await _live_allocations(vehicle, engineer, low, high)
+            used = "live"
+
+        print(f"✅ {len(allocations)} allocations for {vehicle or engineer} between {low} and {high} ({used})")
+        return {
+            "vehicle": vehicle,
+            "engineer": engineer,
+            "start": None if low == EARLIEST else low,
+            "end": None if high == LATEST else high,
+            "count": len(allocations),
+            "allocations": [_to_allocation_row(a) for a in allocations],
+            "source": used,
+        }
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"❌ Error fetching allocations: {e}")
+        import traceback
+        traceback.print_exc()
+        raise HTTPException(status_code=error_status(e), detail=str(e))
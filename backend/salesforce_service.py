@@ -1,18 +1,65 @@
-
 import os
-from simple_salesforce import Salesforce
+import threading
+import time
+from typing import Dict, List, Optional
+from urllib.parse import quote
+import requests
+from requests.adapters import HTTPAdapter
+from simple_salesforce import Salesforce, SalesforceExpiredSession
 from dotenv import load_dotenv
+from record_set import RecordSet
+from single_flight import SingleFlight, copy_records, normalize_query
+from api_usage import get_api_usage
 
 load_dotenv()
 
+# Composite Batch accepts at most 25 subrequests per call
+COMPOSITE_BATCH_LIMIT = 25
 
-class SalesforceService:
+# Bulk API 2.0 query job states that mean "stop polling"
+BULK_DONE_STATES = {"JobComplete", "Failed", "Aborted"}
+
+# sObject describe results, shared by every SalesforceService: sobject -> (fetched_at, {field name: field describe})
+# Concurrent misses for the same sobject share one describe call (single flight, keyed per sobject)
+_describe_cache: Dict[str, tuple] = {}
+
+# Identical concurrent queries share one upstream call (see single_flight.py)
+_single_flight = SingleFlight()
+
+
+class SalesforceUnavailable(Exception):
+    """Salesforce can't be reached: mock data mode (no session) or a network failure"""
+
+
+class SalesforceQueryError(Exception):
+    """Salesforce answered but rejected a query (e.g. one subrequest of a Composite Batch)"""
+
+
+class SalesforceConnectionManager:
     """
-    Pure Salesforce data access layer - NO intelligence, just execution
+    Process-wide Salesforce connection - ONE login and ONE HTTP pool shared by every SalesforceService.
+    The session is re-created when it gets old or when Salesforce reports it expired.
     """
 
     def __init__(self):
-        """Initialize Salesforce connection"""
+        self._lock = threading.Lock()
+        self._sf = None
+        self._logged_in_at = 0.0
+        self._last_failure_at = None
+        self.mock_mode = False
+
+        # Salesforce sessions default to a 2 hour timeout - refresh a bit before that
+        self.session_max_age = int(os.getenv("SF_SESSION_MAX_AGE", "5400"))
+        self.login_retry_seconds = int(os.getenv("SF_LOGIN_RETRY_SECONDS", "30"))
+
+        # Shared keep-alive pool so requests reuse TLS connections instead of reconnecting
+        pool_size = int(os.getenv("SF_POOL_SIZE", "20"))
+        self.http = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.http.mount("https://", adapter)
+        self.http.mount("http://", adapter)
+
+    def _credentials(self):
         username = os.getenv("SF_USERNAME")
         password = os.getenv("SF_PASSWORD")
         security_token = os.getenv("SF_SECURITY_TOKEN")
@@ -20,57 +67,453 @@ class SalesforceService:
 
         # Check if credentials are configured
         if not all([username, password, security_token]) or "your_" in str(username):
-            print("⚠️  Salesforce credentials not configured. Using mock data mode.")
-            self.sf = None
+            return None
+        return username, password, security_token, domain
+
+    def _login(self):
+        """Log in to Salesforce - caller must hold the lock"""
+        credentials = self._credentials()
+        if credentials is None:
+            if not self.mock_mode:
+                print("⚠️  Salesforce credentials not configured. Using mock data mode.")
+            self._sf = None
             self.mock_mode = True
             return
 
+        username, password, security_token, domain = credentials
         try:
-            self.sf = Salesforce(
+            self._sf = Salesforce(
                 username=username,
                 password=password,
                 security_token=security_token,
                 domain=domain,
+                session=self.http,
             )
+            self._logged_in_at = time.monotonic()
+            self._last_failure_at = None
             self.mock_mode = False
             print("✅ Connected to Salesforce")
         except Exception as e:
             print(f"⚠️  Failed to connect to Salesforce: {e}. Using mock data mode.")
-            self.sf = None
+            self._sf = None
+            self._last_failure_at = time.monotonic()
             self.mock_mode = True
 
+    def _needs_login(self) -> bool:
+        if self._sf is not None:
+            return time.monotonic() - self._logged_in_at >= self.session_max_age
+        if self._credentials() is None:
+            # Nothing to log in with - only the first call needs to switch to mock mode
+            return not self.mock_mode
+        if self._last_failure_at is None:
+            return True
+        return time.monotonic() - self._last_failure_at >= self.login_retry_seconds
+
+    @property
+    def needs_login(self) -> bool:
+        """True when get() would (blocking) log in first - async callers run it in a worker thread"""
+        return self._needs_login()
+
+    @property
+    def client(self):
+        """The current client as-is, never logging in (None in mock mode or before the first login)"""
+        return self._sf
+
+    def get(self):
+        """Return the shared Salesforce client (None in mock mode), logging in only when needed"""
+        if not self._needs_login():
+            return self._sf
+        with self._lock:
+            if self._needs_login():
+                self._login()
+            return self._sf
+
+    def refresh(self, stale=None):
+        """
+        Force a new session. Pass the client that failed so concurrent callers
+        that hit the same expired session only trigger ONE re-login.
+        """
+        with self._lock:
+            if stale is None or self._sf is stale or self._sf is None:
+                print("🔄 Refreshing Salesforce session...")
+                self._login()
+            return self._sf
+
+    def warm_up(self):
+        """Log in ahead of the first request (called at app startup)"""
+        return self.get()
+
+
+_connection_manager = None
+_connection_manager_lock = threading.Lock()
+
+
+def get_connection_manager() -> SalesforceConnectionManager:
+    """Return the process-wide connection manager"""
+    global _connection_manager
+    if _connection_manager is None:
+        with _connection_manager_lock:
+            if _connection_manager is None:
+                _connection_manager = SalesforceConnectionManager()
+    return _connection_manager
+
+
+def clean_record(record: dict) -> dict:
+    """Strip Salesforce 'attributes' metadata from a record (and its nested relationship objects)"""
+    clean = {}
+    for k, v in record.items():
+        if k.startswith('attributes'):
+            continue
+        # Handle nested objects (like Vehicle__r.Name)
+        if isinstance(v, dict) and 'attributes' in v:
+            clean[k] = {nk: nv for nk, nv in v.items() if not nk.startswith('attributes')}
+        else:
+            clean[k] = v
+    return clean
+
+
+def batch_request_body(sf_version: str, queries: Dict[str, str], names: List[str]) -> dict:
+    """Composite Batch body running queries[name] for each of names (at most COMPOSITE_BATCH_LIMIT)"""
+    return {
+        "haltOnError": False,
+        "batchRequests": [
+            {"method": "GET", "url": f"v{sf_version}/query?q={quote(' '.join(queries[name].split()))}"}
+            for name in names
+        ],
+    }
+
+
+def batch_error(sub: dict) -> Optional[str]:
+    """Error message of one Composite Batch subresult, or None if it succeeded"""
+    if sub.get("statusCode", 500) < 400:
+        return None
+    payload = sub.get("result")
+    errors = payload if isinstance(payload, list) else [payload]
+    return "; ".join(str((e or {}).get("message", e)) for e in errors)
+
+
+def batch_records(batch: Dict[str, dict], name: str) -> list:
+    """Records of one query of an execute_batch result - raises SalesforceQueryError if it failed"""
+    error = batch[name].get("error")
+    if error:
+        raise SalesforceQueryError(f"Query '{name}' failed: {error}")
+    return batch[name]["records"]
+
+
+def batch_key(queries: Dict[str, str]) -> str:
+    return "batch:" + "|".join(f"{name}={normalize_query(q)}" for name, q in sorted(queries.items()))
+
+
+def copy_batch(results: Dict[str, dict]) -> Dict[str, dict]:
+    return {name: {**result, "records": copy_records(result["records"])} for name, result in results.items()}
+
+
+class SalesforceService:
+    """
+    Pure Salesforce data access layer - NO intelligence, just execution
+    """
+
+    def __init__(self):
+        """Attach to the shared Salesforce connection (no login per instance)"""
+        self._connection = get_connection_manager()
+        self._connection.get()
+
+    @property
+    def sf(self):
+        """Current authenticated simple_salesforce client (None in mock mode)"""
+        return self._connection.get()
+
+    @property
+    def mock_mode(self) -> bool:
+        return self._connection.mock_mode
+
+    def _call(self, fn):
+        """Run fn(client), re-logging in once if the session has expired (and record the API usage it reported)"""
+        client = self.sf
+        if client is None:
+            raise SalesforceUnavailable("Salesforce is not connected (mock data mode)")
+        try:
+            return fn(client)
+        except SalesforceExpiredSession:
+            client = self._connection.refresh(stale=client)
+            if client is None:
+                raise SalesforceUnavailable("Salesforce session could not be refreshed")
+            return fn(client)
+        except requests.RequestException as e:
+            raise SalesforceUnavailable(f"Salesforce request failed: {e}") from e
+        finally:
+            get_api_usage().observe_client(client)
+
+    def query_all(self, query: str) -> dict:
+        """Raw query_all (keeps Salesforce's response shape) with transparent session refresh"""
+        return self._call(lambda client: client.query_all(query))
+
+    def _iter_raw_pages(self, query: str):
+        """Yield Salesforce's raw record pages, following nextRecordsUrl"""
+        print(f"🔍 Executing: {query[:150]}...")
+        result = self._call(lambda client: client.query(query))
+        while True:
+            yield result.get("records", [])
+            next_url = result.get("nextRecordsUrl")
+            if result.get("done", True) or not next_url:
+                break
+            result = self._call(lambda client: client.query_more(next_url, identifier_is_url=True))
+
+    def iter_soql_pages(self, query: str):
+        """
+        Yield cleaned records one Salesforce page at a time (follows nextRecordsUrl).
+        Only the current page is held in memory - errors are raised to the caller.
+        """
+        for page in self._iter_raw_pages(query):
+            yield [clean_record(r) for r in page]
+
+    def iter_soql(self, query: str):
+        """Yield cleaned records one by one across all pages"""
+        for page in self.iter_soql_pages(query):
+            yield from page
+
+    def query_records(self, query: str) -> RecordSet:
+        """
+        Run a query into a compact RecordSet (column names once, one tuple per row).
+        Raw pages are converted directly - no intermediate cleaned dicts. Errors are raised.
+        """
+        return RecordSet.from_records(
+            record for page in self._iter_raw_pages(query) for record in page
+        )
+
     def execute_soql(self, query: str) -> list:
-        """Execute SOQL query and return ALL results with proper pagination"""
+        """
+        Execute SOQL query and return ALL results with proper pagination.
+        Concurrent callers running the same query share one upstream call.
+        """
+        def run():
+            try:
+                cleaned = list(self.iter_soql(query))
+                print(f"✅ Returned {len(cleaned)} records")
+                return cleaned
+                
+            except Exception as e:
+                print(f"❌ SOQL Error: {e}")
+                import traceback
+                traceback.print_exc()
+                return []
+
+        return _single_flight.do(f"soql:{normalize_query(query)}", run, copy=copy_records)
+
+    # ========================================
+    # DESCRIBE CACHE (build queries from fields that exist)
+    # ========================================
+
+    def describe_fields(self, sobject: str) -> Optional[Dict[str, dict]]:
+        """
+        Field describes for sobject keyed by API name, cached for DESCRIBE_CACHE_TTL seconds.
+        Returns None if the object can't be described (callers then keep their field lists as-is).
+        """
+        ttl = get_api_usage().stretch(float(os.getenv("DESCRIBE_CACHE_TTL", "3600")))
+        cached = _describe_cache.get(sobject)
+        if cached and time.monotonic() - cached[0] < ttl:
+            return cached[1]
+        return _single_flight.do(f"describe:{sobject}", lambda: self._describe(sobject, ttl))
+
+    def _describe(self, sobject: str, ttl: float) -> Optional[Dict[str, dict]]:
         try:
-            print(f"🔍 Executing: {query[:150]}...")
-            
-            # Use query_all for automatic pagination
-            result = self.sf.query_all(query)
-            records = result.get("records", [])
-            
-            # Clean metadata from all records
-            cleaned = []
-            for r in records:
-                clean_record = {}
-                for k, v in r.items():
-                    if not k.startswith('attributes'):
-                        # Handle nested objects (like Vehicle__r.Name)
-                        if isinstance(v, dict) and 'attributes' in v:
-                            # Extract nested fields
-                            nested_clean = {nk: nv for nk, nv in v.items() if not nk.startswith('attributes')}
-                            clean_record[k] = nested_clean
-                        else:
-                            clean_record[k] = v
-                cleaned.append(clean_record)
-            
-            print(f"✅ Returned {len(cleaned)} records (total in SF: {result.get('totalSize', len(cleaned))})")
-            return cleaned
-            
+            print(f"📖 Describing {sobject}...")
+            described = self._call(lambda client: getattr(client, sobject).describe())
         except Exception as e:
-            print(f"❌ SOQL Error: {e}")
-            import traceback
-            traceback.print_exc()
-            return []
+            print(f"⚠️ Could not describe {sobject}: {e}")
+            # Remember the failure for a minute so every query doesn't retry the describe
+            _describe_cache[sobject] = (time.monotonic() - ttl + 60, None)
+            return None
+        fields = {f["name"]: f for f in described.get("fields", [])}
+        _describe_cache[sobject] = (time.monotonic(), fields)
+        return fields
+
+    def has_field(self, sobject: str, path: str) -> bool:
+        """True if path exists on sobject - follows relationship paths like 'Vehicle__r.Van_Number__c'"""
+        fields = self.describe_fields(sobject)
+        if fields is None:
+            return True
+        name, _, rest = path.partition(".")
+        if not rest:
+            return name in fields
+        relationship = next((f for f in fields.values() if f.get("relationshipName") == name), None)
+        if relationship is None or not relationship.get("referenceTo"):
+            return False
+        return self.has_field(relationship["referenceTo"][0], rest)
+
+    def existing_fields(self, sobject: str, candidates: List[str]) -> List[str]:
+        """The subset of candidates that exist on sobject (order kept)"""
+        return [f for f in candidates if self.has_field(sobject, f)]
+
+    def first_existing_field(self, sobject: str, candidates: List[str]) -> Optional[str]:
+        """The first of candidates (e.g. Next_MOT_Date__c, MOT_Due_Date__c) that exists on sobject"""
+        return next((f for f in candidates if self.has_field(sobject, f)), None)
+
+    # ========================================
+    # COMPOSITE BATCH (several queries, one round trip)
+    # ========================================
+
+    def execute_batch(self, queries: Dict[str, str]) -> Dict[str, dict]:
+        """
+        Run independent SOQL queries through ONE Composite Batch request (per 25 queries).
+        Returns {name: {"totalSize", "records"}} with records cleaned and every page fetched.
+        A query that fails gets {"totalSize": 0, "records": [], "error": message}
+        so one bad query doesn't sink the others.
+        Concurrent identical batches share one upstream call.
+        """
+        return _single_flight.do(batch_key(queries), lambda: self._execute_batch(queries), copy=copy_batch)
+
+    def _execute_batch(self, queries: Dict[str, str]) -> Dict[str, dict]:
+        names = list(queries)
+        results = {}
+        for start in range(0, len(names), COMPOSITE_BATCH_LIMIT):
+            chunk = names[start:start + COMPOSITE_BATCH_LIMIT]
+            print(f"📦 Batching {len(chunk)} queries: {', '.join(chunk)}")
+
+            response = self._call(lambda client: client.restful(
+                "composite/batch", method="POST", json=batch_request_body(client.sf_version, queries, chunk)
+            ))
+            for name, sub in zip(chunk, response.get("results", [])):
+                error = batch_error(sub)
+                if error:
+                    print(f"❌ Batched query '{name}' failed: {error}")
+                    results[name] = {"totalSize": 0, "records": [], "error": error}
+                    continue
+                payload = sub["result"]
+                records = [clean_record(r) for r in payload.get("records", [])]
+                next_url = payload.get("nextRecordsUrl")
+                while not payload.get("done", True) and next_url:
+                    payload = self._call(lambda client: client.query_more(next_url, identifier_is_url=True))
+                    records.extend(clean_record(r) for r in payload.get("records", []))
+                    next_url = payload.get("nextRecordsUrl")
+                results[name] = {"totalSize": sub["result"].get("totalSize", len(records)), "records": records}
+        return results
+
+    # ========================================
+    # BULK API 2.0 (large extracts, streamed as CSV pages)
+    # ========================================
+
+    def _bulk_request(self, method: str, path: str, **kwargs) -> requests.Response:
+        """Raw Bulk API 2.0 call on the shared HTTP pool (path is relative to .../jobs/)"""
+        def send(client):
+            response = client.session.request(method, client.bulk2_url + path, headers=client.headers, **kwargs)
+            get_api_usage().observe_header(response.headers.get("Sforce-Limit-Info"))
+            if response.status_code == 401:
+                raise SalesforceExpiredSession(response.url, 401, "bulk2", response.content)
+            response.raise_for_status()
+            return response
+        return self._call(send)
+
+    def start_bulk_query(self, query: str) -> str:
+        """Create a Bulk API 2.0 query job and wait until Salesforce has finished it; returns the job id"""
+        job = self._bulk_request("POST", "query", json={
+            "operation": "query",
+            "query": " ".join(query.split()),
+        }).json()
+        job_id = job["id"]
+        print(f"📦 Bulk query job {job_id} created: {query.strip()[:100]}...")
+
+        poll_interval = float(os.getenv("BULK_POLL_INTERVAL", "2"))
+        deadline = time.monotonic() + float(os.getenv("BULK_JOB_TIMEOUT", "900"))
+        while job.get("state") not in BULK_DONE_STATES:
+            if time.monotonic() > deadline:
+                self._bulk_request("PATCH", f"query/{job_id}", json={"state": "Aborted"})
+                raise TimeoutError(f"Bulk query job {job_id} did not finish in time")
+            time.sleep(poll_interval)
+            job = self._bulk_request("GET", f"query/{job_id}").json()
+
+        if job["state"] != "JobComplete":
+            raise RuntimeError(f"Bulk query job {job_id} {job['state']}: {job.get('errorMessage', '')}")
+        print(f"✅ Bulk query job {job_id} complete ({job.get('numberRecordsProcessed', '?')} records)")
+        return job_id
+
+    def iter_bulk_result_pages(self, job_id: str, page_size: int = 50000):
+        """
+        Yield each result page of a finished job as a streaming requests.Response (CSV with header).
+        Only one page is open at a time; the caller reads it with iter_content()/raw.
+        """
+        locator = None
+        while True:
+            params = {"maxRecords": page_size}
+            if locator:
+                params["locator"] = locator
+            response = self._bulk_request("GET", f"query/{job_id}/results", params=params, stream=True)
+            try:
+                yield response
+            finally:
+                response.close()
+            locator = response.headers.get("Sforce-Locator")
+            if not locator or locator == "null":
+                break
+
+    def bulk_query_to_csv(self, query: str, path: str, page_size: int = 50000) -> int:
+        """
+        Run query through Bulk API 2.0 and stream every result page straight into one CSV file.
+        Memory stays at one network chunk regardless of result size. Returns the data row count.
+        """
+        job_id = self.start_bulk_query(query)
+        rows = 0
+        with open(path, "wb") as out:
+            for page_number, page in enumerate(self.iter_bulk_result_pages(job_id, page_size)):
+                rows += int(page.headers.get("Sforce-NumberOfRecords", 0))
+                # Every page starts with the CSV header - keep only the first one
+                skip_header = page_number > 0
+                for chunk in page.iter_content(chunk_size=64 * 1024):
+                    if skip_header:
+                        newline = chunk.find(b"\n")
+                        if newline < 0:
+                            continue
+                        chunk = chunk[newline + 1:]
+                        skip_header = False
+                    out.write(chunk)
+        print(f"✅ Bulk extract wrote {rows} rows to {path}")
+        return rows
+
+    def iter_bulk_dataframes(self, query: str, page_size: int = 50000):
+        """Run query through Bulk API 2.0 and yield one pandas DataFrame per result page (bounded memory)"""
+        import pandas as pd
+
+        job_id = self.start_bulk_query(query)
+        for page in self.iter_bulk_result_pages(job_id, page_size):
+            if page.headers.get("Sforce-NumberOfRecords") == "0":
+                continue
+            page.raw.decode_content = True
+            yield pd.read_csv(page.raw)
+
+    # ========================================
+    # AGGREGATE QUERIES (counted by Salesforce, not in Python)
+    # ========================================
+
+    def aggregate(self, query: str) -> List[dict]:
+        """Run an aggregate SOQL query (GROUP BY / COUNT() / SUM()) and return its cleaned rows"""
+        print(f"🔍 Aggregating: {query[:150]}...")
+        result = self._call(lambda client: client.query_all(query))
+        return [clean_record(r) for r in result.get("records", [])]
+
+    def count(self, sobject: str, where: str = None) -> int:
+        """SELECT COUNT() - only the total comes back, no rows"""
+        query = f"SELECT COUNT() FROM {sobject}"
+        if where:
+            query += f" WHERE {where}"
+        print(f"🔍 Counting: {query[:150]}...")
+        result = self._call(lambda client: client.query(query))
+        return int(result.get("totalSize", 0))
+
+    def count_by(self, sobject: str, field: str, where: str = None) -> Dict[Optional[str], int]:
+        """Row count per distinct value of field (null values are grouped under None)"""
+        query = f"SELECT {field}, COUNT(Id) cnt FROM {sobject}"
+        if where:
+            query += f" WHERE {where}"
+        query += f" GROUP BY {field}"
+        return {row.get(field): int(row.get("cnt") or 0) for row in self.aggregate(query)}
+
+    def sum_by(self, sobject: str, field: str, value_field: str, where: str = None) -> Dict[Optional[str], float]:
+        """SUM(value_field) per distinct value of field"""
+        query = f"SELECT {field}, SUM({value_field}) total FROM {sobject}"
+        if where:
+            query += f" WHERE {where}"
+        query += f" GROUP BY {field}"
+        return {row.get(field): float(row.get("total") or 0) for row in self.aggregate(query)}
 
     # ========================================
     # SIMPLE DATA RETRIEVAL METHODS
@@ -124,47 +567,27 @@ class SalesforceService:
             where = f"(Vehicle__r.Name = '{vehicle_identifier}' OR Vehicle__r.Reg_No__c = '{vehicle_identifier}' OR Vehicle__r.Van_Number__c = '{vehicle_identifier}')"
         else:
             where = "End_date__c = null"
-        # Primary (rich) query - may include related Email fields which aren't always present
-        query_full = f"""
-            SELECT 
-                Id, 
-                Vehicle__r.Name, 
-                Vehicle__r.Reg_No__c,
-                Vehicle__r.Van_Number__c,
-                Service_Resource__r.Name, 
-                Service_Resource__r.Email,
-                Internal_Staff__r.Name, 
-                Internal_Staff__r.Email,
-                Start_date__c, 
-                End_date__c,
-                Reserved_For__c
+        # Related Email fields aren't present in every org - only select fields that exist
+        fields = self.existing_fields("Vehicle_Allocation__c", [
+            "Id",
+            "Vehicle__r.Name",
+            "Vehicle__r.Reg_No__c",
+            "Vehicle__r.Van_Number__c",
+            "Service_Resource__r.Name",
+            "Service_Resource__r.Email",
+            "Internal_Staff__r.Name",
+            "Internal_Staff__r.Email",
+            "Start_date__c",
+            "End_date__c",
+            "Reserved_For__c",
+        ])
+        query = f"""
+            SELECT {", ".join(fields)}
             FROM Vehicle_Allocation__c
             WHERE {where}
             ORDER BY Start_date__c DESC
         """
-
-        results = self.execute_soql(query_full)
-
-        # If no results returned, it may be due to invalid nested fields (e.g. Email not present on related object).
-        # Retry with a safer query that omits nested Email fields.
-        if not results:
-            print("⚠️ Allocations full query returned no records — retrying with safe query without nested Email fields")
-            query_safe = f"""
-                SELECT 
-                    Id, 
-                    Vehicle__r.Name, 
-                    Vehicle__r.Reg_No__c,
-                    Vehicle__r.Van_Number__c,
-                    Service_Resource__r.Name, 
-                    Internal_Staff__r.Name, 
-                    Start_date__c, 
-                    End_date__c,
-                    Reserved_For__c
-                FROM Vehicle_Allocation__c
-                WHERE {where}
-                ORDER BY Start_date__c DESC
-            """
-            results = self.execute_soql(query_safe)
+        results = self.execute_soql(query)
 
         print(f"📊 Allocations query returned {len(results)} records")
         return results
@@ -0,0 +1,282 @@
+"""
+In-memory typeahead index over the whole fleet: van number, registration, vehicle
+name and current driver.
+
+Terms are normalized: upper case, spaces and punctuation dropped, and the usual
+plate confusions folded (O -> 0, I -> 1), so "ab12 cdo", "AB12CD0" and "ab-12-cd0"
+all match each other. Lookups use a sorted term list (prefix match by bisect) and
+a trigram -> vehicles map (substring match by intersecting candidate sets), so a
+keystroke never reaches Salesforce. The index is loaded from the replica and each
+vehicle is re-indexed when it or its allocations change. Driver terms depend on the
+date, so the first lookup or change of each new day re-indexes the vehicles with
+open allocations.
+"""
+import bisect
+import heapq
+import threading
+from datetime import date
+from typing import Dict, List, Optional, Set, Tuple
+
+from vehicle_replica import VehicleReplica, get_replica
+
+VEHICLE_OBJECT = "Vehicle__c"
+ALLOCATION_OBJECT = "Vehicle_Allocation__c"
+
+# Searchable field -> weight in the ranking
+FIELD_WEIGHTS = {"van_number": 4, "registration_number": 3, "name": 2, "driver": 1}
+FIELD_COLUMNS = {"van_number": "Van_Number__c", "registration_number": "Reg_No__c", "name": "Name"}
+
+EXACT, PREFIX, SUBSTRING = 100, 50, 20
+
+_CONFUSABLE = str.maketrans({"O": "0", "I": "1"})
+
+
+def normalize(text) -> str:
+    """Search form of a term or query: alphanumerics only, upper case, O/0 and I/1 folded"""
+    return "".join(ch for ch in str(text).upper() if ch.isalnum()).translate(_CONFUSABLE)
+
+
+def trigrams(term: str) -> Set[str]:
+    return {term[i:i + 3] for i in range(len(term) - 2)}
+
+
+def _driver_name(allocation: dict) -> Optional[str]:
+    for relationship in ("Service_Resource__r", "Internal_Staff__r"):
+        related = allocation.get(relationship)
+        if isinstance(related, dict) and related.get("Name"):
+            return related["Name"]
+    return None
+
+
+class VehicleSearchIndex:
+    """
+    Sorted (term, vehicle Id, field) list for prefixes, trigram -> vehicle Ids for substrings
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._vehicles: Dict[str, dict] = {}
+        # vehicle Id -> {allocation Id: (start, end, driver)} for allocations not yet ended
+        self._open_allocations: Dict[str, Dict[str, Tuple[str, Optional[str], Optional[str]]]] = {}
+        self._allocation_vehicle: Dict[str, str] = {}
+        self._terms: Dict[str, List[Tuple[str, str]]] = {}  # vehicle Id -> [(field, term)]
+        self._sorted: List[Tuple[str, str, str]] = []
+        self._trigrams: Dict[str, Set[str]] = {}
+        self._van_keys: Dict[str, str] = {}  # vehicle Id -> normalized van number (ranking tie-break)
+        self._replica: Optional[VehicleReplica] = None
+        self._indexed_on: Optional[str] = None  # date the driver terms were built for
+
+    # ========================================
+    # MAINTENANCE
+    # ========================================
+
+    def driver(self, vehicle_id: str) -> Optional[str]:
+        """Current driver: the open allocation that started most recently (and has started)"""
+        today = date.today().isoformat()
+        current = [
+            (start, name)
+            for start, end, name in self._open_allocations.get(vehicle_id, {}).values()
+            if start <= today and (end is None or end >= today) and name
+        ]
+        return max(current)[1] if current else None
+
+    def _terms_for(self, vehicle_id: str) -> List[Tuple[str, str]]:
+        vehicle = self._vehicles.get(vehicle_id)
+        if vehicle is None:
+            return []
+        terms = []
+        for field, column in FIELD_COLUMNS.items():
+            if vehicle.get(column):
+                terms.append((field, normalize(vehicle[column])))
+        driver = self.driver(vehicle_id)
+        if driver:
+            # Whole name and each word, so "smith" finds "John Smith"
+            terms += [("driver", normalize(part)) for part in [driver, *driver.split()]]
+        return [(field, term) for field, term in dict.fromkeys(terms) if term]
+
+    def _reindex(self, vehicle_id: str):
+        vehicle = self._vehicles.get(vehicle_id)
+        if vehicle is None:
+            self._van_keys.pop(vehicle_id, None)
+        else:
+            self._van_keys[vehicle_id] = normalize(vehicle.get("Van_Number__c") or "")
+        old = self._terms.pop(vehicle_id, [])
+        new = self._terms_for(vehicle_id)
+        for field, term in old:
+            i = bisect.bisect_left(self._sorted, (term, vehicle_id, field))
+            if i < len(self._sorted) and self._sorted[i] == (term, vehicle_id, field):
+                del self._sorted[i]
+        for field, term in new:
+            bisect.insort(self._sorted, (term, vehicle_id, field))
+
+        old_grams = set().union(*(trigrams(term) for _, term in old))
+        new_grams = set().union(*(trigrams(term) for _, term in new))
+        for gram in old_grams - new_grams:
+            holders = self._trigrams.get(gram)
+            if holders is not None:
+                holders.discard(vehicle_id)
+                if not holders:
+                    del self._trigrams[gram]
+        for gram in new_grams - old_grams:
+            self._trigrams.setdefault(gram, set()).add(vehicle_id)
+        if new:
+            self._terms[vehicle_id] = new
+
+    def _apply_allocation(self, allocation: dict) -> Set[str]:
+        """File an allocation under its vehicle; returns the vehicles whose driver may have changed"""
+        allocation_id = allocation["Id"]
+        touched = set()
+        previous_vehicle = self._allocation_vehicle.pop(allocation_id, None)
+        if previous_vehicle:
+            self._open_allocations.get(previous_vehicle, {}).pop(allocation_id, None)
+            touched.add(previous_vehicle)
+        vehicle_id = allocation.get("Vehicle__c")
+        end = (allocation.get("End_date__c") or "")[:10] or None
+        if vehicle_id and (end is None or end >= date.today().isoformat()):
+            start = (allocation.get("Start_date__c") or "")[:10]
+            self._open_allocations.setdefault(vehicle_id, {})[allocation_id] = (start, end, _driver_name(allocation))
+            self._allocation_vehicle[allocation_id] = vehicle_id
+            touched.add(vehicle_id)
+        return touched
+
+    def _roll_over(self):
+        """On a new day drop allocations that have ended and re-index the drivers of the rest"""
+        today = date.today().isoformat()
+        if self._indexed_on is None or self._indexed_on == today:
+            return
+        self._indexed_on = today
+        for vehicle_id, open_allocations in list(self._open_allocations.items()):
+            for allocation_id, (_, end, _) in list(open_allocations.items()):
+                if end is not None and end < today:
+                    del open_allocations[allocation_id]
+                    self._allocation_vehicle.pop(allocation_id, None)
+            if not open_allocations:
+                del self._open_allocations[vehicle_id]
+            self._reindex(vehicle_id)
+
+    def _on_replica_change(self, object_name: str, upserted: list, deleted_ids: list):
+        with self._lock:
+            self._roll_over()
+            if object_name == VEHICLE_OBJECT:
+                for vehicle_id in deleted_ids:
+                    self._vehicles.pop(vehicle_id, None)
+                    self._reindex(vehicle_id)
+                for vehicle in upserted:
+                    self._vehicles[vehicle["Id"]] = vehicle
+                    self._reindex(vehicle["Id"])
+            elif object_name == ALLOCATION_OBJECT:
+                touched = set()
+                for allocation_id in deleted_ids:
+                    touched |= self._apply_allocation({"Id": allocation_id})
+                for allocation in upserted:
+                    touched |= self._apply_allocation(allocation)
+                for vehicle_id in touched:
+                    self._reindex(vehicle_id)
+
+    def attach(self, replica: VehicleReplica):
+        """Load vehicles and allocations from the replica and follow its change events from now on"""
+        replica.add_listener(self._on_replica_change)
+        with self._lock:
+            self._indexed_on = date.today().isoformat()
+            self._vehicles = {v["Id"]: v for v in replica.records(VEHICLE_OBJECT)}
+            self._open_allocations, self._allocation_vehicle = {}, {}
+            for allocation in replica.records(ALLOCATION_OBJECT):
+                self._apply_allocation(allocation)
+            self._terms = {vehicle_id: self._terms_for(vehicle_id) for vehicle_id in self._vehicles}
+            self._van_keys = {
+                vehicle_id: normalize(vehicle.get("Van_Number__c") or "")
+                for vehicle_id, vehicle in self._vehicles.items()
+            }
+            self._sorted = sorted(
+                (term, vehicle_id, field)
+                for vehicle_id, terms in self._terms.items()
+                for field, term in terms
+            )
+            self._trigrams = {}
+            for vehicle_id, terms in self._terms.items():
+                for _, term in terms:
+                    for gram in trigrams(term):
+                        self._trigrams.setdefault(gram, set()).add(vehicle_id)
+        self._replica = replica
+        print(f"✅ Search index loaded for {len(self._vehicles)} vehicles ({len(self._sorted)} terms)")
+
+    @property
+    def ready(self) -> bool:
+        """True once loaded from the replica (callers check replica freshness via resolve_source)"""
+        return self._replica is not None
+
+    # ========================================
+    # LOOKUP
+    # ========================================
+
+    def search(self, query: str, limit: int = 20) -> Tuple[int, List[dict]]:
+        """
+        (total matches, best `limit` vehicles). Ranked by match kind (exact > prefix > substring)
+        times field weight (van > registration > name > driver), then shorter term, then van number.
+        """
+        needle = normalize(query)
+        with self._lock:
+            self._roll_over()
+            van_keys = self._van_keys
+            if not needle:
+                first = heapq.nsmallest(limit, van_keys, key=van_keys.__getitem__)
+                return len(van_keys), [self._row(i, None) for i in first]
+
+            best: Dict[str, Tuple[int, int, str]] = {}  # vehicle Id -> (score, -term length, field)
+
+            def hit(vehicle_id, field, term, kind):
+                candidate = (kind * FIELD_WEIGHTS[field], -len(term), field)
+                if candidate > best.get(vehicle_id, (0, 0, "")):
+                    best[vehicle_id] = candidate
+
+            i = bisect.bisect_left(self._sorted, (needle,))
+            while i < len(self._sorted) and self._sorted[i][0].startswith(needle):
+                term, vehicle_id, field = self._sorted[i]
+                hit(vehicle_id, field, term, EXACT if term == needle else PREFIX)
+                i += 1
+
+            if len(needle) >= 3:
+                holders = sorted((self._trigrams.get(gram, set()) for gram in trigrams(needle)), key=len)
+                candidates = set.intersection(*holders) if holders and holders[0] else set()
+                for vehicle_id in candidates:
+                    for field, term in self._terms.get(vehicle_id, []):
+                        if needle in term and not term.startswith(needle):
+                            hit(vehicle_id, field, term, SUBSTRING)
+
+            ranked = heapq.nsmallest(
+                limit, best.items(), key=lambda item: (-item[1][0], -item[1][1], van_keys[item[0]])
+            )
+            return len(best), [self._row(vehicle_id, match[2]) for vehicle_id, match in ranked]
+
+    def _row(self, vehicle_id: str, matched_field: Optional[str]) -> dict:
+        vehicle = self._vehicles[vehicle_id]
+        return {
+            "id": vehicle_id,
+            "van_number": vehicle.get("Van_Number__c"),
+            "name": vehicle.get("Name"),
+            "registration_number": vehicle.get("Reg_No__c"),
+            "vehicle_type": vehicle.get("Vehicle_Type__c"),
+            "status": vehicle.get("Status__c"),
+            "tracking_number": vehicle.get("Tracking_Number__c"),
+            "driver": self.driver(vehicle_id),
+            "matched": matched_field,
+        }
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_search_index() -> VehicleSearchIndex:
+    """Return the process-wide vehicle search index"""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = VehicleSearchIndex()
+    return _index
+
+
+def start_search_index():
+    """Attach the index to the shared replica (called at app startup)"""
+    get_search_index().attach(get_replica())
@@ -0,0 +1,109 @@
+"""
+Single-flight request coalescing.
+
+When identical calls overlap (a dozen dashboards opening at 8am all asking for the
+same SOQL), only the first caller goes upstream; everyone who arrives while it is in
+flight waits for that call and shares its result. Nothing is cached - once the call
+finishes, the next caller starts a fresh one.
+"""
+import asyncio
+import threading
+from typing import Awaitable, Callable, Dict
+
+
+def normalize_query(query: str) -> str:
+    """Collapse whitespace so the same SOQL written with different indentation shares one flight"""
+    return " ".join(query.split())
+
+
+def copy_records(records: list) -> list:
+    """Shallow per-caller copy - routes add keys (e.g. costs) to records in place"""
+    return [dict(r) if isinstance(r, dict) else r for r in records]
+
+
+class _Call:
+    __slots__ = ("done", "result", "error", "callers")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.callers = 1
+
+
+class SingleFlight:
+    """Thread-based coalescing for the sync SalesforceService"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[str, _Call] = {}
+
+    def do(self, key: str, fn: Callable, copy: Callable = None):
+        """
+        Run fn() once for all concurrent callers with the same key.
+        If the result was shared, every caller gets copy(result) so nobody mutates another's data.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                call.callers += 1
+
+        if leader:
+            try:
+                call.result = fn()
+            except BaseException as e:
+                call.error = e
+            finally:
+                with self._lock:
+                    del self._calls[key]
+                call.done.set()
+        else:
+            print(f"🔗 Joined in-flight call: {key[:100]}...")
+            call.done.wait()
+
+        if call.error is not None:
+            raise call.error
+        if call.callers > 1 and copy is not None:
+            return copy(call.result)
+        return call.result
+
+
+class _AsyncCall:
+    __slots__ = ("task", "callers")
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.callers = 1
+
+
+class AsyncSingleFlight:
+    """asyncio coalescing for AsyncSalesforceService (one event loop)"""
+
+    def __init__(self):
+        self._calls: Dict[str, _AsyncCall] = {}
+
+    async def do(self, key: str, fn: Callable[[], Awaitable], copy: Callable = None):
+        """
+        Await fn() once for all concurrent callers with the same key.
+        The upstream call runs as its own task, so one caller disconnecting doesn't cancel it for the rest.
+        """
+        call = self._calls.get(key)
+        if call is None or call.task.get_loop() is not asyncio.get_running_loop():
+            call = self._calls[key] = _AsyncCall(asyncio.ensure_future(fn()))
+            call.task.add_done_callback(lambda task: self._forget(key, task))
+        else:
+            print(f"🔗 Joined in-flight call: {key[:100]}...")
+            call.callers += 1
+
+        result = await asyncio.shield(call.task)
+        if call.callers > 1 and copy is not None:
+            return copy(result)
+        return result
+
+    def _forget(self, key: str, task: asyncio.Task):
+        call = self._calls.get(key)
+        if call is not None and call.task is task:
+            del self._calls[key]
@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""
+Allocation interval index - point and range lookups, including bad (inverted) date ranges
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from allocation_index import AllocationIndex, IntervalTree
+
+
+def allocation(allocation_id, start, end, vehicle="V1", engineer="Alice Smith"):
+    return {
+        "Id": allocation_id,
+        "Vehicle__c": vehicle,
+        "Vehicle__r": {"Name": f"Van {vehicle}", "Van_Number__c": f"VEH-{vehicle}"},
+        "Internal_Staff__r": {"Name": engineer},
+        "Start_date__c": start,
+        "End_date__c": end,
+    }
+
+
+def test_point_and_range_queries():
+    index = AllocationIndex()
+    index.apply([
+        allocation("A1", "2024-01-01", "2024-01-31"),
+        allocation("A2", "2024-02-01", None, engineer="Bob Jones"),
+        allocation("A3", "2024-01-15", "2024-03-01", vehicle="V2"),
+    ], [])
+    assert [a["Id"] for a in index.for_vehicle("V1", "2024-01-10")] == ["A1"]
+    assert [a["Id"] for a in index.for_vehicle("VEH-V1", "2025-06-01")] == ["A2"]
+    assert [a["Id"] for a in index.for_vehicle("V1", "2024-01-20", "2024-02-10")] == ["A2", "A1"]
+    assert [a["Id"] for a in index.for_engineer("alice smith", "2024-02-20")] == ["A3"]
+
+
+def test_inverted_interval_does_not_recurse():
+    tree = IntervalTree([("2024-05-01", "2024-01-01", "bad")])
+    found = []
+    tree.overlapping("2024-03-01", "2024-03-01", found)
+    assert found == ["bad"]
+
+
+def test_inverted_allocation_row_is_queryable():
+    index = AllocationIndex()
+    index.apply([
+        allocation("BAD", "2024-05-01", "2024-01-01"),
+        allocation("OK", "2024-06-01", "2024-06-30"),
+    ], [])
+    assert [a["Id"] for a in index.for_vehicle("V1", "2024-03-01")] == ["BAD"]
+    assert [a["Id"] for a in index.for_vehicle("V1", "2024-06-15")] == ["OK"]
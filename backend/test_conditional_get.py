@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Conditional GET - content-hash and data-version ETags, 304s, and responses left alone
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from fastapi.testclient import TestClient
+
+from conditional_get import ConditionalGetMiddleware, check_validators
+
+state = {"payload": {"vehicles": ["V1"]}, "version": 1, "runs": 0}
+
+app = FastAPI()
+app.add_middleware(ConditionalGetMiddleware)
+
+
+@app.get("/api/hashed")
+def hashed():
+    return state["payload"]
+
+
+@app.get("/api/versioned")
+def versioned(request: Request):
+    check_validators(request, state["version"], 1700000000.0)
+    state["runs"] += 1
+    return {"version": state["version"]}
+
+
+@app.get("/api/stream")
+def stream():
+    return StreamingResponse(iter([b"a,b\n"]), media_type="text/csv")
+
+
+@app.get("/api/broken")
+def broken():
+    raise HTTPException(status_code=502, detail="upstream error")
+
+
+client = TestClient(app)
+
+
+def test_content_hash_etag_and_304():
+    first = client.get("/api/hashed")
+    etag = first.headers["etag"]
+    assert first.status_code == 200 and etag.startswith('W/"')
+    assert first.headers["cache-control"] == "no-cache"
+
+    again = client.get("/api/hashed", headers={"If-None-Match": etag})
+    assert again.status_code == 304 and again.content == b""
+    assert again.headers["etag"] == etag
+
+    state["payload"] = {"vehicles": ["V1", "V2"]}
+    changed = client.get("/api/hashed", headers={"If-None-Match": etag})
+    assert changed.status_code == 200 and changed.headers["etag"] != etag
+
+
+def test_data_version_304_skips_the_handler():
+    first = client.get("/api/versioned")
+    etag = first.headers["etag"]
+    assert first.headers["last-modified"]
+    runs = state["runs"]
+
+    # Strong form of the weak tag and a list of tags both match
+    for tag in (etag, etag[2:], f'"other", {etag}'):
+        assert client.get("/api/versioned", headers={"If-None-Match": tag}).status_code == 304
+    assert state["runs"] == runs
+
+    since = client.get("/api/versioned", headers={"If-Modified-Since": first.headers["last-modified"]})
+    assert since.status_code == 304
+
+    state["version"] += 1
+    assert client.get("/api/versioned", headers={"If-None-Match": etag}).status_code == 200
+
+
+def test_errors_and_streams_get_no_etag():
+    assert "etag" not in client.get("/api/broken").headers
+    stream = client.get("/api/stream")
+    assert stream.text == "a,b\n" and "etag" not in stream.headers
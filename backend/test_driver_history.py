@@ -51,17 +51,24 @@ def test_driver_history():
         # Test the lookup endpoint logic
         print("\n🚀 Testing lookup endpoint logic...")
         
-        # This mimics what the lookup_vehicle_by_van endpoint does
-        from routes.vehicles import get_driver_history
+        # The lookup endpoints read the cached timeline (see driver_history.py)
+        from driver_history import build_timeline, format_timeline, get_driver_timelines
+        from vehicle_replica import get_replica
         
         vehicle_id = vehicle.get('Id')
-        history = get_driver_history(sf, vehicle_id)
-        
-        print(f"\n✅ Driver history retrieval result:")
-        if history and history != "No driver history available":
-            print(f"   ✅ SUCCESS: {history[:150]}...")
+        timelines = get_driver_timelines()
+        timelines.attach(get_replica())
+        timeline = timelines.for_vehicle(vehicle_id)
+        if timeline is None:
+            # Not in the local replica yet - build it from the record and its allocations
+            timeline = build_timeline(driver_history, sf.get_vehicle_allocations(test_van))
+        
+        print(f"\n✅ Driver timeline result:")
+        if timeline:
+            print(f"   ✅ SUCCESS: {len(timeline)} entries")
+            print("   " + format_timeline(timeline)[:300].replace("\n", "\n   "))
         else:
-            print(f"   ⚠️  EMPTY: {history}")
+            print(f"   ⚠️  EMPTY timeline")
             print(f"   (This is OK if Previous_Drivers__c is empty in Salesforce)")
         
         # Test Grok AI (if API key available)
@@ -87,6 +94,12 @@ def test_driver_history():
             analysis = get_grok_analysis(test_text, "vehicle")
             print(f"\n🤖 Grok Analysis Result:")
             print(f"   {analysis}")
+            
+            if timeline:
+                print(f"\n📝 Testing driver history analysis with the cached timeline")
+                analysis = get_grok_analysis(timeline, "driver_history")
+                print(f"\n🤖 Grok Driver History Result:")
+                print(f"   {analysis}")
         else:
             if not groq_available:
                 print("\n⚠️  Groq library not installed")
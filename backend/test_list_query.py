@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+List query - cursor encoding, SOQL keyset clauses and in-memory keyset pagination
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+from fastapi import HTTPException
+
+from list_query import ListQuery, decode_cursor, encode_cursor
+
+SORT_FIELDS = {"van_number": "Van_Number__c", "status": "Status__c", "next_service": "Next_Service_Date__c"}
+
+
+def vehicle(record_id, van, status, next_service):
+    return {"Id": record_id, "Van_Number__c": van, "Status__c": status, "Next_Service_Date__c": next_service}
+
+
+# Duplicates, mixed case and nulls in every sort field
+VEHICLES = [
+    vehicle("a05", "105", "Spare", "2024-03-01"),
+    vehicle("a01", "101", "allocated", None),
+    vehicle("a03", None, "Allocated", "2024-01-15"),
+    vehicle("a02", "102", None, "2024-03-01"),
+    vehicle("a04", "104", "SPARE", None),
+    vehicle("a06", "103", "Spare", "2024-02-10"),
+    vehicle("a07", None, "Allocated", "2024-01-15"),
+]
+
+
+def test_cursor_round_trip():
+    for value in ("VEH-001", None, "2024-01-15", "O'Brien"):
+        cursor = encode_cursor(value, "a01")
+        assert "=" not in cursor
+        assert decode_cursor(cursor) == (value, "a01")
+
+
+def test_bad_cursor_is_a_400():
+    with pytest.raises(HTTPException) as error:
+        decode_cursor("not a cursor")
+    assert error.value.status_code == 400
+
+
+@pytest.mark.parametrize("sort", SORT_FIELDS)
+@pytest.mark.parametrize("order", ["asc", "desc"])
+@pytest.mark.parametrize("limit", [1, 2, 3, 7])
+def test_pages_add_up_to_the_unpaged_list(sort, order, limit):
+    everything, cursor = ListQuery.from_params(sort, order, None, None, SORT_FIELDS).apply(VEHICLES)
+    assert cursor is None and len(everything) == len(VEHICLES)
+
+    paged, cursor = [], None
+    while True:
+        page, cursor = ListQuery.from_params(sort, order, limit, cursor, SORT_FIELDS).apply(VEHICLES)
+        assert len(page) <= limit
+        paged += page
+        if cursor is None:
+            break
+    assert [r["Id"] for r in paged] == [r["Id"] for r in everything]
+
+
+def test_nulls_follow_soql_order():
+    asc, _ = ListQuery.from_params("van_number", "asc", None, None, SORT_FIELDS).apply(VEHICLES)
+    desc, _ = ListQuery.from_params("van_number", "desc", None, None, SORT_FIELDS).apply(VEHICLES)
+    assert [r["Id"] for r in asc[:2]] == ["a03", "a07"]
+    assert [r["Id"] for r in desc[-2:]] == ["a07", "a03"]
+
+
+def test_filters_ignore_case():
+    query = ListQuery.from_params("van_number", "asc", None, None, SORT_FIELDS, status="spare, Allocated")
+    page, _ = query.apply(VEHICLES)
+    assert [r["Id"] for r in page] == ["a03", "a07", "a01", "a06", "a04", "a05"]
+
+
+def test_soql_clauses():
+    cursor = encode_cursor("2024-01-15", "a03")
+    query = ListQuery.from_params("next_service", "asc", 2, cursor, SORT_FIELDS, status="Spare,Allocated")
+    assert query.soql_conditions() == [
+        "Status__c IN ('Spare', 'Allocated')",
+        "(Next_Service_Date__c > 2024-01-15 OR (Next_Service_Date__c = 2024-01-15 AND Id > 'a03'))",
+    ]
+    assert query.soql_order_limit() == "ORDER BY Next_Service_Date__c ASC, Id ASC LIMIT 3"
+    assert query.soql_order_limit(probe=False).endswith("LIMIT 2")
+
+    desc = ListQuery.from_params("van_number", "desc", 2, encode_cursor(None, "a07"), SORT_FIELDS)
+    assert desc.soql_conditions() == ["(Van_Number__c = null AND Id < 'a07')"]
+
+
+def test_finish_page_trims_the_probe_row():
+    query = ListQuery.from_params("van_number", "asc", 2, None, SORT_FIELDS)
+    rows, cursor = query.finish_page(VEHICLES[:3])
+    assert [r["Id"] for r in rows] == ["a05", "a01"]
+    assert decode_cursor(cursor) == ("101", "a01")
+    assert query.finish_page(VEHICLES[:2]) == (VEHICLES[:2], None)
+
+
+def test_invalid_params_are_400s():
+    for args in (("colour", "asc", None), ("status", "up", None), ("status", "asc", 0)):
+        with pytest.raises(HTTPException) as error:
+            ListQuery.from_params(*args, None, SORT_FIELDS)
+        assert error.value.status_code == 400
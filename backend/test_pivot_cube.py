@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+"""
+Pivot cube roll-ups - case-insensitive filters and the bounded roll-up memo
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from pivot_cube import ROLLUP_MEMO_SIZE, PivotCube
+
+
+def vehicle(status, trade_group):
+    return {"Status__c": status, "Trade_Group__c": trade_group}
+
+
+CUBE_VEHICLES = [
+    vehicle("Spare", "Plumbing"),
+    vehicle("Allocated", "plumbing"),
+    vehicle("Allocated", "Plumbing"),
+    vehicle("Spare", "Drainage"),
+]
+
+
+def test_rollup_groups_and_orders_by_count():
+    cube = PivotCube.from_records(CUBE_VEHICLES)
+    assert cube.rollup(["status"]) == [
+        {"status": "Allocated", "count": 2},
+        {"status": "Spare", "count": 2},
+    ]
+
+
+def test_filters_ignore_case_like_list_query():
+    cube = PivotCube.from_records(CUBE_VEHICLES)
+    rows = cube.rollup(["status"], {"trade_group": ["PLUMBING"]})
+    assert rows == [{"status": "Allocated", "count": 2}, {"status": "Spare", "count": 1}]
+    # Same folded filter -> same memoized roll-up
+    assert cube.rollup(["status"], {"trade_group": ["plumbing"]}) is rows
+
+
+def test_rollup_memo_is_bounded():
+    cube = PivotCube.from_records(CUBE_VEHICLES)
+    for i in range(ROLLUP_MEMO_SIZE * 3):
+        cube.rollup(["status"], {"trade_group": [f"group-{i}"]})
+    assert len(cube._rollups) == ROLLUP_MEMO_SIZE
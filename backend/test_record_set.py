@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+"""
+RecordSet / RecordSetBuilder - raw Salesforce pages into columns and tuples
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from record_set import RecordSet, RecordSetBuilder
+
+ATTRIBUTES = {"type": "Vehicle__c", "url": "/services/data/v59.0/sobjects/Vehicle__c/a01"}
+
+
+def test_relationships_flatten_into_dotted_columns():
+    records = RecordSet.from_records([
+        {"attributes": ATTRIBUTES, "Id": "A1", "Vehicle__r": None},
+        {"attributes": ATTRIBUTES, "Id": "A2", "Vehicle__r": {"attributes": ATTRIBUTES, "Name": "Van 2"}},
+    ])
+    assert records.columns == ("Id", "Vehicle__r.Name")
+    assert records.to_dicts() == [
+        {"Id": "A1", "Vehicle__r.Name": None},
+        {"Id": "A2", "Vehicle__r.Name": "Van 2"},
+    ]
+
+
+def test_record_with_only_attributes_is_an_empty_row():
+    builder = RecordSetBuilder()
+    builder.add([{"attributes": ATTRIBUTES}])
+    builder.add([{"attributes": ATTRIBUTES, "Id": "A1", "Name": "Van 1"}])
+    records = builder.build()
+    assert len(records) == 2
+    assert records.to_dicts() == [{"Id": None, "Name": None}, {"Id": "A1", "Name": "Van 1"}]
+
+
+def test_project_renames_and_fills_missing_columns():
+    records = RecordSet.from_records([{"Id": "A1", "Name": "Van 1"}])
+    projected = records.project({"id": "Id", "reg": "Reg_No__c"})
+    assert projected.to_dicts() == [{"id": "A1", "reg": None}]
+    assert projected.to_json() == '[{"id": "A1", "reg": null}]'
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Vehicle search index - normalized prefix and trigram substring matching, and the daily driver roll-over
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from datetime import date, timedelta
+
+from search_index import VehicleSearchIndex, normalize
+
+
+class FakeReplica:
+    def __init__(self, vehicles, allocations):
+        self._records = {"Vehicle__c": vehicles, "Vehicle_Allocation__c": allocations}
+
+    def add_listener(self, fn):
+        pass
+
+    def records(self, object_name):
+        return self._records[object_name]
+
+
+def vehicle(vehicle_id, van, reg, name=None):
+    return {"Id": vehicle_id, "Van_Number__c": van, "Reg_No__c": reg, "Name": name or f"Van {van}"}
+
+
+def allocation(allocation_id, vehicle_id, engineer, start, end=None):
+    return {
+        "Id": allocation_id,
+        "Vehicle__c": vehicle_id,
+        "Internal_Staff__r": {"Name": engineer},
+        "Start_date__c": start,
+        "End_date__c": end,
+    }
+
+
+def days(n):
+    return (date.today() + timedelta(days=n)).isoformat()
+
+
+def build(allocations=()):
+    index = VehicleSearchIndex()
+    index.attach(FakeReplica(
+        [vehicle("V1", "101", "AB12 CDO"), vehicle("V2", "1010", "XY99 ZZZ"), vehicle("V3", "202", "LM55 OPQ")],
+        list(allocations),
+    ))
+    return index
+
+
+def ids(result):
+    return [row["id"] for row in result[1]]
+
+
+def test_normalize_folds_spaces_case_and_confusables():
+    assert normalize("ab12 cdo") == normalize("AB12CD0") == normalize("ab-12-cd0") == "AB12CD0"
+
+
+def test_prefix_ranks_exact_first():
+    index = build()
+    total, rows = index.search("101")
+    assert total == 2
+    assert [row["id"] for row in rows] == ["V1", "V2"]
+    assert rows[0]["matched"] == "van_number"
+
+
+def test_trigram_substring_match():
+    index = build()
+    assert ids(index.search("2cd0")) == ["V1"]
+    assert ids(index.search("99 zz")) == ["V2"]
+    assert index.search("QQQ") == (0, [])
+
+
+def test_driver_terms_follow_the_date():
+    index = build([
+        allocation("A1", "V3", "John Smith", days(-10), days(-1)),
+        allocation("A2", "V3", "Jane Doe", days(-1), days(1)),
+    ])
+    assert ids(index.search("doe")) == ["V3"]
+    assert index.search("smith") == (0, [])
+
+    # Next day on: A2 has ended, so Jane is no longer found
+    index._indexed_on = days(-2)
+    index._open_allocations["V3"]["A2"] = (days(-1), days(-1), "Jane Doe")
+    assert index.search("doe") == (0, [])
+    assert "V3" not in index._open_allocations
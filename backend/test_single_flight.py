@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Single-flight coalescing - one upstream call per key, shared results and shared errors
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import asyncio
+import threading
+import time
+
+import pytest
+
+from single_flight import AsyncSingleFlight, SingleFlight, copy_records
+
+
+def run_threads(n, target):
+    threads = [threading.Thread(target=target) for _ in range(n)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+
+def test_sync_callers_share_one_call_and_get_copies():
+    flight, calls, results = SingleFlight(), [], []
+
+    def fetch():
+        calls.append(1)
+        time.sleep(0.2)
+        return [{"Id": "V1"}]
+
+    run_threads(5, lambda: results.append(flight.do("q", fetch, copy_records)))
+    assert len(calls) == 1
+    assert all(r == [{"Id": "V1"}] for r in results)
+    assert len({id(r[0]) for r in results}) == 5
+
+
+def test_sync_error_reaches_every_caller_and_is_not_kept():
+    flight, calls, errors = SingleFlight(), [], []
+
+    def fail():
+        calls.append(1)
+        time.sleep(0.2)
+        raise RuntimeError("upstream down")
+
+    def caller():
+        try:
+            flight.do("q", fail)
+        except RuntimeError as e:
+            errors.append(str(e))
+
+    run_threads(4, caller)
+    assert len(calls) == 1
+    assert errors == ["upstream down"] * 4
+    # The failed call is forgotten: the next caller goes upstream again
+    assert flight.do("q", lambda: "ok") == "ok"
+
+
+def test_async_error_reaches_every_caller_and_is_not_kept():
+    flight, calls = AsyncSingleFlight(), []
+
+    async def fail():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        raise RuntimeError("upstream down")
+
+    async def ok():
+        return "ok"
+
+    async def main():
+        results = await asyncio.gather(*(flight.do("q", fail) for _ in range(4)), return_exceptions=True)
+        assert len(calls) == 1
+        assert all(isinstance(r, RuntimeError) and str(r) == "upstream down" for r in results)
+        assert await flight.do("q", ok) == "ok"
+
+    asyncio.run(main())
+
+
+def test_async_cancelled_caller_does_not_cancel_the_rest():
+    flight = AsyncSingleFlight()
+
+    async def slow():
+        await asyncio.sleep(0.05)
+        return [{"Id": "V1"}]
+
+    async def main():
+        first = asyncio.ensure_future(flight.do("q", slow, copy_records))
+        second = asyncio.ensure_future(flight.do("q", slow, copy_records))
+        await asyncio.sleep(0)
+        first.cancel()
+        assert await second == [{"Id": "V1"}]
+        with pytest.raises(asyncio.CancelledError):
+            await first
+
+    asyncio.run(main())
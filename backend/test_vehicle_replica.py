@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Vehicle replica - full load, incremental sync past the watermark, deletions and change events
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import re
+
+from vehicle_replica import REPLICATED_OBJECTS, VehicleReplica
+
+
+class FakeSalesforce:
+    """Just what the replica calls: existing_fields, iter_soql_pages and _call(getDeleted)"""
+
+    mock_mode = False
+
+    def __init__(self):
+        self.rows = {name: {} for name in REPLICATED_OBJECTS}
+        self.deleted = {name: [] for name in REPLICATED_OBJECTS}
+        self.queries = []
+
+    def existing_fields(self, object_name, fields):
+        return fields
+
+    def iter_soql_pages(self, query):
+        self.queries.append(query)
+        object_name = re.search(r"FROM (\w+)", query).group(1)
+        since = re.search(r"SystemModstamp >= (\S+)Z", query)
+        rows = sorted(self.rows[object_name].values(), key=lambda r: r["SystemModstamp"])
+        if since:
+            rows = [r for r in rows if r["SystemModstamp"][:19] >= since.group(1)]
+        yield [dict(r) for r in rows]
+
+    def _call(self, fn):
+        sf = self
+
+        class Client:
+            def __getattr__(self, object_name):
+                class SObject:
+                    def deleted(self, start, end):
+                        return {"deletedRecords": [{"id": i} for i in sf.deleted[object_name]]}
+                return SObject()
+
+        return fn(Client())
+
+    def put(self, record_id, status, modstamp):
+        self.rows["Vehicle__c"][record_id] = {
+            "Id": record_id, "Status__c": status, "SystemModstamp": f"2024-01-15T{modstamp}.000+0000",
+        }
+
+
+def make_replica():
+    sf = FakeSalesforce()
+    replica = VehicleReplica(":memory:", sf)
+    events = []
+    replica.add_listener(lambda name, upserted, deleted: events.append(
+        (name, sorted(r["Id"] for r in upserted), sorted(deleted))
+    ))
+    return sf, replica, events
+
+
+def test_first_sync_is_a_full_load():
+    sf, replica, events = make_replica()
+    sf.put("V1", "Spare", "10:00:00")
+    sf.put("V2", "Allocated", "10:05:00")
+    assert replica.sync()["Vehicle__c"] == 2
+    assert "WHERE" not in sf.queries[0]
+    assert events == [("Vehicle__c", ["V1", "V2"], [])]
+    assert replica.get("Vehicle__c", "V2")["Status__c"] == "Allocated"
+    assert replica.sync_lag_seconds() is not None
+
+
+def test_incremental_sync_reports_only_real_changes():
+    sf, replica, events = make_replica()
+    sf.put("V1", "Spare", "10:00:00")
+    sf.put("V2", "Allocated", "10:05:00")
+    replica.sync()
+    version = replica.version
+    events.clear()
+
+    # Nothing changed: the >= watermark window re-reads V2 but it is not reported
+    assert replica.sync()["Vehicle__c"] == 0
+    assert "SystemModstamp >= 2024-01-15T10:05:00Z" in [q for q in sf.queries if "FROM Vehicle__c " in q][-1]
+    assert events == [] and replica.version == version
+
+    sf.put("V1", "Off Road", "11:00:00")
+    sf.put("V3", "Spare", "11:30:00")
+    assert replica.sync()["Vehicle__c"] == 2
+    assert events == [("Vehicle__c", ["V1", "V3"], [])]
+    assert replica.get("Vehicle__c", "V1")["Status__c"] == "Off Road"
+    assert replica.version == version + 1
+
+
+def test_deletions_come_from_get_deleted():
+    sf, replica, events = make_replica()
+    sf.put("V1", "Spare", "10:00:00")
+    sf.put("V2", "Spare", "10:05:00")
+    replica.sync()
+    events.clear()
+
+    del sf.rows["Vehicle__c"]["V1"]
+    sf.deleted["Vehicle__c"] = ["V1", "V9"]  # V9 was never replicated
+    assert replica.sync()["Vehicle__c"] == 1
+    assert events == [("Vehicle__c", [], ["V1"])]
+    assert [r["Id"] for r in replica.records("Vehicle__c")] == ["V2"]
@@ -0,0 +1,155 @@
+"""
+Local append-only time series of the dashboard counters (status buckets, MOT/tax due).
+
+Salesforce only knows current counts, so the dashboard records a compact sample
+every TREND_SAMPLE_INTERVAL seconds into SQLite. Each sample also folds into
+hourly and daily roll-ups (sum/count/min/max per bucket), so a range query reads
+the coarsest tier that still gives the requested resolution. A 90-day or
+multi-year chart scans a few hundred roll-up rows, not every raw sample.
+"""
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+# Roll-up resolutions in seconds, finest first (raw samples are resolution 0)
+ROLLUP_RESOLUTIONS = [3600, 86400]
+
+
+class TrendStore:
+    """
+    metric -> (timestamp, value) samples plus their hourly/daily roll-ups
+    """
+
+    def __init__(self, db_path: str = None, sample_interval: int = None):
+        self.db_path = db_path or os.getenv("TREND_DB_PATH") or os.path.join(
+            os.path.dirname(os.path.abspath(__file__)), "data", "fleet_trends.db"
+        )
+        if self.db_path != ":memory:":
+            os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        self.sample_interval = sample_interval or int(os.getenv("TREND_SAMPLE_INTERVAL", "300"))
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS samples (
+                metric TEXT NOT NULL,
+                ts INTEGER NOT NULL,
+                value REAL NOT NULL,
+                PRIMARY KEY (metric, ts)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS rollups (
+                resolution INTEGER NOT NULL,
+                metric TEXT NOT NULL,
+                bucket INTEGER NOT NULL,
+                total REAL NOT NULL,
+                n INTEGER NOT NULL,
+                min REAL NOT NULL,
+                max REAL NOT NULL,
+                PRIMARY KEY (resolution, metric, bucket)
+            ) WITHOUT ROWID;
+        """)
+        self._db.commit()
+        row = self._db.execute("SELECT MAX(ts) FROM samples").fetchone()
+        self.last_sample_at: Optional[int] = row[0]
+
+    def record(self, values: Dict[str, float], ts: float = None, force: bool = False) -> bool:
+        """
+        Append one sample per metric, at most once per sample_interval (force=True ignores that).
+        Returns True if the sample was stored.
+        """
+        ts = int(ts if ts is not None else time.time())
+        with self._lock:
+            if not force and self.last_sample_at is not None and ts - self.last_sample_at < self.sample_interval:
+                return False
+            values = {metric: float(value) for metric, value in values.items() if value is not None}
+            self._db.executemany(
+                "INSERT OR REPLACE INTO samples (metric, ts, value) VALUES (?, ?, ?)",
+                [(metric, ts, value) for metric, value in values.items()],
+            )
+            for resolution in ROLLUP_RESOLUTIONS:
+                self._db.executemany(
+                    """
+                    INSERT INTO rollups (resolution, metric, bucket, total, n, min, max)
+                    VALUES (?, ?, ?, ?, 1, ?, ?)
+                    ON CONFLICT (resolution, metric, bucket) DO UPDATE SET
+                        total = total + excluded.total,
+                        n = n + 1,
+                        min = MIN(min, excluded.min),
+                        max = MAX(max, excluded.max)
+                    """,
+                    [(resolution, metric, ts - ts % resolution, value, value, value) for metric, value in values.items()],
+                )
+            self._db.commit()
+            self.last_sample_at = ts
+        return True
+
+    def series(self, metrics: List[str], start: float, end: float, points: int = 200) -> dict:
+        """
+        Downsampled series for [start, end): at most ~`points` buckets per metric, each
+        {time, avg, min, max}. Reads raw samples only when the step is finer than an hour.
+        """
+        start, end = int(start), int(end)
+        step = max(1, (end - start) // max(1, points))
+        resolution = 0
+        for candidate in ROLLUP_RESOLUTIONS:
+            if candidate <= step:
+                resolution = candidate
+        if resolution:
+            # Whole roll-up buckets only, so every output bucket covers complete hours/days
+            step = step - step % resolution
+        marks = ", ".join("?" for _ in metrics)
+
+        if resolution:
+            query = f"""
+                SELECT metric, bucket - bucket % ? AS b, SUM(total) / SUM(n), MIN(min), MAX(max)
+                FROM rollups
+                WHERE resolution = ? AND metric IN ({marks}) AND bucket >= ? AND bucket < ?
+                GROUP BY metric, b ORDER BY metric, b
+            """
+            params = [step, resolution, *metrics, start - start % resolution, end]
+        else:
+            query = f"""
+                SELECT metric, ts - ts % ? AS b, AVG(value), MIN(value), MAX(value)
+                FROM samples
+                WHERE metric IN ({marks}) AND ts >= ? AND ts < ?
+                GROUP BY metric, b ORDER BY metric, b
+            """
+            params = [step, *metrics, start, end]
+
+        with self._lock:
+            rows = self._db.execute(query, params).fetchall()
+
+        series = {metric: [] for metric in metrics}
+        for metric, bucket, avg, low, high in rows:
+            series[metric].append({
+                "time": datetime.fromtimestamp(bucket, timezone.utc).isoformat(),
+                "avg": round(avg, 2),
+                "min": low,
+                "max": high,
+            })
+        return {"resolution_seconds": step, "series": series}
+
+    def status(self) -> dict:
+        with self._lock:
+            count = self._db.execute("SELECT COUNT(*) FROM samples").fetchone()[0]
+        return {
+            "sample_interval_seconds": self.sample_interval,
+            "last_sample_at": self.last_sample_at,
+            "samples": count,
+        }
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_trend_store() -> TrendStore:
+    """Return the process-wide trend store"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = TrendStore()
+    return _store
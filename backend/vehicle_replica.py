@@ -0,0 +1,335 @@
+"""
+Local SQLite replica of the fleet objects (Vehicle__c, Vehicle_Allocation__c, Vehicle_Cost__c).
+
+A background thread keeps it in sync incrementally: changed rows are pulled with
+SystemModstamp >= watermark and deletions come from getDeleted. Read paths can
+answer from the replica in milliseconds and check sync_lag_seconds() to decide
+whether it is fresh enough.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, List, Optional
+
+from salesforce_service import SalesforceService
+from api_usage import get_api_usage
+
+# Fields mirrored per object. Fields missing from the org are dropped at sync time.
+REPLICATED_OBJECTS = {
+    "Vehicle__c": [
+        "Id", "Name", "Reg_No__c", "Van_Number__c", "Status__c",
+        "Trade_Group__c", "Vehicle_Type__c", "Vehicle_Ownership__c",
+        "Service_Territory__c", "Make_Model__c", "Description__c",
+        "Tracking_Number__c", "Previous_Drivers__c",
+        "Lease_Start_Date__c", "Owned_Start_Date__c",
+        "Last_Service_Date__c", "Next_Service_Date__c",
+        "Last_MOT_Date__c", "Next_MOT_Date__c",
+        "Last_Tax_Date__c", "Next_Tax_Date__c",
+        "MOT_Due_Date__c", "Tax_Due_Date__c",
+        "Jetter__c", "Last_Jetter_Service__c", "Next_Jetter_Service__c",
+        "CreatedDate", "SystemModstamp",
+    ],
+    "Vehicle_Allocation__c": [
+        "Id", "Vehicle__c", "Vehicle__r.Name", "Vehicle__r.Reg_No__c", "Vehicle__r.Van_Number__c",
+        "Service_Resource__c", "Service_Resource__r.Name", "Internal_Staff__r.Name",
+        "Start_date__c", "End_date__c", "Reserved_For__c", "SystemModstamp",
+    ],
+    "Vehicle_Cost__c": [
+        "Id", "Vehicle__c", "Vehicle__r.Name", "Vehicle__r.Reg_No__c",
+        "Type__c", "Payment_value__c", "Date__c", "Description__c", "SystemModstamp",
+    ],
+}
+
+# getDeleted only covers the recycle bin window - older watermarks need a full reload
+DELETED_WINDOW_DAYS = 14
+
+
+def _soql_datetime(value: str) -> str:
+    """Salesforce timestamp ('2024-01-15T10:20:30.000+0000') -> SOQL literal truncated to the second"""
+    parsed = datetime.strptime(value[:19], "%Y-%m-%dT%H:%M:%S")
+    return parsed.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+class VehicleReplica:
+    """
+    Embedded store mirroring the fleet objects, refreshed incrementally from Salesforce
+    """
+
+    def __init__(self, db_path: str = None, sf: SalesforceService = None):
+        self.db_path = db_path or os.getenv("REPLICA_DB_PATH") or os.path.join(
+            os.path.dirname(os.path.abspath(__file__)), "data", "fleet_replica.db"
+        )
+        if self.db_path != ":memory:":
+            os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        self.sf = sf or SalesforceService()
+        self._lock = threading.RLock()  # guards every use of self._db (see _state)
+        self._db = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS records (
+                object TEXT NOT NULL,
+                id TEXT NOT NULL,
+                modstamp TEXT,
+                data TEXT NOT NULL,
+                PRIMARY KEY (object, id)
+            );
+            CREATE TABLE IF NOT EXISTS sync_state (
+                object TEXT PRIMARY KEY,
+                watermark TEXT,
+                last_synced_at REAL
+            );
+        """)
+        self._db.commit()
+        self._listeners: List[Callable] = []
+        self._thread = None
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self.interval = int(os.getenv("REPLICA_SYNC_INTERVAL", "60"))
+        self.version = 0  # bumped whenever a sync changes any row
+        self.changed_at = time.time()  # when version was last bumped (process start for the loaded rows)
+        self.last_error = None
+
+    # ========================================
+    # CHANGE NOTIFICATION
+    # ========================================
+
+    def add_listener(self, fn: Callable):
+        """
+        Register fn(object_name, upserted_records, deleted_ids) - called after every
+        sync that changed rows. A full reload reports every row as upserted.
+        """
+        self._listeners.append(fn)
+
+    def _notify(self, object_name: str, upserted: list, deleted: list):
+        for fn in self._listeners:
+            try:
+                fn(object_name, upserted, deleted)
+            except Exception as e:
+                print(f"⚠️ Replica listener {getattr(fn, '__name__', fn)} failed: {e}")
+
+    # ========================================
+    # SYNC
+    # ========================================
+
+    def _select_fields(self, object_name: str) -> List[str]:
+        """Configured fields for object_name, minus any this org doesn't have (describe is cached)"""
+        return self.sf.existing_fields(object_name, REPLICATED_OBJECTS[object_name])
+
+    # The one connection is shared by the sync thread and request handlers - every
+    # statement on it, read or write, runs under self._lock (an RLock, so the sync's
+    # nested reads inside its write block are fine)
+
+    def _state(self, object_name: str):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT watermark, last_synced_at FROM sync_state WHERE object = ?", (object_name,)
+            ).fetchone()
+        return row if row else (None, None)
+
+    def _modstamp(self, object_name: str, record_id: str) -> Optional[str]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT modstamp FROM records WHERE object = ? AND id = ?", (object_name, record_id)
+            ).fetchone()
+        return row[0] if row else None
+
+    def _has_record(self, object_name: str, record_id: str) -> bool:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT 1 FROM records WHERE object = ? AND id = ?", (object_name, record_id)
+            ).fetchone()
+        return row is not None
+
+    def _fetch_deleted_ids(self, object_name: str, since: float) -> Optional[List[str]]:
+        """Ids deleted since the epoch time `since`, or None when that is too old for getDeleted"""
+        end = datetime.now(timezone.utc)
+        # Overlap by a minute (getDeleted also needs at least a one minute window)
+        start = datetime.fromtimestamp(since, timezone.utc) - timedelta(minutes=1)
+        if end - start > timedelta(days=DELETED_WINDOW_DAYS):
+            return None
+        try:
+            result = self.sf._call(lambda client: getattr(client, object_name).deleted(start, end))
+        except Exception as e:
+            print(f"⚠️ getDeleted failed for {object_name}: {e}")
+            return None
+        return [r["id"] for r in result.get("deletedRecords", [])]
+
+    def _sync_object(self, object_name: str) -> int:
+        """Pull changes for one object; returns the number of rows changed"""
+        fields = self._select_fields(object_name)
+        watermark, last_synced_at = self._state(object_name)
+        started_at = time.time()
+
+        deleted_ids = []
+        full_reload = watermark is None or last_synced_at is None
+        if not full_reload:
+            fetched = self._fetch_deleted_ids(object_name, last_synced_at)
+            if fetched is None:
+                full_reload = True
+            else:
+                deleted_ids = fetched
+
+        query = f"SELECT {', '.join(fields)} FROM {object_name}"
+        if not full_reload:
+            query += f" WHERE SystemModstamp >= {_soql_datetime(watermark)}"
+        query += " ORDER BY SystemModstamp ASC"
+
+        upserted = []
+        new_watermark = watermark
+        for page in self.sf.iter_soql_pages(query):
+            for record in page:
+                upserted.append(record)
+                if record.get("SystemModstamp") and (new_watermark is None or record["SystemModstamp"] > new_watermark):
+                    new_watermark = record["SystemModstamp"]
+
+        with self._lock:
+            if not full_reload:
+                # The >= watermark window re-reads rows we already hold - keep only real changes
+                upserted = [r for r in upserted if self._modstamp(object_name, r["Id"]) != r.get("SystemModstamp")]
+                deleted_ids = [rid for rid in deleted_ids if self._has_record(object_name, rid)]
+            else:
+                seen = {r["Id"] for r in upserted}
+                existing = [row[0] for row in self._db.execute(
+                    "SELECT id FROM records WHERE object = ?", (object_name,)
+                )]
+                deleted_ids = [rid for rid in existing if rid not in seen]
+            if deleted_ids:
+                self._db.executemany(
+                    "DELETE FROM records WHERE object = ? AND id = ?",
+                    [(object_name, rid) for rid in deleted_ids],
+                )
+            self._db.executemany(
+                "INSERT OR REPLACE INTO records (object, id, modstamp, data) VALUES (?, ?, ?, ?)",
+                [(object_name, r["Id"], r.get("SystemModstamp"), json.dumps(r)) for r in upserted],
+            )
+            self._db.execute(
+                "INSERT OR REPLACE INTO sync_state (object, watermark, last_synced_at) VALUES (?, ?, ?)",
+                (object_name, new_watermark, started_at),
+            )
+            self._db.commit()
+            if upserted or deleted_ids:
+                self.version += 1
+                self.changed_at = time.time()
+
+        if upserted or deleted_ids:
+            self._notify(object_name, upserted, deleted_ids)
+        return len(upserted) + len(deleted_ids)
+
+    def sync(self) -> Dict[str, int]:
+        """Sync every replicated object; returns changed-row counts per object"""
+        if self.sf.mock_mode:
+            return {}
+        changes = {}
+        self.last_error = None
+        for object_name in REPLICATED_OBJECTS:
+            try:
+                changes[object_name] = self._sync_object(object_name)
+            except Exception as e:
+                print(f"❌ Replica sync failed for {object_name}: {e}")
+                self.last_error = str(e)
+        if any(changes.values()):
+            print(f"🔄 Replica synced: {changes}")
+        return changes
+
+    def start(self, interval: int = None):
+        """Start the background sync loop (idempotent)"""
+        if self._thread and self._thread.is_alive():
+            return
+        self.interval = interval or self.interval
+        self._stop.clear()
+
+        def loop():
+            while not self._stop.is_set():
+                self.sync()
+                # Syncs space out as the org nears its daily API limit
+                self._wake.wait(get_api_usage().stretch(self.interval))
+                self._wake.clear()
+
+        self._thread = threading.Thread(target=loop, name="vehicle-replica-sync", daemon=True)
+        self._thread.start()
+        print(f"✅ Vehicle replica sync started (every {self.interval}s) -> {self.db_path}")
+
+    def sync_soon(self):
+        """Wake the background loop early (e.g. right after this app wrote to Salesforce)"""
+        self._wake.set()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    # ========================================
+    # READS
+    # ========================================
+
+    def sync_lag_seconds(self) -> Optional[float]:
+        """Seconds since the least recently synced object was synced (None = never synced)"""
+        with self._lock:
+            rows = self._db.execute("SELECT object, last_synced_at FROM sync_state").fetchall()
+        synced = {obj: ts for obj, ts in rows if ts}
+        if any(obj not in synced for obj in REPLICATED_OBJECTS):
+            return None
+        return max(0.0, time.time() - min(synced.values()))
+
+    def is_fresh(self, max_lag: float = None) -> bool:
+        # Stretched like the sync interval, so slower syncs don't push reads back to Salesforce
+        max_lag = max_lag if max_lag is not None else get_api_usage().stretch(float(os.getenv("REPLICA_MAX_LAG_SECONDS", "300")))
+        lag = self.sync_lag_seconds()
+        return lag is not None and lag <= max_lag
+
+    def records(self, object_name: str) -> List[dict]:
+        """All replicated rows of object_name"""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT data FROM records WHERE object = ?", (object_name,)
+            ).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def get(self, object_name: str, record_id: str) -> Optional[dict]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT data FROM records WHERE object = ? AND id = ?", (object_name, record_id)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def status(self) -> dict:
+        lag = self.sync_lag_seconds()
+        with self._lock:
+            counts = dict(self._db.execute(
+                "SELECT object, COUNT(*) FROM records GROUP BY object"
+            ).fetchall())
+        return {
+            "lag_seconds": round(lag, 1) if lag is not None else None,
+            "version": self.version,
+            "records": counts,
+            "last_error": self.last_error,
+        }
+
+
+_replica = None
+_replica_lock = threading.Lock()
+
+
+def get_replica() -> VehicleReplica:
+    """Return the process-wide replica"""
+    global _replica
+    if _replica is None:
+        with _replica_lock:
+            if _replica is None:
+                _replica = VehicleReplica()
+    return _replica
+
+
+def resolve_source(source: str = "auto", max_lag: float = None) -> Optional[VehicleReplica]:
+    """
+    Decide where a read should come from.
+    'live' -> None (query Salesforce), 'replica' -> the replica if it has synced at least once,
+    'auto' -> the replica only while its lag is within max_lag (REPLICA_MAX_LAG_SECONDS).
+    """
+    if source == "live":
+        return None
+    replica = get_replica()
+    if source == "replica":
+        return replica if replica.sync_lag_seconds() is not None else None
+    return replica if replica.is_fresh(max_lag) else None
@@ -49,6 +49,7 @@ export default function Upload() {
   const navigate = useNavigate();
   const [imageFile, setImageFile] = useState<File | null>(null);
   const [previewUrl, setPreviewUrl] = useState<string>('');
+  const [imageRef, setImageRef] = useState<string>('');
   const [dragActive, setDragActive] = useState(false);
   const fileInputRef = useRef<HTMLInputElement | null>(null);
   const [vanNumber, setVanNumber] = useState('');
@@ -62,6 +63,7 @@ export default function Upload() {
     const file = e.target.files?.[0];
     if (file) {
       setImageFile(file);
+      setImageRef('');
       const reader = new FileReader();
       reader.onloadend = () => {
         setPreviewUrl(reader.result as string);
@@ -81,6 +83,7 @@ export default function Upload() {
     const file = e.dataTransfer.files?.[0];
     if (file) {
       setImageFile(file);
+      setImageRef('');
       const reader = new FileReader();
       reader.onloadend = () => setPreviewUrl(reader.result as string);
       reader.readAsDataURL(file);
@@ -186,6 +189,7 @@ export default function Upload() {
       }
 
       const data = await response.json();
+      if (data.image_ref) setImageRef(data.image_ref);
       return data.details || '';
     } catch (error) {
       console.warn('AI extraction error:', error);
@@ -201,9 +205,25 @@ export default function Upload() {
 
     setUploading(true);
     try {
+      // Photo goes up once as multipart; the asset only carries its blob reference
+      let ref = imageRef;
+      if (!ref && imageFile) {
+        const formData = new FormData();
+        formData.append('image', imageFile);
+        const photoResponse = await fetch('/api/assets/photos', {
+          method: 'POST',
+          body: formData
+        });
+        if (!photoResponse.ok) {
+          throw new Error('Failed to upload photo');
+        }
+        ref = (await photoResponse.json()).image_ref;
+        setImageRef(ref);
+      }
+
       const payload = {
         ...vehicleData,
-        image_data: previewUrl // Store base64 image
+        image_ref: ref
       };
 
       const response = await fetch('/api/assets/create', {
@@ -232,6 +252,7 @@ export default function Upload() {
   const handleClear = () => {
     setImageFile(null);
     setPreviewUrl('');
+    setImageRef('');
     setVanNumber('');
     setVehicleData(null);
   };
@@ -298,6 +319,7 @@ export default function Upload() {
                               ev.stopPropagation();
                               setPreviewUrl('');
                               setImageFile(null);
+                              setImageRef('');
                             }}
                             className="bg-red-500 text-white px-3 py-1 rounded text-sm hover:bg-red-600"
                           >